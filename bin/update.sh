@@ -1,3 +1,2 @@
-(cd lambdas; zip function.zip index.py)
-
-awslocal lambda update-function-code --function-name localstack-lambda-s3-upload --zip-file fileb://lambdas/function.zip
\ No newline at end of file
+# Rebuilds the function package and uploads it only if the code changed
+(cd lambdas; python3 lambda_basic.py update)
@@ -0,0 +1,143 @@
+
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+LOCALSTACK_ENDPOINT = "http://localhost.localstack.cloud:4566"
+
+# Defaults for every client the factory creates. Override them with
+# configure() or with the environment.
+_settings = {
+    'max_pool_connections': int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50")),
+    'connect_timeout': float(os.getenv("AWS_CONNECT_TIMEOUT", "5")),
+    'read_timeout': float(os.getenv("AWS_READ_TIMEOUT", "60")),
+    'max_attempts': int(os.getenv("AWS_MAX_ATTEMPTS", "5")),
+    'retry_mode': os.getenv("AWS_RETRY_MODE", "adaptive"),
+}
+
+_clients = {}
+_resources = {}
+_session = None
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """Change the pool size, timeouts or retries of the shared clients.
+
+    Cached clients and resources are dropped, so the next get_client() or
+    lazy client access builds a new one with these settings. References
+    taken earlier keep the old settings.
+
+    :param settings: Any of max_pool_connections, connect_timeout, read_timeout,
+                     max_attempts and retry_mode.
+    """
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        _settings.update(settings)
+        _clients.clear()
+        _resources.clear()
+
+
+def _config():
+    return Config(
+        max_pool_connections=_settings['max_pool_connections'],
+        connect_timeout=_settings['connect_timeout'],
+        read_timeout=_settings['read_timeout'],
+        retries={'max_attempts': _settings['max_attempts'], 'mode': _settings['retry_mode']},
+    )
+
+
+def _get_session():
+    # boto3's default session isn't safe to create clients from concurrently,
+    # so the factory owns one session and only uses it under the lock.
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def _cache_key(service_name, endpoint_url, region_name):
+    return service_name, endpoint_url, region_name or os.getenv("AWS_DEFAULT_REGION")
+
+
+def get_client(service_name, endpoint_url=LOCALSTACK_ENDPOINT, region_name=None):
+    """Return the shared client for a service, creating it on first use.
+
+    Clients are cached per (service, endpoint, region), so every module that
+    asks for the same client gets the same connection pool.
+
+    :param service_name: Boto3 service name, e.g. 'kinesis'.
+    :param endpoint_url: Service endpoint. None means the real AWS endpoint.
+    :param region_name: Region. None means AWS_DEFAULT_REGION.
+    :return: The Boto3 client.
+    """
+    key = _cache_key(service_name, endpoint_url, region_name)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                logger.debug("Creating %s client for %s", service_name, endpoint_url)
+                client = _get_session().client(service_name, endpoint_url=endpoint_url,
+                                               region_name=key[2], config=_config())
+                _clients[key] = client
+    return client
+
+
+def get_resource(service_name, endpoint_url=LOCALSTACK_ENDPOINT, region_name=None):
+    """Return the shared resource for a service, creating it on first use.
+
+    :param service_name: Boto3 service name, e.g. 's3'.
+    :param endpoint_url: Service endpoint. None means the real AWS endpoint.
+    :param region_name: Region. None means AWS_DEFAULT_REGION.
+    :return: The Boto3 service resource.
+    """
+    key = _cache_key(service_name, endpoint_url, region_name)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                logger.debug("Creating %s resource for %s", service_name, endpoint_url)
+                resource = _get_session().resource(service_name, endpoint_url=endpoint_url,
+                                                   region_name=key[2], config=_config())
+                _resources[key] = resource
+    return resource
+
+
+def clear():
+    """Drop all cached clients and resources, e.g. in tests."""
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+
+
+class _Lazy:
+    """Stands in for a client or resource and creates it on first attribute access."""
+
+    def __init__(self, factory, service_name, endpoint_url, region_name):
+        self._factory = factory
+        self._args = (service_name, endpoint_url, region_name)
+
+    def __getattr__(self, name):
+        return getattr(self._factory(*self._args), name)
+
+    def __repr__(self):
+        return f"<lazy {self._factory.__name__}{self._args}>"
+
+
+def lazy_client(service_name, endpoint_url=LOCALSTACK_ENDPOINT, region_name=None):
+    """Return a placeholder for get_client(...) that is safe to build at import time."""
+    return _Lazy(get_client, service_name, endpoint_url, region_name)
+
+
+def lazy_resource(service_name, endpoint_url=LOCALSTACK_ENDPOINT, region_name=None):
+    """Return a placeholder for get_resource(...) that is safe to build at import time."""
+    return _Lazy(get_resource, service_name, endpoint_url, region_name)
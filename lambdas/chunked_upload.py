@@ -0,0 +1,225 @@
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import time
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+if typing.TYPE_CHECKING:
+    from mypy_boto3_lambda import LambdaClient
+
+logger = logging.getLogger(__name__)
+
+# Function deployed by lambda_basic.py
+FUNCTION_NAME = 'upload-image-to-s3'
+
+# S3 rejects parts smaller than 5 MiB, except the last one
+MIN_PART_BYTES = 5 * 1024 * 1024
+DEFAULT_PART_BYTES = MIN_PART_BYTES
+
+# Status codes after which a part is sent again
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Session values as headers of an invoke event, see lambda_upload_image_to_s3
+_PARAM_HEADERS = {'uploadId': 'x-upload-id', 'key': 'x-upload-key', 'partNumber': 'x-part-number'}
+
+
+class UploadError(Exception):
+    """Raised when a step of a chunked upload fails."""
+
+
+class LambdaInvokeTransport:
+    """Sends upload requests as synchronous invocations of the function.
+
+    A JSON invoke payload is limited to 6 MB, so base64 parts must stay below
+    about 4.4 MiB. That is fine on LocalStack, but S3 needs 5 MiB parts, so
+    use FunctionUrlTransport against AWS.
+    """
+
+    def __init__(self, lambda_client: "LambdaClient", function_name=FUNCTION_NAME):
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def __call__(self, action, params, body=b'', headers=None):
+        event_headers = {'x-upload-action': action, **(headers or {})}
+        for name, value in params.items():
+            event_headers[_PARAM_HEADERS[name]] = str(value)
+        if isinstance(body, bytes):
+            body = base64.b64encode(body).decode('ascii')
+        response = self.lambda_client.invoke(
+            FunctionName=self.function_name,
+            Payload=json.dumps({'headers': event_headers, 'body': body}))
+        result = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            return 500, result
+        status_code = result.get('statusCode', 500)
+        return status_code, json.loads(result['body']) if 'body' in result else result
+
+
+class FunctionUrlTransport:
+    """Sends upload requests to the function URL, with parts as raw binary bodies."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/') + '/'
+        self.timeout = timeout
+
+    def __call__(self, action, params, body=b'', headers=None):
+        query = urllib.parse.urlencode({'action': action, **params})
+        request_headers = dict(headers or {})
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+            request_headers.setdefault('content-type', 'application/json')
+        else:
+            request_headers.setdefault('content-type', 'application/octet-stream')
+        request = urllib.request.Request(f'{self.url}?{query}', data=body, headers=request_headers,
+                                         method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b'{}')
+            except ValueError:
+                return e.code, {'message': e.reason}
+
+
+class ChunkedUploader:
+    """
+    Uploads a large image through the upload-image-to-s3 chunked mode.
+
+    The file is read one part at a time and parts are sent by `concurrency`
+    threads, with at most twice that many parts read ahead, so memory stays
+    at a few parts whatever the file size. Failed parts are retried with
+    jittered backoff; if a part still fails the upload is aborted so S3
+    doesn't keep the orphaned parts.
+    """
+
+    def __init__(self, transport, part_size=DEFAULT_PART_BYTES, concurrency=4,
+                 max_retries=3, backoff_base=0.2, backoff_max=5.0):
+        """
+        :param transport: LambdaInvokeTransport or FunctionUrlTransport.
+        :param part_size: Bytes per part. S3 needs at least 5 MiB except for the last part.
+        :param concurrency: Parts sent at once.
+        :param max_retries: Times a part is resent after a retryable failure.
+        :param backoff_base: First retry delay ceiling in seconds.
+        :param backoff_max: Upper bound of the retry delay in seconds.
+        """
+        self.transport = transport
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _request(self, action, params, body=b'', headers=None):
+        attempt = 0
+        while True:
+            status_code, response = self.transport(action, params, body, headers)
+            if status_code == 200:
+                return response
+            if status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                raise UploadError(f"Upload {action} failed with {status_code}: "
+                                  f"{response.get('message', response)}")
+            attempt += 1
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+    def upload(self, file, content_type='image/png', filename=None):
+        """Upload a binary file object in parts.
+
+        :param file: File object opened for binary reading.
+        :param content_type: Image content type, which sets the key's extension.
+        :param filename: Object name without extension; the function picks
+                         one when not given.
+        :return: Dict with the key, s3_url, parts, bytes and MB/sec.
+        """
+        started = time.monotonic()
+        headers = {'content-type': content_type}
+        if filename:
+            headers['filename'] = filename
+        session = self._request('initiate', {}, headers=headers)
+        params = {'uploadId': session['uploadId'], 'key': session['key']}
+        logger.info("Started chunked upload of %s.", session['key'])
+
+        parts = []
+        byte_count = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                pending = set()
+
+                def collect(futures):
+                    for future in futures:
+                        pending.discard(future)
+                        parts.append(future.result())
+
+                part_number = 0
+                while True:
+                    chunk = file.read(self.part_size)
+                    if not chunk:
+                        break
+                    part_number += 1
+                    byte_count += len(chunk)
+                    if len(pending) >= self.concurrency * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(
+                        self._request, 'part', {**params, 'partNumber': part_number}, chunk))
+                collect(list(pending))
+            if not parts:
+                raise UploadError("Nothing to upload: the file is empty")
+            result = self._request('complete', params, json.dumps({'parts': parts}))
+        except Exception:
+            logger.exception("Chunked upload of %s failed; aborting it.", session['key'])
+            try:
+                self._request('abort', params)
+            except UploadError as e:
+                logger.error(e)
+            raise
+
+        elapsed = time.monotonic() - started
+        return {
+            'key': session['key'],
+            's3_url': result.get('s3_url'),
+            'parts': len(parts),
+            'bytes': byte_count,
+            'elapsed_sec': round(elapsed, 3),
+            'mb_per_sec': round(byte_count / elapsed / 1024 / 1024, 2) if elapsed > 0 else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload a large image to upload-image-to-s3 in parts.")
+    parser.add_argument('file')
+    parser.add_argument('--content-type', default='image/png')
+    parser.add_argument('--filename', help="Object name without extension")
+    parser.add_argument('--url', help="Function URL; parts are invoked directly when not given")
+    parser.add_argument('--function', default=FUNCTION_NAME)
+    parser.add_argument('--part-size-mb', type=float, default=DEFAULT_PART_BYTES / 1024 / 1024)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    if args.url:
+        transport = FunctionUrlTransport(args.url)
+    else:
+        import aws_clients
+
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+        aws_clients.configure(max_pool_connections=max(args.concurrency, 10))
+        transport = LambdaInvokeTransport(aws_clients.get_client('lambda'), args.function)
+
+    uploader = ChunkedUploader(transport, int(args.part_size_mb * 1024 * 1024), args.concurrency)
+    with open(args.file, 'rb') as file:
+        print(json.dumps(uploader.upload(file, args.content_type, args.filename)))
+
+
+if __name__ == '__main__':
+    main()
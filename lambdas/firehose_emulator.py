@@ -0,0 +1,468 @@
+
+import argparse
+import base64
+import gzip
+import io
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+
+import lambda_transform_json_to_csv as transform
+
+logger = logging.getLogger(__name__)
+
+# Buffering used by create_firehose_to_s3: the transform Lambda is invoked per
+# 1 MB / 60 s of input and S3 objects are written per 5 MB (the Firehose
+# default) / 60 s of transformed output.
+DEFAULT_BUFFER_SIZE_MB = 1
+DEFAULT_BUFFER_INTERVAL_SECONDS = 60
+DEFAULT_S3_BUFFER_SIZE_MB = 5
+DEFAULT_S3_BUFFER_INTERVAL_SECONDS = 60
+DEFAULT_ERROR_OUTPUT_PREFIX = 'processing-failed/'
+
+# PutRecordBatch service limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+MB = 1024 * 1024
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, or 0.0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Multiply before dividing so e.g. the p29 of 100 values is exactly rank 29
+    rank = max(math.ceil(pct * len(ordered) / 100) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class LocalS3:
+    """
+    In-memory stand-in for the S3 client calls the pipeline makes.
+
+    Supports put_object, get_object and paginated list_objects_v2, returning
+    the same response shapes as the Boto3 S3 client.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with self._lock:
+            self._objects[(Bucket, Key)] = bytes(Body)
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            body = self._objects[(Bucket, Key)]
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        with self._lock:
+            keys = sorted((key, len(body)) for (bucket, key), body in self._objects.items()
+                          if bucket == Bucket and key.startswith(Prefix))
+        if ContinuationToken is not None:
+            keys = [k for k in keys if k[0] > ContinuationToken]
+        page = keys[:MaxKeys]
+        response = {
+            'KeyCount': len(page),
+            'Contents': [{'Key': key, 'Size': size} for key, size in page],
+            'IsTruncated': len(keys) > MaxKeys,
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1][0]
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise ValueError(f"LocalS3 can't paginate {operation_name}")
+        return _ListObjectsPaginator(self)
+
+
+class _ListObjectsPaginator:
+
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+
+    def paginate(self, **kwargs):
+        kwargs.pop('PaginationConfig', None)
+        while True:
+            page = self.s3_client.list_objects_v2(**kwargs)
+            yield page
+            if not page['IsTruncated']:
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+class EmulatorStats:
+    """Running totals for an emulator, used to report throughput and latency."""
+
+    def __init__(self):
+        self.records_in = 0
+        self.bytes_in = 0
+        self.records_ok = 0
+        self.records_dropped = 0
+        self.records_failed = 0
+        self.bytes_delivered = 0
+        self.invocations = []
+        self.objects = []
+        self.first_put = None
+        self.last_delivery = None
+
+    def records_per_second(self):
+        if self.first_put is None or self.last_delivery is None:
+            return 0.0
+        elapsed = self.last_delivery - self.first_put
+        if elapsed <= 0:
+            return 0.0
+        return self.records_ok / elapsed
+
+    def summary(self):
+        """Return a dict summarising throughput, transform time and flush latency."""
+        transform_times = [duration for _, duration in self.invocations]
+        latencies = [latency for _, _, latency in self.objects]
+        return {
+            'records_in': self.records_in,
+            'bytes_in': self.bytes_in,
+            'records_delivered': self.records_ok,
+            'records_dropped': self.records_dropped,
+            'records_failed': self.records_failed,
+            'invocations': len(self.invocations),
+            'objects_written': len(self.objects),
+            'bytes_delivered': self.bytes_delivered,
+            'records_per_sec': round(self.records_per_second(), 1),
+            'transform_ms_avg': round(sum(transform_times) / len(transform_times) * 1000, 2)
+            if transform_times else 0.0,
+            'transform_ms_max': round(max(transform_times, default=0.0) * 1000, 2),
+            'flush_latency_ms_p50': round(percentile(latencies, 50) * 1000, 2),
+            'flush_latency_ms_p95': round(percentile(latencies, 95) * 1000, 2),
+            'flush_latency_ms_max': round(max(latencies, default=0.0) * 1000, 2),
+        }
+
+
+class FirehoseEmulator:
+    """
+    Local stand-in for a Firehose delivery stream with a transform Lambda.
+
+    Records are buffered by size and age the way Firehose buffers them for
+    its processor, then passed to the transform handler in-process as a
+    Firehose-shaped event. Records the handler returns as Ok are buffered
+    again by the S3 hints and written as objects under the stream's prefix;
+    ProcessingFailed records go to the error output prefix. Nothing leaves
+    the process, so a run takes as long as the buffering hints say rather
+    than LocalStack's fixed minute.
+
+    put_record and put_record_batch take the same arguments as the Boto3
+    Firehose client, so producers can write to the emulator unchanged. Use
+    the emulator as a context manager, or call close(), so the final partial
+    buffers are delivered.
+    """
+
+    def __init__(self, transform_handler=transform.handler, s3_client=None,
+                 bucket='local-firehose', delivery_stream_name='local-firehose',
+                 buffer_size_mb=DEFAULT_BUFFER_SIZE_MB,
+                 buffer_interval_seconds=DEFAULT_BUFFER_INTERVAL_SECONDS,
+                 s3_buffer_size_mb=DEFAULT_S3_BUFFER_SIZE_MB,
+                 s3_buffer_interval_seconds=DEFAULT_S3_BUFFER_INTERVAL_SECONDS,
+                 prefix='', error_output_prefix=DEFAULT_ERROR_OUTPUT_PREFIX,
+                 compression='UNCOMPRESSED'):
+        """
+        :param transform_handler: Lambda handler called as handler(event, context),
+                                  or None to deliver records untransformed.
+        :param s3_client: Where objects are written. Defaults to a LocalS3.
+        :param bucket: Destination bucket name.
+        :param delivery_stream_name: Name used in events and object keys.
+        :param buffer_size_mb: Input buffered before the handler is invoked.
+        :param buffer_interval_seconds: Maximum age of input before the handler is invoked.
+        :param s3_buffer_size_mb: Output buffered before an object is written.
+        :param s3_buffer_interval_seconds: Maximum age of output before an object is written.
+        :param prefix: Key prefix of delivered objects.
+        :param error_output_prefix: Key prefix of records the handler failed.
+        :param compression: 'UNCOMPRESSED' or 'GZIP'. GZIP objects get a .gz suffix.
+        """
+        if compression not in ('UNCOMPRESSED', 'GZIP'):
+            raise ValueError(f"The emulator doesn't support {compression} compression")
+        self.transform_handler = transform_handler
+        self.s3_client = s3_client if s3_client is not None else LocalS3()
+        self.bucket = bucket
+        self.delivery_stream_name = delivery_stream_name
+        self.buffer_bytes = int(buffer_size_mb * MB)
+        self.buffer_interval_seconds = buffer_interval_seconds
+        self.s3_buffer_bytes = int(s3_buffer_size_mb * MB)
+        self.s3_buffer_interval_seconds = s3_buffer_interval_seconds
+        self.prefix = prefix
+        self.error_output_prefix = error_output_prefix
+        self.compression = compression
+        self.stream_arn = f"arn:aws:firehose:us-east-1:000000000000:deliverystream/{delivery_stream_name}"
+        self.stats = EmulatorStats()
+
+        # Input buffer: (record id, data, arrival epoch ms, arrival monotonic)
+        self._input = []
+        self._input_bytes = 0
+        self._input_started = None
+        # Output buffer: (data, arrival monotonic)
+        self._output = []
+        self._output_bytes = 0
+        self._output_started = None
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._interval_loop, daemon=True)
+        self._timer.start()
+
+    @classmethod
+    def from_destination_config(cls, config, **kwargs):
+        """Create an emulator that buffers like an ExtendedS3DestinationConfiguration.
+
+        :param config: The destination configuration passed to create_delivery_stream.
+        :param kwargs: Other constructor arguments, which take precedence.
+        :return: The emulator.
+        """
+        settings = {}
+        hints = config.get('BufferingHints', {})
+        if 'SizeInMBs' in hints:
+            settings['s3_buffer_size_mb'] = hints['SizeInMBs']
+        if 'IntervalInSeconds' in hints:
+            settings['s3_buffer_interval_seconds'] = hints['IntervalInSeconds']
+        for processor in config.get('ProcessingConfiguration', {}).get('Processors', []):
+            parameters = {p['ParameterName']: p['ParameterValue'] for p in processor.get('Parameters', [])}
+            if 'BufferSizeInMBs' in parameters:
+                settings['buffer_size_mb'] = float(parameters['BufferSizeInMBs'])
+            if 'BufferIntervalInSeconds' in parameters:
+                settings['buffer_interval_seconds'] = float(parameters['BufferIntervalInSeconds'])
+        if 'BucketARN' in config:
+            settings['bucket'] = config['BucketARN'].split(':::')[-1]
+        if 'Prefix' in config:
+            settings['prefix'] = config['Prefix']
+        if 'ErrorOutputPrefix' in config:
+            settings['error_output_prefix'] = config['ErrorOutputPrefix']
+        if 'CompressionFormat' in config:
+            settings['compression'] = config['CompressionFormat']
+        settings.update(kwargs)
+        return cls(**settings)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put_record(self, Record, DeliveryStreamName=None):
+        """Add one record, as Firehose.Client.put_record."""
+        record_id = self._put(Record['Data'])
+        return {'RecordId': record_id, 'Encrypted': False}
+
+    def put_record_batch(self, Records, DeliveryStreamName=None):
+        """Add up to 500 records, as Firehose.Client.put_record_batch."""
+        if len(Records) > MAX_BATCH_RECORDS:
+            raise ValueError(f"A batch holds at most {MAX_BATCH_RECORDS} records")
+        if sum(len(r['Data']) for r in Records) > MAX_BATCH_BYTES:
+            raise ValueError("A batch holds at most 4 MiB of data")
+        responses = [{'RecordId': self._put(r['Data'])} for r in Records]
+        return {'FailedPutCount': 0, 'Encrypted': False, 'RequestResponses': responses}
+
+    def _put(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if len(data) > MAX_RECORD_BYTES:
+            raise ValueError(f"Record of {len(data)} bytes exceeds the 1000 KiB Firehose limit")
+        record_id = uuid.uuid4().hex
+        now = time.monotonic()
+        batch = None
+        with self._lock:
+            if self.stats.first_put is None:
+                self.stats.first_put = now
+            self.stats.records_in += 1
+            self.stats.bytes_in += len(data)
+            self._input.append((record_id, data, int(time.time() * 1000), now))
+            self._input_bytes += len(data)
+            if self._input_started is None:
+                self._input_started = now
+            if self._input_bytes >= self.buffer_bytes:
+                batch = self._take_input()
+        if batch:
+            self._process(batch)
+        return record_id
+
+    def flush(self):
+        """Process and deliver everything currently buffered."""
+        with self._lock:
+            batch = self._take_input()
+        if batch:
+            self._process(batch)
+        with self._lock:
+            output = self._take_output()
+        if output:
+            self._deliver(output)
+
+    def close(self):
+        """Flush the buffers, stop the interval timer and log a summary."""
+        self._closed.set()
+        self._timer.join()
+        self.flush()
+        logger.info("Firehose emulator summary for %s: %s",
+                    self.delivery_stream_name, json.dumps(self.stats.summary()))
+
+    def _take_input(self):
+        batch = self._input
+        self._input = []
+        self._input_bytes = 0
+        self._input_started = None
+        return batch
+
+    def _take_output(self):
+        output = self._output
+        self._output = []
+        self._output_bytes = 0
+        self._output_started = None
+        return output
+
+    def _interval_loop(self):
+        interval = max(min(self.buffer_interval_seconds, self.s3_buffer_interval_seconds) / 4, 0.005)
+        while not self._closed.wait(interval):
+            now = time.monotonic()
+            batch = output = None
+            with self._lock:
+                if (self._input_started is not None
+                        and now - self._input_started >= self.buffer_interval_seconds):
+                    batch = self._take_input()
+            if batch:
+                self._process(batch)
+            with self._lock:
+                if (self._output_started is not None
+                        and now - self._output_started >= self.s3_buffer_interval_seconds):
+                    output = self._take_output()
+            if output:
+                self._deliver(output)
+
+    def _process(self, batch):
+        with self._process_lock:
+            if self.transform_handler is None:
+                self._buffer_output([(data, arrived) for _, data, _, arrived in batch])
+                return
+            event = {
+                'invocationId': str(uuid.uuid4()),
+                'deliveryStreamArn': self.stream_arn,
+                'region': 'us-east-1',
+                'records': [{
+                    'recordId': record_id,
+                    'approximateArrivalTimestamp': arrival_ms,
+                    'data': base64.b64encode(data).decode('ascii'),
+                } for record_id, data, arrival_ms, _ in batch],
+            }
+            start = time.monotonic()
+            try:
+                response = self.transform_handler(event, None)
+                results = {r['recordId']: r for r in response['records']}
+            except Exception as e:
+                logger.exception("Transform handler failed for %d records.", len(batch))
+                self.stats.invocations.append((len(batch), time.monotonic() - start))
+                self._write_errors([(record, 'Lambda.FunctionError', str(e)) for record in batch])
+                return
+            self.stats.invocations.append((len(batch), time.monotonic() - start))
+
+            delivered, errors = [], []
+            for record in batch:
+                record_id, _, _, arrived = record
+                result = results.get(record_id)
+                if result is None:
+                    errors.append((record, 'Lambda.MissingRecordId', 'Record ID missing from the response'))
+                elif result['result'] == transform.RESULT_OK:
+                    delivered.append((base64.b64decode(result['data']), arrived))
+                elif result['result'] == transform.RESULT_DROPPED:
+                    self.stats.records_dropped += 1
+                else:
+                    errors.append((record, 'Lambda.ProcessingFailed', 'Processing failed'))
+            self._buffer_output(delivered)
+            self._write_errors(errors)
+
+    def _buffer_output(self, delivered):
+        output = None
+        with self._lock:
+            self.stats.records_ok += len(delivered)
+            for data, arrived in delivered:
+                self._output.append((data, arrived))
+                self._output_bytes += len(data)
+                if self._output_started is None:
+                    self._output_started = time.monotonic()
+            if self._output_bytes >= self.s3_buffer_bytes:
+                output = self._take_output()
+        if output:
+            self._deliver(output)
+
+    def _object_key(self, prefix):
+        now = time.gmtime()
+        suffix = '.gz' if self.compression == 'GZIP' else ''
+        return (f"{prefix}{time.strftime('%Y/%m/%d/%H/', now)}{self.delivery_stream_name}-1-"
+                f"{time.strftime('%Y-%m-%d-%H-%M-%S', now)}-{uuid.uuid4()}{suffix}")
+
+    def _deliver(self, output):
+        body = b''.join(data for data, _ in output)
+        if self.compression == 'GZIP':
+            body = gzip.compress(body, compresslevel=6)
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._object_key(self.prefix), Body=body)
+        written = time.monotonic()
+        oldest = min(arrived for _, arrived in output)
+        with self._lock:
+            self.stats.objects.append((len(output), len(body), written - oldest))
+            self.stats.bytes_delivered += len(body)
+            self.stats.last_delivery = written
+
+    def _write_errors(self, errors):
+        if not errors:
+            return
+        now_ms = int(time.time() * 1000)
+        lines = [json.dumps({
+            'attemptsMade': 1,
+            'arrivalTimestamp': arrival_ms,
+            'errorCode': error_code,
+            'errorMessage': error_message,
+            'attemptEndingTimestamp': now_ms,
+            'rawData': base64.b64encode(data).decode('ascii'),
+        }) for (_, data, arrival_ms, _), error_code, error_message in errors]
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        if self.compression == 'GZIP':
+            body = gzip.compress(body, compresslevel=6)
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._object_key(self.error_output_prefix), Body=body)
+        with self._lock:
+            self.stats.records_failed += len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push records through an in-process Firehose and transform.")
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_RECORDS)
+    parser.add_argument('--buffer-size-mb', type=float, default=DEFAULT_BUFFER_SIZE_MB)
+    parser.add_argument('--buffer-interval', type=float, default=1.0,
+                        help="Seconds before a partial input buffer is transformed")
+    parser.add_argument('--s3-buffer-size-mb', type=float, default=DEFAULT_S3_BUFFER_SIZE_MB)
+    parser.add_argument('--s3-buffer-interval', type=float, default=1.0,
+                        help="Seconds before a partial output buffer is written")
+    args = parser.parse_args()
+
+    record = json.dumps({
+        "name": "Jane Doe",
+        "city": "Port Jennifer",
+        "phone": "(555) 010-4477",
+        "id": str(uuid.uuid4()),
+    }).encode('utf-8')
+    with FirehoseEmulator(buffer_size_mb=args.buffer_size_mb,
+                          buffer_interval_seconds=args.buffer_interval,
+                          s3_buffer_size_mb=args.s3_buffer_size_mb,
+                          s3_buffer_interval_seconds=args.s3_buffer_interval) as emulator:
+        for start in range(0, args.records, args.batch_size):
+            count = min(args.batch_size, args.records - start)
+            emulator.put_record_batch(Records=[{'Data': record}] * count)
+    print(json.dumps(emulator.stats.summary()))
+
+
+if __name__ == '__main__':
+    main()
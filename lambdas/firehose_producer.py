@@ -0,0 +1,203 @@
+
+import logging
+import random
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from kinesis_producer import BatchResult, ProducerStats
+if typing.TYPE_CHECKING:
+    from mypy_boto3_firehose import FirehoseClient
+
+logger = logging.getLogger(__name__)
+
+# PutRecordBatch service limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+# Errors after which a whole batch is sent again
+RETRYABLE_ERROR_CODES = ('ServiceUnavailableException', 'ThrottlingException', 'InternalFailure')
+
+
+class FirehoseBatchProducer:
+    """
+    Buffers records and writes them straight to a DirectPut Firehose stream
+    with PutRecordBatch.
+
+    A batch is flushed when it reaches max_records, when adding a record would
+    exceed max_bytes, or when the oldest buffered record is older than
+    linger_seconds. Batches are sent by up to `senders` concurrent threads;
+    put() blocks when that many batches are already queued, so memory stays
+    bounded when the stream throttles. Entries a response reports as failed
+    are resent on their own with jittered exponential backoff.
+
+    Firehose doesn't order records across concurrent batches, so use the
+    Kinesis producer when ordering matters. Use the producer as a context
+    manager, or call close(), so the final partial batch is sent.
+    """
+
+    def __init__(self, firehose_client: "FirehoseClient", delivery_stream_name,
+                 max_records=MAX_BATCH_RECORDS, max_bytes=MAX_BATCH_BYTES,
+                 linger_seconds=0.1, senders=4, record_delimiter=b'',
+                 max_retries=5, backoff_base=0.05, backoff_max=2.0):
+        """
+        :param firehose_client: The Boto3 Firehose client object.
+        :param delivery_stream_name: DirectPut delivery stream name.
+        :param max_records: Maximum records per PutRecordBatch call (<= 500).
+        :param max_bytes: Maximum payload bytes per PutRecordBatch call (<= 4 MiB).
+        :param linger_seconds: Maximum time a record waits in the buffer.
+        :param senders: Batches sent concurrently.
+        :param record_delimiter: Bytes appended to every record, e.g. b'\\n'
+                                 when no transform splits the records again.
+        :param max_retries: Times a failed record is resent before it counts as failed.
+        :param backoff_base: First retry delay ceiling in seconds.
+        :param backoff_max: Upper bound of the retry delay in seconds.
+        """
+        self.firehose_client = firehose_client
+        self.delivery_stream_name = delivery_stream_name
+        self.max_records = min(max_records, MAX_BATCH_RECORDS)
+        self.max_bytes = min(max_bytes, MAX_BATCH_BYTES)
+        self.linger_seconds = linger_seconds
+        self.record_delimiter = record_delimiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = ProducerStats()
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=senders)
+        self._max_in_flight = senders * 2
+        self._in_flight = threading.BoundedSemaphore(self._max_in_flight)
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._linger_loop, daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, data):
+        """Add one record to the buffer, sending the batch if it is full.
+
+        :param data: Record payload as bytes or str.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        data += self.record_delimiter
+        if len(data) > MAX_RECORD_BYTES:
+            raise ValueError(f"Record of {len(data)} bytes exceeds the 1000 KiB Firehose limit")
+
+        batch = None
+        with self._lock:
+            self.stats.user_records += 1
+            if self._buffer and self._buffer_bytes + len(data) > self.max_bytes:
+                batch = self._take_buffer()
+            self._buffer.append(data)
+            self._buffer_bytes += len(data)
+            if self._buffer_started is None:
+                self._buffer_started = time.monotonic()
+            if batch is None and len(self._buffer) >= self.max_records:
+                batch = self._take_buffer()
+        if batch:
+            self._submit(batch)
+
+    def flush(self):
+        """Send whatever is buffered and wait for every queued batch."""
+        with self._lock:
+            batch = self._take_buffer()
+        if batch:
+            self._submit(batch)
+        # Holding every slot means no batch is queued or being sent
+        for _ in range(self._max_in_flight):
+            self._in_flight.acquire()
+        for _ in range(self._max_in_flight):
+            self._in_flight.release()
+
+    def close(self):
+        """Flush the buffer, stop the senders and log a summary."""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+        logger.info("Producer summary for %s: %s", self.delivery_stream_name, self.stats.summary())
+
+    def _take_buffer(self):
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        return batch
+
+    def _linger_loop(self):
+        interval = max(self.linger_seconds / 4, 0.005)
+        while not self._closed.wait(interval):
+            batch = None
+            with self._lock:
+                if (self._buffer_started is not None
+                        and time.monotonic() - self._buffer_started >= self.linger_seconds):
+                    batch = self._take_buffer()
+            if batch:
+                self._submit(batch)
+
+    def _submit(self, batch):
+        # Blocks while the senders are saturated, pushing back on put()
+        self._in_flight.acquire()
+        future = self._executor.submit(self._send, batch)
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+    def _backoff(self, attempt):
+        # Full jitter: spread retries of concurrent senders over the window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _send(self, batch):
+        byte_count = sum(len(data) for data in batch)
+        failed_count = 0
+        retried_count = 0
+        start = time.monotonic()
+        pending = batch
+        attempt = 0
+        while pending:
+            try:
+                response = self.firehose_client.put_record_batch(
+                    DeliveryStreamName=self.delivery_stream_name,
+                    Records=[{'Data': data} for data in pending])
+            except ClientError as e:
+                if e.response['Error']['Code'] in RETRYABLE_ERROR_CODES and attempt < self.max_retries:
+                    attempt += 1
+                    retried_count += len(pending)
+                    time.sleep(self._backoff(attempt))
+                    continue
+                logger.error(e)
+                failed_count += len(pending)
+                break
+
+            if not response['FailedPutCount']:
+                break
+            # Only the entries with an ErrorCode are resent
+            retry = [data for data, entry in zip(pending, response['RequestResponses'])
+                     if entry.get('ErrorCode')]
+            if attempt >= self.max_retries:
+                logger.error("Giving up on %d records to %s after %d retries",
+                             len(retry), self.delivery_stream_name, attempt)
+                failed_count += len(retry)
+                break
+            attempt += 1
+            retried_count += len(retry)
+            time.sleep(self._backoff(attempt))
+            pending = retry
+        result = BatchResult(len(batch), byte_count, failed_count,
+                             time.monotonic() - start, retried_count)
+        self.stats.add(result)
+        logger.debug("Sent batch to %s: %s", self.delivery_stream_name, result)
+        if failed_count:
+            logger.warning("%d of %d records failed in PutRecordBatch to %s",
+                           failed_count, len(batch), self.delivery_stream_name)
+        return result
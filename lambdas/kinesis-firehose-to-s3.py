@@ -1,46 +1,50 @@
 
 import json
 import logging
-import time
-import boto3
 import os
 import typing
-from time import sleep
-from faker import Faker
-import uuid
+import aws_clients
 import s3_basic as s3_helper
 
 from botocore.exceptions import ClientError
 import lambda_basic as lambda_helper
+from kinesis_producer import KinesisBatchProducer
+from provisioner import Provisioner, ProvisioningError
+from resource_cache import resource_cache
+from waiters import WaiterError, status_check, wait_until
+from record_schema import FAKER_RECORD_SCHEMA
+from synthetic_records import SyntheticRecordGenerator
 if typing.TYPE_CHECKING:
     from mypy_boto3_kinesis import KinesisClient
     from mypy_boto3_s3 import S3Client
     from mypy_boto3_firehose import FirehoseClient
     from mypy_boto3_iam import IAMClient
     from mypy_boto3_lambda import LambdaClient
+    from mypy_boto3_glue import GlueClient
 
 os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 
-kinesis_client: "KinesisClient" = boto3.client(
-    "kinesis", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
-)
-s3: "S3Client" = boto3.client(
-    "s3", endpoint_url="http://localhost.localstack.cloud:4566"
-)
-firehose_client: "FirehoseClient" = boto3.client(
-    "firehose", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
-)
-iam_client: "IAMClient" = boto3.client(
-    "iam", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
-)
-lambda_client: "LambdaClient" = boto3.client(
-    "lambda", endpoint_url="http://localhost.localstack.cloud:4566"
-)
-iam_resource: "IAMClient" = boto3.resource(
-    "iam", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
-)
+# Clients are created on first use and shared with the helper modules
+kinesis_client: "KinesisClient" = aws_clients.lazy_client("kinesis")
+s3: "S3Client" = aws_clients.lazy_client("s3")
+firehose_client: "FirehoseClient" = aws_clients.lazy_client("firehose")
+iam_client: "IAMClient" = aws_clients.lazy_client("iam")
+lambda_client: "LambdaClient" = aws_clients.lazy_client("lambda")
+iam_resource: "IAMClient" = aws_clients.lazy_resource("iam")
+glue_client: "GlueClient" = aws_clients.lazy_client("glue")
+
+# Glue schema of the Faker records the demo producer writes. Firehose uses it
+# to convert the JSON records to Parquet.
+FAKER_RECORD_COLUMNS = FAKER_RECORD_SCHEMA.glue_columns()
+
+# Firehose S3 compression formats
+COMPRESSION_FORMATS = ('UNCOMPRESSED', 'GZIP', 'ZIP', 'Snappy', 'HADOOP_SNAPPY')
+
+# Key prefixes used with dynamic partitioning
+DATE_HOUR_PREFIX = '!{timestamp:yyyy/MM/dd/HH}/'
+DEFAULT_ERROR_OUTPUT_PREFIX = 'processing-failed/!{firehose:error-output-type}/!{timestamp:yyyy/MM/dd}/'
 
 def create_kinesis_stream(stream_name, num_shards=1):
     """Create a Kinesis data stream
@@ -60,6 +64,8 @@ def create_kinesis_stream(stream_name, num_shards=1):
         except ClientError as e:
             logging.error(e)
             return False
+        finally:
+            resource_cache.invalidate('kinesis', stream_name)
     return True
 
 def get_kinesis_arn(stream_name):
@@ -71,12 +77,17 @@ def get_kinesis_arn(stream_name):
 
     # Retrieve stream info
     logging.info(f"Get {stream_name} arn")
+    arn = resource_cache.get('kinesis', stream_name, 'arn')
+    if arn is not None:
+        return arn
     try:
         result = kinesis_client.describe_stream_summary(StreamName=stream_name)
     except ClientError as e:
         logging.error(e)
         return None
-    return result['StreamDescriptionSummary']['StreamARN']
+    summary = result['StreamDescriptionSummary']
+    resource_cache.put('kinesis', stream_name, arn=summary['StreamARN'], status=summary['StreamStatus'])
+    return summary['StreamARN']
 
 def kinesis_exists(kinesis_name):
     """Check if the specified Kinesis exists
@@ -92,29 +103,28 @@ def kinesis_exists(kinesis_name):
         return False
     return True
 
-def wait_for_active_kinesis_stream(stream_name):
+def wait_for_active_kinesis_stream(stream_name, timeout=120):
     """Wait for a new Kinesis data stream to become active
 
     :param stream_name: Data stream name
-    :return: True if steam is active. False if error creating stream.
+    :param timeout: Seconds to wait before giving up
+    :return: True if steam is active. False if error creating stream, the
+        stream is being deleted or it isn't active before the timeout.
     """
 
     # Wait until the stream is active
     logging.info("Wait until the stream is active")
-    while True:
-        try:
-            # Get the stream's current status
-            result = kinesis_client.describe_stream_summary(StreamName=stream_name)
-        except ClientError as e:
-            logging.error(e)
-            return False
-        status = result['StreamDescriptionSummary']['StreamStatus']
-        if status == 'ACTIVE':
-            return True
-        if status == 'DELETING':
-            logging.error(f'Kinesis stream {stream_name} is being deleted.')
-            return False
-        time.sleep(5)
+    def get_status():
+        summary = kinesis_client.describe_stream_summary(StreamName=stream_name)['StreamDescriptionSummary']
+        resource_cache.put('kinesis', stream_name, arn=summary['StreamARN'], status=summary['StreamStatus'])
+        return summary['StreamStatus']
+    try:
+        wait_until(status_check(get_status, description=f'Kinesis stream {stream_name}'),
+                   timeout=timeout, description=f'Kinesis stream {stream_name}')
+    except (ClientError, WaiterError) as e:
+        logging.error(e)
+        return False
+    return True
 
 
 def get_firehose_arn(firehose_name):
@@ -123,12 +133,18 @@ def get_firehose_arn(firehose_name):
     :param firehose_name: Firehose stream name
     :return: If the Firehose stream exists, return ARN, else None
     """
+    arn = resource_cache.get('firehose', firehose_name, 'arn')
+    if arn is not None:
+        return arn
     try:
         result = firehose_client.describe_delivery_stream(DeliveryStreamName=firehose_name)
     except ClientError as e:
         logging.error(e)
         return None
-    return result['DeliveryStreamDescription']['DeliveryStreamARN']
+    description = result['DeliveryStreamDescription']
+    resource_cache.put('firehose', firehose_name, arn=description['DeliveryStreamARN'],
+                       status=description['DeliveryStreamStatus'])
+    return description['DeliveryStreamARN']
 
 
 def firehose_exists(firehose_name):
@@ -154,11 +170,15 @@ def get_iam_role_arn(iam_role_name):
 
     # Try to retrieve information about the role
     logging.info("Try to retrieve information about the role")
+    arn = resource_cache.get('iam_role', iam_role_name, 'arn')
+    if arn is not None:
+        return arn
     try:
         result = iam_client.get_role(RoleName=iam_role_name)
     except ClientError as e:
         logging.error(e)
         return None
+    resource_cache.put('iam_role', iam_role_name, arn=result['Role']['Arn'])
     return result['Role']['Arn']
 
 
@@ -176,6 +196,46 @@ def iam_role_exists(iam_role_name):
     return True
 
 
+def create_glue_table(database_name, table_name, columns, s3_bucket_arn):
+    """Create the Glue table that declares the schema for record format conversion
+
+    :param database_name: Glue database name. Created if it doesn't exist.
+    :param table_name: Glue table name. An existing table is reused.
+    :param columns: Glue column definitions, e.g. FAKER_RECORD_COLUMNS
+    :param s3_bucket_arn: ARN of S3 bucket the converted data is delivered to
+    :return: True if the table exists or was created. Otherwise, False.
+    """
+
+    logging.info(f"Create the Glue table {database_name}.{table_name}")
+    try:
+        glue_client.create_database(DatabaseInput={'Name': database_name})
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'AlreadyExistsException':
+            logging.error(e)
+            return False
+    try:
+        glue_client.create_table(
+            DatabaseName=database_name,
+            TableInput={
+                'Name': table_name,
+                'TableType': 'EXTERNAL_TABLE',
+                'StorageDescriptor': {
+                    'Columns': columns,
+                    'Location': f's3://{s3_bucket_arn}/',
+                    'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
+                    'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
+                    'SerdeInfo': {
+                        'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe',
+                    },
+                },
+            })
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'AlreadyExistsException':
+            logging.error(e)
+            return False
+    return True
+
+
 def create_iam_role_for_firehose_to_s3(iam_role_name, s3_bucket_arn,
                                        firehose_src_stream=None):
     """Create an IAM role for a Firehose delivery system to S3
@@ -209,6 +269,7 @@ def create_iam_role_for_firehose_to_s3(iam_role_name, s3_bucket_arn,
         logging.error(e)
         return None
     firehose_role_arn = result['Role']['Arn']
+    resource_cache.put('iam_role', iam_role_name, arn=firehose_role_arn)
 
     # Define and attach a policy that grants sufficient S3 permissions
     logging.info("Define and attach a policy that grants sufficient S3 permissions")
@@ -242,6 +303,31 @@ def create_iam_role_for_firehose_to_s3(iam_role_name, s3_bucket_arn,
         logging.error(e)
         return None
 
+    # Record format conversion reads the schema from the Glue Data Catalog
+    policy_name = 'firehose_glue_access'
+    glue_access = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Sid": "",
+                "Effect": "Allow",
+                "Action": [
+                    "glue:GetTable",
+                    "glue:GetTableVersion",
+                    "glue:GetTableVersions"
+                ],
+                "Resource": "*"
+            }
+        ]
+    }
+    try:
+        iam_client.put_role_policy(RoleName=iam_role_name,
+                                   PolicyName=policy_name,
+                                   PolicyDocument=json.dumps(glue_access))
+    except ClientError as e:
+        logging.error(e)
+        return None
+
     # If the Firehose source is a Kinesis data stream then access to the
     # stream must be allowed.
     if firehose_src_stream is not None:
@@ -275,15 +361,92 @@ def create_iam_role_for_firehose_to_s3(iam_role_name, s3_bucket_arn,
     return firehose_role_arn
 
 
+def get_or_create_firehose_role(iam_role_name, s3_bucket_arn, firehose_src_stream=None):
+    """Return the ARN of the Firehose-to-S3 IAM role, creating the role if necessary
+
+    :param iam_role_name: Name of IAM role
+    :param s3_bucket_arn: ARN of S3 bucket
+    :param firehose_src_stream: ARN of source Kinesis Data Stream, or None
+    :return: ARN of IAM role. If error, returns None.
+    """
+
+    if iam_role_exists(iam_role_name):
+        # Retrieve its ARN
+        logging.info("Retrieve its Role ARN")
+        return get_iam_role_arn(iam_role_name)
+    logging.info("Create Firehose-to-S3 IAM role if necessary")
+    return create_iam_role_for_firehose_to_s3(iam_role_name,
+                                              s3_bucket_arn,
+                                              firehose_src_stream)
+
+
+def create_transform_lambda_package():
+    """Build the deployment package of the JSON transform Lambda
+
+    :return: The deployment package in ZIP format
+    """
+    return lambda_helper.create_lambda_deployment_package(
+        'lambda_transform_json_to_csv.py', 'kpl_aggregation.py', 'record_schema.py')
+
+
+def deploy_transform_lambda(iam_role_for_lambda, deployment_package, output_format='csv',
+                            partition_keys=None):
+    """Deploy the Firehose transform Lambda
+
+    :param iam_role_for_lambda: The IAM role resource the function runs as
+    :param deployment_package: Package from create_transform_lambda_package
+    :param output_format: Firehose output format, 'csv' or 'parquet'
+    :param partition_keys: JSON fields the function returns as dynamic
+        partitioning keys
+    :return: ARN of the function. Raises ClientError if deployment fails.
+    """
+    # Format conversion needs JSON input, so the transform emits JSON lines
+    transform_output = 'json' if output_format == 'parquet' else 'csv'
+    environment = {'TRANSFORM_OUTPUT_FORMAT': transform_output}
+    if partition_keys:
+        environment['TRANSFORM_PARTITION_KEYS'] = ','.join(partition_keys)
+    return lambda_helper.deploy_lambda_function(
+        lambda_client, 'lambda_transform_json_to_csv',
+        'lambda_transform_json_to_csv.handler', iam_role_for_lambda, deployment_package,
+        environment=environment, requirements_file=os.getenv("TRANSFORM_REQUIREMENTS_FILE"))
+
+
 def create_firehose_to_s3(firehose_name, s3_bucket_arn, iam_role_name,
                           firehose_src_type='DirectPut',
                           firehose_src_stream=None,
-                          isLambdaTransformFunction=False,):
+                          isLambdaTransformFunction=False,
+                          output_format='csv',
+                          glue_database='kinesis_poc',
+                          glue_table='faker_records',
+                          glue_columns=FAKER_RECORD_COLUMNS,
+                          parquet_compression='SNAPPY',
+                          iam_role_arn=None,
+                          transform_lambda_arn=None,
+                          buffer_size_mb=None,
+                          buffer_interval_seconds=60,
+                          compression='UNCOMPRESSED',
+                          prefix=None,
+                          error_output_prefix=None,
+                          partition_keys=None):
     """Create a Kinesis Firehose delivery stream to S3
 
     The data source can be either a Kinesis Data Stream or puts sent directly
     to the Firehose stream.
 
+    With output_format='parquet' Firehose converts the JSON records to
+    compressed, typed Parquet using the schema of a Glue table, which is
+    created from glue_columns if needed. The transform Lambda, if enabled,
+    then emits cleaned JSON lines instead of CSV.
+
+    Objects are written when buffer_size_mb or buffer_interval_seconds is
+    reached, whichever comes first, so a larger size means fewer, bigger
+    objects under load. With partition_keys Firehose partitions the output
+    by those JSON fields: the transform Lambda returns their values, or
+    without it an inline JQ query extracts them. Unless given, the prefix is
+    then key=value/ folders followed by the date and hour. Each Firehose
+    record lands in a single partition, so producers must not KPL-aggregate
+    records of different partitions into one.
+
     :param firehose_name: Delivery stream name
     :param s3_bucket_arn: ARN of S3 bucket
     :param iam_role_name: Name of Firehose-to-S3 IAM role. If the role doesn't
@@ -291,79 +454,145 @@ def create_firehose_to_s3(firehose_name, s3_bucket_arn, iam_role_name,
     :param firehose_src_type: 'DirectPut' or 'KinesisStreamAsSource'
     :param firehose_src_stream: ARN of source Kinesis Data Stream. Required if
         firehose_src_type is 'KinesisStreamAsSource'
+    :param output_format: 'csv' or 'parquet'
+    :param glue_database: Glue database holding the Parquet schema table
+    :param glue_table: Glue table that declares the Parquet schema
+    :param glue_columns: Glue column definitions of the record shape
+    :param parquet_compression: 'SNAPPY', 'GZIP' or 'UNCOMPRESSED'
+    :param iam_role_arn: ARN of an already provisioned Firehose role. If None,
+        the role named iam_role_name is looked up or created.
+    :param transform_lambda_arn: ARN of an already deployed transform Lambda.
+        If None and isLambdaTransformFunction is set, it is deployed here.
+    :param buffer_size_mb: Buffer size in MB (1-128). None uses the Firehose
+        default of 5, or 64 when converting to Parquet or partitioning.
+    :param buffer_interval_seconds: Buffer interval in seconds (0-900)
+    :param compression: 'UNCOMPRESSED', 'GZIP', 'ZIP', 'Snappy' or
+        'HADOOP_SNAPPY'. Must be 'UNCOMPRESSED' for Parquet, which uses
+        parquet_compression instead.
+    :param prefix: S3 key prefix, which may use expressions such as
+        '!{timestamp:yyyy/MM/dd/HH}/', '!{partitionKeyFromQuery:city}/' or,
+        with the transform Lambda, '!{partitionKeyFromLambda:city}/'
+    :param error_output_prefix: S3 key prefix of records that failed. Required
+        by Firehose when prefix uses expressions; a default is used then.
+    :param partition_keys: JSON field names to partition the output by
     :return: ARN of Firehose delivery stream. If error, returns None.
     """
 
-    # Create Firehose-to-S3 IAM role if necessary
+    if output_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported output format {output_format}")
+    if compression not in COMPRESSION_FORMATS:
+        raise ValueError(f"Unsupported compression {compression}")
+    if output_format == 'parquet' and compression != 'UNCOMPRESSED':
+        raise ValueError("Parquet output is compressed with parquet_compression; "
+                         "compression must be 'UNCOMPRESSED'")
+    if prefix is not None and '!{' in prefix and error_output_prefix is None:
+        error_output_prefix = DEFAULT_ERROR_OUTPUT_PREFIX
 
-    if iam_role_exists(iam_role_name):
-        # Retrieve its ARN
-        logging.info("Retrieve its Role ARN")
-        iam_role = get_iam_role_arn(iam_role_name)
-    else:
-        logging.info("Create Firehose-to-S3 IAM role if necessary")
-        iam_role = create_iam_role_for_firehose_to_s3(iam_role_name,
-                                                      s3_bucket_arn,
-                                                      firehose_src_stream)
+    # Create Firehose-to-S3 IAM role if necessary
+    iam_role = iam_role_arn
+    if iam_role is None:
+        iam_role = get_or_create_firehose_role(iam_role_name, s3_bucket_arn,
+                                               firehose_src_stream)
         if iam_role is None:
             # Error creating IAM role
             return None
 
     # Create the S3 configuration dictionary
     # Both BucketARN and RoleARN are required
-    # Set the buffer interval=60 seconds (Default=300 seconds)
-    if not isLambdaTransformFunction: 
-        s3_config = {
-            'BucketARN': s3_bucket_arn,
-            'RoleARN': iam_role,
-            'BufferingHints': {
-                'IntervalInSeconds': 60,
-            },
+    s3_config = {
+        'BucketARN': s3_bucket_arn,
+        'RoleARN': iam_role,
+        'BufferingHints': {
+            'IntervalInSeconds': buffer_interval_seconds,
+        },
+        'CompressionFormat': compression,
+    }
+    if buffer_size_mb is not None:
+        s3_config['BufferingHints']['SizeInMBs'] = buffer_size_mb
+    elif output_format == 'parquet' or partition_keys:
+        # Format conversion and dynamic partitioning need at least 64 MB
+        s3_config['BufferingHints']['SizeInMBs'] = 64
+    if prefix is not None:
+        s3_config['Prefix'] = prefix
+    if error_output_prefix is not None:
+        s3_config['ErrorOutputPrefix'] = error_output_prefix
+
+    processors = []
+    if partition_keys:
+        s3_config['DynamicPartitioningConfiguration'] = {'Enabled': True}
+        if 'Prefix' not in s3_config:
+            source = 'partitionKeyFromLambda' if isLambdaTransformFunction else 'partitionKeyFromQuery'
+            s3_config['Prefix'] = ''.join(f"{key}=!{{{source}:{key}}}/"
+                                          for key in partition_keys) + DATE_HOUR_PREFIX
+        s3_config.setdefault('ErrorOutputPrefix', DEFAULT_ERROR_OUTPUT_PREFIX)
+        if not isLambdaTransformFunction:
+            query = '{' + ', '.join(f"{key}: .{key}" for key in partition_keys) + '}'
+            processors.append({
+                'Type': 'MetadataExtraction',
+                'Parameters': [
+                    {'ParameterName': 'MetadataExtractionQuery', 'ParameterValue': query},
+                    {'ParameterName': 'JsonParsingEngine', 'ParameterValue': 'JQ-1.6'},
+                ],
+            })
+
+    if isLambdaTransformFunction:
+        lambdaFunctionArn = transform_lambda_arn
+        if lambdaFunctionArn is None:
+            lambda_role_name = iam_role_name
+            deployment_package = create_transform_lambda_package()
+            iam_role_for_lambda = lambda_helper.create_iam_role_for_lambda(iam_resource, lambda_role_name)
+            lambdaFunctionArn = deploy_transform_lambda(iam_role_for_lambda, deployment_package, output_format,
+                                                        partition_keys)
+        # With dynamic partitioning the Lambda returns the partition keys
+        processors.append({
+            "Type": "Lambda",
+            "Parameters": [
+                {
+                    "ParameterName": "LambdaArn",
+                    "ParameterValue": lambdaFunctionArn
+                },
+                {
+                    "ParameterName": "NumberOfRetries",
+                    "ParameterValue": "3"
+                },
+                {
+                    "ParameterName": "RoleArn",
+                    "ParameterValue": iam_role
+                },
+                {
+                    "ParameterName": "BufferSizeInMBs",
+                    "ParameterValue": "1"
+                },
+                {
+                    "ParameterName": "BufferIntervalInSeconds",
+                    "ParameterValue": "60"
+                }
+            ]
+        })
+    if processors:
+        s3_config['ProcessingConfiguration'] = {
+            "Enabled": True,
+            "Processors": processors,
         }
-    else:
-        lambda_function_filename = 'lambda_transform_json_to_csv.py'
-        lambda_handler_name = 'lambda_transform_json_to_csv.handler'
-        lambda_function_name = 'lambda_transform_json_to_csv'
-        lambda_role_name = iam_role_name
-        deployment_package = lambda_helper.create_lambda_deployment_package(lambda_function_filename)
-        iam_role_for_lambda = lambda_helper.create_iam_role_for_lambda(iam_resource, lambda_role_name)
-        lambdaFunctionArn = lambda_helper.deploy_lambda_function(lambda_client, lambda_function_name,lambda_handler_name, iam_role_for_lambda, deployment_package )
-        s3_config = {
-            'BucketARN': s3_bucket_arn,
-            'RoleARN': iam_role,
-            'BufferingHints': {
-                'IntervalInSeconds': 60,
+
+    if output_format == 'parquet':
+        if not create_glue_table(glue_database, glue_table, glue_columns, s3_bucket_arn):
+            return None
+        s3_config['DataFormatConversionConfiguration'] = {
+            'Enabled': True,
+            'SchemaConfiguration': {
+                'RoleARN': iam_role,
+                'DatabaseName': glue_database,
+                'TableName': glue_table,
+                'Region': 'us-east-1',
+                'VersionId': 'LATEST',
+            },
+            'InputFormatConfiguration': {
+                'Deserializer': {'OpenXJsonSerDe': {}},
+            },
+            'OutputFormatConfiguration': {
+                'Serializer': {'ParquetSerDe': {'Compression': parquet_compression}},
             },
-            "ProcessingConfiguration": {
-                "Enabled": True,
-                "Processors": [
-                {
-                    "Type": "Lambda",
-                        "Parameters": [
-                        {
-                            "ParameterName": "LambdaArn",
-                            "ParameterValue": lambdaFunctionArn
-                        },
-                        {
-                            "ParameterName": "NumberOfRetries",
-                            "ParameterValue": "3"
-                        },
-                        {
-                            "ParameterName": "RoleArn",
-                            "ParameterValue": iam_role
-                        },
-                        {
-                            "ParameterName": "BufferSizeInMBs",
-                            "ParameterValue": "1"
-                        },
-                        {
-                            "ParameterName": "BufferIntervalInSeconds",
-                            "ParameterValue": "60"
-                        }
-                        ]
-                    }
-                ]
-            }
         }
 
     # Create the delivery stream
@@ -388,31 +617,36 @@ def create_firehose_to_s3(firehose_name, s3_bucket_arn, iam_role_name,
     except ClientError as e:
         logging.error(e)
         return None
+    finally:
+        resource_cache.invalidate('firehose', firehose_name)
+    resource_cache.put('firehose', firehose_name, arn=result['DeliveryStreamARN'])
     return result['DeliveryStreamARN']
 
 
-def wait_for_active_firehose(firehose_name):
+def wait_for_active_firehose(firehose_name, timeout=300):
     """Wait until the Firehose delivery stream is active
 
     :param firehose_name: Name of Firehose delivery stream
+    :param timeout: Seconds to wait before giving up
     :return: True if delivery stream is active. Otherwise, False.
     """
 
     # Wait until the stream is active
-    while True:
-        try:
-            # Get the stream's current status
-            result = firehose_client.describe_delivery_stream(DeliveryStreamName=firehose_name)
-        except ClientError as e:
-            logging.error(e)
-            return False
-        status = result['DeliveryStreamDescription']['DeliveryStreamStatus']
-        if status == 'ACTIVE':
-            return True
-        if status == 'DELETING':
-            logging.error(f'Firehose delivery stream {firehose_name} is being deleted.')
-            return False
-        time.sleep(2)
+    def get_status():
+        description = firehose_client.describe_delivery_stream(
+            DeliveryStreamName=firehose_name)['DeliveryStreamDescription']
+        resource_cache.put('firehose', firehose_name, arn=description['DeliveryStreamARN'],
+                           status=description['DeliveryStreamStatus'])
+        return description['DeliveryStreamStatus']
+    description = f'Firehose delivery stream {firehose_name}'
+    try:
+        wait_until(status_check(get_status, failed=('DELETING', 'CREATING_FAILED'),
+                                description=description),
+                   timeout=timeout, description=description)
+    except (ClientError, WaiterError) as e:
+        logging.error(e)
+        return False
+    return True
 
 
 def main():
@@ -427,62 +661,104 @@ def main():
     firehose_name = 'firehose-to_s3-stream'
     bucket_arn = 'kinesis-poc-storage'
     iam_role_name = 'super-role'
+    # 'csv' or 'parquet'
+    output_format = os.getenv('FIREHOSE_OUTPUT_FORMAT', 'csv')
+    # Delivery options, e.g. FIREHOSE_COMPRESSION=GZIP FIREHOSE_PARTITION_KEYS=city
+    buffer_size_mb = os.getenv('FIREHOSE_BUFFER_SIZE_MB')
+    delivery_options = {
+        'buffer_size_mb': int(buffer_size_mb) if buffer_size_mb else None,
+        'buffer_interval_seconds': int(os.getenv('FIREHOSE_BUFFER_INTERVAL', '60')),
+        'compression': os.getenv('FIREHOSE_COMPRESSION', 'UNCOMPRESSED'),
+        'partition_keys': [key for key in os.getenv('FIREHOSE_PARTITION_KEYS', '').split(',') if key],
+    }
 
-    s3_helper.create_and_delete_my_bucket(bucket_arn, 1)
     # Set up logging
     # logging.basicConfig(level=logging.DEBUG,
     #                     format='%(levelname)s: %(asctime)s: %(message)s')
-    # Create a Kinesis stream (this is an asynchronous method)
     logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
-    success = create_kinesis_stream(kinesis_name)
-    if not success:
-        exit(1)
-
-    # Wait for the stream to become active
-    logging.info(f'Waiting for new Kinesis stream {kinesis_name} to become active...')
-    if not wait_for_active_kinesis_stream(kinesis_name):
-        exit(1)
-    logging.info(f'Kinesis stream {kinesis_name} is active')  
-
-    # Retrieve the Kinesis stream's ARN
-    kinesis_arn = get_kinesis_arn(kinesis_name) 
 
     # Create a Firehose delivery stream as a consumer of the Kinesis stream
     firehose_src_type = 'KinesisStreamAsSource'
 
-    # If Firehose doesn't exist, create it
-    if not firehose_exists(firehose_name):
-        # Create a Firehose delivery stream to S3. The Firehose will receive
-        # data from direct puts.
-        firehose_arn = create_firehose_to_s3(firehose_name, bucket_arn, iam_role_name, firehose_src_type, kinesis_arn, isLambdaTransformFunction=True)
-
-        if firehose_arn is None:
-            exit(1)
+    def require(result, message):
+        if not result:
+            raise RuntimeError(message)
+        return result
+
+    def create_stream(results):
+        # Create a Kinesis stream (this is an asynchronous method)
+        require(create_kinesis_stream(kinesis_name), f'Could not create {kinesis_name}')
+        return require(get_kinesis_arn(kinesis_name), f'Could not get the ARN of {kinesis_name}')
+
+    def wait_for_stream(results):
+        logging.info(f'Waiting for new Kinesis stream {kinesis_name} to become active...')
+        require(wait_for_active_kinesis_stream(kinesis_name), f'{kinesis_name} did not become active')
+        logging.info(f'Kinesis stream {kinesis_name} is active')
+        return results['kinesis_stream']
+
+    def create_firehose_role(results):
+        return require(get_or_create_firehose_role(iam_role_name, bucket_arn, results['kinesis_stream']),
+                       f'Could not create IAM role {iam_role_name}')
+
+    def create_transform_lambda(results):
+        # Redeploying is cheap: code is only uploaded when the package changed
+        return deploy_transform_lambda(results['lambda_role'], results['lambda_package'], output_format,
+                                       delivery_options['partition_keys'])
+
+    def create_firehose(results):
+        # If Firehose doesn't exist, create it
+        if results['existing_firehose']:
+            return results['existing_firehose']
+        firehose_arn = require(create_firehose_to_s3(firehose_name, bucket_arn, iam_role_name, firehose_src_type,
+                                                     results['kinesis_active'], isLambdaTransformFunction=True,
+                                                     output_format=output_format,
+                                                     iam_role_arn=results['firehose_role'],
+                                                     transform_lambda_arn=results['transform_lambda'],
+                                                     **delivery_options),
+                               f'Could not create {firehose_name}')
         logging.info(f'Created Firehose delivery stream to S3: {firehose_arn}')
 
         # Wait for the stream to become active
-        if not wait_for_active_firehose(firehose_name):
-            exit(1)
+        require(wait_for_active_firehose(firehose_name), f'{firehose_name} did not become active')
         logging.info('Firehose stream is active')
+        return firehose_arn
+
+    # The bucket, the stream and the Lambda package don't depend on each
+    # other and are created concurrently. The transform Lambda reuses the
+    # Firehose role name, so its role is set up after the Firehose role.
+    provisioner = Provisioner()
+    provisioner.add('existing_firehose', lambda results: get_firehose_arn(firehose_name))
+    provisioner.add('bucket', lambda results: s3_helper.create_and_delete_my_bucket(bucket_arn, 1))
+    provisioner.add('kinesis_stream', create_stream)
+    provisioner.add('kinesis_active', wait_for_stream, depends_on=['kinesis_stream'])
+    provisioner.add('firehose_role', create_firehose_role, depends_on=['kinesis_stream'])
+    provisioner.add('lambda_package', lambda results: create_transform_lambda_package())
+    provisioner.add('lambda_role',
+                    lambda results: lambda_helper.create_iam_role_for_lambda(iam_resource, iam_role_name),
+                    depends_on=['firehose_role'])
+    provisioner.add('transform_lambda', create_transform_lambda,
+                    depends_on=['lambda_package', 'lambda_role'])
+    provisioner.add('firehose', create_firehose,
+                    depends_on=['existing_firehose', 'bucket', 'kinesis_active', 'firehose_role',
+                                'transform_lambda'])
+    try:
+        provisioner.run()
+    except ProvisioningError as e:
+        logging.error(e)
+        exit(1)
 
-    # Put records into the Firehose stream
-    faker = Faker()
-    for i in range(1, 10):
-        json_data = {
-            "name":faker.name(),
-            "city":faker.city(),
-            "phone":faker.phone_number(),
-            "id":uuid.uuid4().__str__()
-        }
-        logging.info(json_data)
-        sleep(0.5)
-        put_response = kinesis_client.put_record(
-            StreamName=kinesis_name,
-            Data=json.dumps(json_data),
-            PartitionKey='name')
-        logging.info(put_response)
-        logging.info('Test data sent to Firehose stream')
-
+    # Put records into the Kinesis stream in PutRecords batches
+    generator = SyntheticRecordGenerator(seed=int(os.getenv("RECORD_SEED", "0")))
+    # Records are KPL-aggregated and the transform Lambda de-aggregates them,
+    # unless the output is partitioned: an aggregate is delivered to a single
+    # partition, so each record must then be sent on its own.
+    # Without a partition key the producer spreads them over the shards.
+    aggregate = not delivery_options['partition_keys']
+    with KinesisBatchProducer.for_stream(kinesis_client, kinesis_name, aggregate=aggregate) as producer:
+        for record in generator.records(int(os.getenv("RECORD_COUNT", "9"))):
+            logging.debug(record)
+            producer.put(record)
+    logging.info(f'Test data sent to Kinesis stream: {producer.stats.summary()}')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
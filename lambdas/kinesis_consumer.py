@@ -0,0 +1,377 @@
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+from kinesis_shards import list_shards
+from kpl_aggregation import deaggregate
+if typing.TYPE_CHECKING:
+    from mypy_boto3_kinesis import KinesisClient
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+logger = logging.getLogger(__name__)
+
+# GetRecords allows 5 calls per second per shard
+MIN_GET_RECORDS_INTERVAL = 0.2
+MAX_GET_RECORDS_LIMIT = 10000
+
+# Error codes after which the same call is tried again after a pause
+RETRYABLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'InternalFailure')
+
+
+class FileCheckpointStore:
+    """Checkpoints kept as a JSON document in a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self._checkpoints = json.load(file)
+
+    def get(self, application, shard_id):
+        with self._lock:
+            return self._checkpoints.get(f"{application}:{shard_id}")
+
+    def put(self, application, shard_id, sequence_number):
+        with self._lock:
+            self._checkpoints[f"{application}:{shard_id}"] = sequence_number
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(self._checkpoints, file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+
+class DynamoDBCheckpointStore:
+    """
+    Checkpoints kept in a DynamoDB table, one item per application and shard.
+
+    The table has a single string hash key, 'lease_key'. On LocalStack this
+    is the stand-in for the lease table the KCL keeps.
+    """
+
+    def __init__(self, dynamodb_client: "DynamoDBClient", table_name):
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    def create_table(self):
+        """Create the checkpoint table if it doesn't exist yet."""
+        try:
+            self.dynamodb_client.create_table(
+                TableName=self.table_name,
+                KeySchema=[{'AttributeName': 'lease_key', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'lease_key', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST')
+            self.dynamodb_client.get_waiter('table_exists').wait(TableName=self.table_name)
+            logger.info("Created checkpoint table %s.", self.table_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceInUseException':
+                logger.exception("Couldn't create checkpoint table %s.", self.table_name)
+                raise
+        return self
+
+    def get(self, application, shard_id):
+        response = self.dynamodb_client.get_item(
+            TableName=self.table_name, Key={'lease_key': {'S': f"{application}:{shard_id}"}},
+            ConsistentRead=True)
+        item = response.get('Item')
+        return item['checkpoint']['S'] if item else None
+
+    def put(self, application, shard_id, sequence_number):
+        self.dynamodb_client.put_item(TableName=self.table_name, Item={
+            'lease_key': {'S': f"{application}:{shard_id}"},
+            'checkpoint': {'S': sequence_number},
+            'updated_at': {'N': str(int(time.time()))},
+        })
+
+
+class ShardStats:
+    """What was read from one shard."""
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.records = 0
+        self.user_records = 0
+        self.bytes = 0
+        self.get_records_calls = 0
+        self.out_of_order = 0
+        self.millis_behind_latest = None
+        self.last_sequence_number = None
+
+
+class ConsumerStats:
+    """Totals across shards, used to report throughput and ordering."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.shards = {}
+
+    def summary(self):
+        """Return a dict summarising throughput and ordering per shard."""
+        elapsed = (self.finished or time.monotonic()) - self.started
+        user_records = sum(s.user_records for s in self.shards.values())
+        return {
+            'shards': len(self.shards),
+            'records': sum(s.records for s in self.shards.values()),
+            'user_records': user_records,
+            'bytes': sum(s.bytes for s in self.shards.values()),
+            'get_records_calls': sum(s.get_records_calls for s in self.shards.values()),
+            'out_of_order': sum(s.out_of_order for s in self.shards.values()),
+            'user_records_per_sec': round(user_records / elapsed, 1) if elapsed > 0 else 0.0,
+            'per_shard': {s.shard_id: s.user_records for s in self.shards.values()},
+        }
+
+
+class KinesisShardConsumer:
+    """
+    Reads every shard of a stream concurrently, one thread per shard.
+
+    Each shard is read with a GetShardIterator/GetRecords loop. Reading
+    resumes after the shard's checkpoint when there is one, otherwise starts
+    at start_timestamp (AT_TIMESTAMP) or at initial_position. KPL aggregated
+    records are split into their user records. After process() returns for a
+    batch, the batch's last sequence number is checkpointed, so a restarted
+    consumer continues with AFTER_SEQUENCE_NUMBER where the last one stopped.
+
+    Child shards from a reshard are only read once their parents are done,
+    which keeps per-key ordering across the reshard. Sequence numbers are
+    checked to increase within each shard and regressions are counted.
+    """
+
+    def __init__(self, kinesis_client: "KinesisClient", stream_name, checkpoint_store=None,
+                 application='verifier', initial_position='TRIM_HORIZON', start_timestamp=None,
+                 limit=MAX_GET_RECORDS_LIMIT, poll_interval=1.0, idle_seconds=5.0, max_workers=None,
+                 max_retries=5, backoff_base=0.1, backoff_max=5.0):
+        """
+        :param kinesis_client: The Boto3 Kinesis client object.
+        :param stream_name: Data stream name.
+        :param checkpoint_store: FileCheckpointStore, DynamoDBCheckpointStore or None.
+        :param application: Name checkpoints are kept under.
+        :param initial_position: 'TRIM_HORIZON' or 'LATEST', used without a checkpoint or timestamp.
+        :param start_timestamp: datetime or epoch seconds to read from with AT_TIMESTAMP.
+        :param limit: Maximum records per GetRecords call.
+        :param poll_interval: Pause after a GetRecords call that returned nothing.
+        :param idle_seconds: Stop reading an open shard after it has been caught up
+                             for this long. None reads until stop() is called.
+        :param max_workers: Shards read at once. Defaults to the number of shards.
+                            A child shard only takes a worker once its
+                            parents are done, so any value is safe.
+        :param max_retries: Throttled calls retried before the shard fails.
+        :param backoff_base: First retry delay ceiling in seconds.
+        :param backoff_max: Upper bound of the retry delay in seconds.
+        """
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.checkpoint_store = checkpoint_store
+        self.application = application
+        self.initial_position = initial_position
+        self.start_timestamp = start_timestamp
+        self.limit = min(limit, MAX_GET_RECORDS_LIMIT)
+        self.poll_interval = poll_interval
+        self.idle_seconds = idle_seconds
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = ConsumerStats()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Ask every shard reader to stop after its current batch."""
+        self._stopped.set()
+
+    def consume(self, process):
+        """Read all shards until they are closed and drained, idle, or stopped.
+
+        :param process: Function called as process(shard_id, records) with
+                        each batch. Records are dicts with Data, PartitionKey,
+                        SequenceNumber, SubSequenceNumber and
+                        ApproximateArrivalTimestamp.
+        :return: The ConsumerStats. Raises the first error of any shard.
+        """
+        shards = list_shards(self.kinesis_client, self.stream_name)
+        shard_ids = {shard['ShardId'] for shard in shards}
+        parents_left = {}
+        children = {}
+        for shard in shards:
+            parents = {shard.get('ParentShardId'), shard.get('AdjacentParentShardId')} & shard_ids
+            parents_left[shard['ShardId']] = len(parents)
+            for parent_id in parents:
+                children.setdefault(parent_id, []).append(shard)
+
+        self.stats = ConsumerStats()
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(shards) or 1) as executor:
+            running = {executor.submit(self._read_shard_or_stop, shard, process): shard['ShardId']
+                       for shard in shards if not parents_left[shard['ShardId']]}
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    shard_id = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    # A child is only submitted once all its parents are done,
+                    # so waiting children never hold workers their parents need
+                    for child in children.get(shard_id, []):
+                        parents_left[child['ShardId']] -= 1
+                        if not parents_left[child['ShardId']] and not self._stopped.is_set():
+                            running[executor.submit(self._read_shard_or_stop, child, process)] = child['ShardId']
+        self.stats.finished = time.monotonic()
+        logger.info("Consumer summary for %s: %s", self.stream_name, json.dumps(self.stats.summary()))
+        if errors:
+            raise errors[0]
+        return self.stats
+
+    def _read_shard_or_stop(self, shard, process):
+        try:
+            self._read_shard(shard, process)
+        except Exception:
+            logger.exception("Couldn't read shard %s.", shard['ShardId'])
+            self.stop()
+            raise
+
+    def _starting_iterator(self, shard_id):
+        kwargs = {'StreamName': self.stream_name, 'ShardId': shard_id}
+        checkpoint = self.checkpoint_store.get(self.application, shard_id) if self.checkpoint_store else None
+        if checkpoint is not None:
+            kwargs.update(ShardIteratorType='AFTER_SEQUENCE_NUMBER', StartingSequenceNumber=checkpoint)
+        elif self.start_timestamp is not None:
+            timestamp = self.start_timestamp
+            if not isinstance(timestamp, datetime.datetime):
+                timestamp = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+            kwargs.update(ShardIteratorType='AT_TIMESTAMP', Timestamp=timestamp)
+        else:
+            kwargs.update(ShardIteratorType=self.initial_position)
+        logger.info("Reading shard %s from %s.", shard_id, kwargs['ShardIteratorType'])
+        return self._call('get_shard_iterator', **kwargs)['ShardIterator']
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, operation, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return getattr(self.kinesis_client, operation)(**kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in RETRYABLE_ERROR_CODES or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+
+    def _read_shard(self, shard, process):
+        shard_id = shard['ShardId']
+        stats = self.stats.shards[shard_id] = ShardStats(shard_id)
+        iterator = self._starting_iterator(shard_id)
+        idle_since = None
+        last_call = 0.0
+        while iterator and not self._stopped.is_set():
+            delay = last_call + MIN_GET_RECORDS_INTERVAL - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            last_call = time.monotonic()
+            try:
+                response = self._call('get_records', ShardIterator=iterator, Limit=self.limit)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ExpiredIteratorException':
+                    raise
+                iterator = self._resume_iterator(shard_id, stats)
+                continue
+            stats.get_records_calls += 1
+            stats.millis_behind_latest = response.get('MillisBehindLatest')
+            iterator = response.get('NextShardIterator')
+            records = response['Records']
+            if records:
+                idle_since = None
+                batch = self._user_records(records, stats)
+                process(shard_id, batch)
+                stats.last_sequence_number = records[-1]['SequenceNumber']
+                if self.checkpoint_store is not None:
+                    self.checkpoint_store.put(self.application, shard_id, stats.last_sequence_number)
+                continue
+            if iterator is None:
+                break
+            if stats.millis_behind_latest == 0 or stats.millis_behind_latest is None:
+                idle_since = idle_since or time.monotonic()
+                if self.idle_seconds is not None and time.monotonic() - idle_since >= self.idle_seconds:
+                    break
+            time.sleep(self.poll_interval)
+        logger.info("Stopped reading shard %s after %d records.", shard_id, stats.user_records)
+
+    def _resume_iterator(self, shard_id, stats):
+        if stats.last_sequence_number is None:
+            return self._starting_iterator(shard_id)
+        return self._call('get_shard_iterator', StreamName=self.stream_name, ShardId=shard_id,
+                          ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+                          StartingSequenceNumber=stats.last_sequence_number)['ShardIterator']
+
+    @staticmethod
+    def _user_records(records, stats):
+        batch = []
+        for record in records:
+            sequence_number = record['SequenceNumber']
+            if (stats.last_sequence_number is not None
+                    and int(sequence_number) <= int(stats.last_sequence_number)):
+                stats.out_of_order += 1
+            stats.last_sequence_number = sequence_number
+            stats.records += 1
+            stats.bytes += len(record['Data'])
+            for sub_sequence, (data, partition_key, _) in enumerate(deaggregate(record['Data'])):
+                batch.append({
+                    'Data': data,
+                    'PartitionKey': partition_key or record['PartitionKey'],
+                    'SequenceNumber': sequence_number,
+                    'SubSequenceNumber': sub_sequence,
+                    'ApproximateArrivalTimestamp': record.get('ApproximateArrivalTimestamp'),
+                })
+        stats.user_records += len(batch)
+        return batch
+
+
+def main():
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description="Read a Kinesis stream back and report what was written.")
+    parser.add_argument('--stream', default='kinesis_test_stream')
+    parser.add_argument('--application', default='verifier')
+    parser.add_argument('--from-timestamp', type=float, help="Epoch seconds to start reading at")
+    parser.add_argument('--latest', action='store_true', help="Start at LATEST instead of TRIM_HORIZON")
+    parser.add_argument('--checkpoint-file', help="Keep checkpoints in this JSON file")
+    parser.add_argument('--dynamodb-table', help="Keep checkpoints in this DynamoDB table")
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+    checkpoint_store = None
+    if args.dynamodb_table:
+        checkpoint_store = DynamoDBCheckpointStore(aws_clients.get_client('dynamodb'),
+                                                   args.dynamodb_table).create_table()
+    elif args.checkpoint_file:
+        checkpoint_store = FileCheckpointStore(args.checkpoint_file)
+
+    consumer = KinesisShardConsumer(aws_clients.get_client('kinesis'), args.stream, checkpoint_store,
+                                    application=args.application,
+                                    initial_position='LATEST' if args.latest else 'TRIM_HORIZON',
+                                    start_timestamp=args.from_timestamp, idle_seconds=args.idle_seconds)
+    stats = consumer.consume(lambda shard_id, records: None)
+    print(json.dumps(stats.summary()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+
+import contextlib
+import logging
+import random
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from kinesis_shards import Partitioner, ShardMap, ShardRateLimiter
+from kpl_aggregation import DEFAULT_MAX_AGGREGATED_BYTES, RecordAggregator
+if typing.TYPE_CHECKING:
+    from mypy_boto3_kinesis import KinesisClient
+
+logger = logging.getLogger(__name__)
+
+# PutRecords service limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Error codes for which only the affected records are resent
+RETRYABLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'InternalFailure')
+
+
+class BatchResult:
+    """Outcome of a single PutRecords call."""
+
+    def __init__(self, record_count, byte_count, failed_count, latency, retried_count=0):
+        self.record_count = record_count
+        self.byte_count = byte_count
+        self.failed_count = failed_count
+        self.latency = latency
+        self.retried_count = retried_count
+
+    def __repr__(self):
+        return (f"BatchResult(records={self.record_count}, bytes={self.byte_count}, "
+                f"failed={self.failed_count}, retried={self.retried_count}, "
+                f"latency={self.latency * 1000:.1f}ms)")
+
+
+class ProducerStats:
+    """Running totals for a producer, used to report throughput."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = []
+        self.user_records = 0
+
+    def add(self, batch_result):
+        self.batches.append(batch_result)
+
+    @property
+    def records_sent(self):
+        return sum(b.record_count - b.failed_count for b in self.batches)
+
+    @property
+    def records_failed(self):
+        return sum(b.failed_count for b in self.batches)
+
+    @property
+    def records_retried(self):
+        return sum(b.retried_count for b in self.batches)
+
+    @property
+    def bytes_sent(self):
+        return sum(b.byte_count for b in self.batches)
+
+    def records_per_second(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.records_sent / elapsed
+
+    def user_records_per_second(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.user_records / elapsed
+
+    def summary(self):
+        """Return a dict summarising throughput and per-batch latency."""
+        latencies = sorted(b.latency for b in self.batches)
+        return {
+            'batches': len(self.batches),
+            'records_sent': self.records_sent,
+            'records_failed': self.records_failed,
+            'records_retried': self.records_retried,
+            'bytes_sent': self.bytes_sent,
+            'records_per_sec': round(self.records_per_second(), 1),
+            'user_records': self.user_records,
+            'user_records_per_sec': round(self.user_records_per_second(), 1),
+            'batch_latency_ms_avg': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'batch_latency_ms_max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+
+class KinesisBatchProducer:
+    """
+    Buffers records and writes them to a Kinesis data stream with PutRecords.
+
+    A batch is flushed when it reaches max_records, when adding a record would
+    exceed max_bytes, or when the oldest buffered record is older than
+    linger_seconds. Use the producer as a context manager, or call close(), so
+    the final partial batch is sent.
+
+    With a partitioner the producer knows which shard each record lands on:
+    records without a partition key are spread over the shards and, with a
+    rate limiter, writes are paced to the per-shard limits. Records rejected
+    with a retryable error in a PutRecords response are resent on their own
+    with jittered exponential backoff.
+
+    In aggregation mode many user records are packed into each Kinesis record
+    using the KPL aggregated-record format, one aggregate per target shard.
+    Consumers split them again with kpl_aggregation.deaggregate.
+
+    By default one PutRecords call is in flight at a time, which keeps the
+    records of a partition key in order but caps throughput at one round trip
+    per batch. With senders > 1 batches are sent concurrently and put()
+    blocks when that many batches are queued; records of the same partition
+    key may then be written out of order, as they can in concurrent batches
+    or after a retry.
+    """
+
+    def __init__(self, kinesis_client: "KinesisClient", stream_name,
+                 max_records=MAX_BATCH_RECORDS, max_bytes=MAX_BATCH_BYTES,
+                 linger_seconds=0.1, partitioner=None, rate_limiter=None,
+                 max_retries=5, backoff_base=0.05, backoff_max=2.0,
+                 aggregate=False, max_aggregated_bytes=DEFAULT_MAX_AGGREGATED_BYTES, senders=1):
+        """
+        :param kinesis_client: The Boto3 Kinesis client object.
+        :param stream_name: Data stream name.
+        :param max_records: Maximum records per PutRecords call (<= 500).
+        :param max_bytes: Maximum payload bytes per PutRecords call (<= 5 MB).
+        :param linger_seconds: Maximum time a record waits in the buffer.
+        :param partitioner: Optional Partitioner that assigns records to shards.
+        :param rate_limiter: Optional ShardRateLimiter. Requires a partitioner.
+        :param max_retries: Times a failed record is resent before it counts as failed.
+        :param backoff_base: First retry delay ceiling in seconds.
+        :param backoff_max: Upper bound of the retry delay in seconds.
+        :param aggregate: Pack user records into KPL aggregated records.
+        :param max_aggregated_bytes: Maximum size of one aggregated record.
+        :param senders: PutRecords calls in flight at once. More than one gives
+                        up ordering per partition key for throughput.
+        """
+        if rate_limiter is not None and partitioner is None:
+            raise ValueError("A rate limiter needs a partitioner to know the target shards")
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.max_records = min(max_records, MAX_BATCH_RECORDS)
+        self.max_bytes = min(max_bytes, MAX_BATCH_BYTES)
+        self.linger_seconds = linger_seconds
+        self.partitioner = partitioner
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.aggregate = aggregate
+        self.max_aggregated_bytes = min(max_aggregated_bytes, MAX_RECORD_BYTES)
+        self.stats = ProducerStats()
+
+        self._aggregators = {}
+        self._aggregate_started = None
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        if senders > 1:
+            self._send_lock = contextlib.nullcontext()
+            self._executor = ThreadPoolExecutor(max_workers=senders)
+            self._max_in_flight = senders * 2
+            self._in_flight = threading.BoundedSemaphore(self._max_in_flight)
+        else:
+            # Serialized sends keep the records of a partition key in order
+            self._send_lock = threading.Lock()
+            self._executor = None
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._linger_loop, daemon=True)
+        self._flusher.start()
+
+    @classmethod
+    def for_stream(cls, kinesis_client: "KinesisClient", stream_name,
+                   rate_limit=True, **kwargs):
+        """Create a shard-aware producer for the stream's current shards.
+
+        :param kinesis_client: The Boto3 Kinesis client object.
+        :param stream_name: Data stream name.
+        :param rate_limit: Pace writes to the per-shard throughput limits.
+        :return: The producer.
+        """
+        shard_map = ShardMap.from_stream(kinesis_client, stream_name)
+        return cls(kinesis_client, stream_name,
+                   partitioner=Partitioner(shard_map),
+                   rate_limiter=ShardRateLimiter() if rate_limit else None,
+                   **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, data, partition_key=None):
+        """Add one record to the buffer, flushing if the batch is full.
+
+        :param data: Record payload as bytes or str.
+        :param partition_key: Kinesis partition key for the record. May be None
+                              when the producer has a partitioner, in which
+                              case the record is spread over the shards.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        shard_id = explicit_hash_key = None
+        if self.partitioner is not None:
+            shard_id, explicit_hash_key = self.partitioner.assign(partition_key)
+            if explicit_hash_key is not None:
+                partition_key = shard_id
+        elif partition_key is None:
+            raise ValueError("partition_key is required without a partitioner")
+
+        if not self.aggregate:
+            self._enqueue(data, partition_key, explicit_hash_key, shard_id, user_records=1)
+            return
+
+        with self._lock:
+            self.stats.user_records += 1
+            aggregator = self._aggregators.get(shard_id)
+            if aggregator is None:
+                aggregator = self._aggregators[shard_id] = RecordAggregator(self.max_aggregated_bytes)
+            finished = aggregator.add(data, partition_key, explicit_hash_key)
+            if self._aggregate_started is None:
+                self._aggregate_started = time.monotonic()
+        if finished:
+            self._enqueue_aggregate(finished, shard_id)
+
+    def _enqueue_aggregate(self, aggregate, shard_id):
+        data, partition_key, _ = aggregate
+        explicit_hash_key = None
+        if self.partitioner is not None:
+            # Route the aggregate to the shard all its user records belong to
+            explicit_hash_key = self.partitioner.explicit_hash_key_for(shard_id)
+        self._enqueue(data, partition_key, explicit_hash_key, shard_id)
+
+    def _drain_aggregators(self):
+        with self._lock:
+            finished = [(aggregator.flush(), shard_id)
+                        for shard_id, aggregator in self._aggregators.items() if len(aggregator)]
+            self._aggregate_started = None
+        for aggregate, shard_id in finished:
+            self._enqueue_aggregate(aggregate, shard_id)
+
+    def _enqueue(self, data, partition_key, explicit_hash_key, shard_id, user_records=0):
+        entry = {'Data': data, 'PartitionKey': partition_key}
+        if explicit_hash_key is not None:
+            entry['ExplicitHashKey'] = explicit_hash_key
+        record_bytes = len(data) + len(partition_key.encode('utf-8'))
+        if record_bytes > MAX_RECORD_BYTES:
+            raise ValueError(f"Record of {record_bytes} bytes exceeds the 1 MB Kinesis limit")
+
+        batch = None
+        with self._lock:
+            # put() may run on several threads, so the count is kept under the lock
+            self.stats.user_records += user_records
+            if self._buffer and self._buffer_bytes + record_bytes > self.max_bytes:
+                batch = self._take_buffer()
+            self._buffer.append((entry, shard_id, record_bytes))
+            self._buffer_bytes += record_bytes
+            if self._buffer_started is None:
+                self._buffer_started = time.monotonic()
+            if batch is None and len(self._buffer) >= self.max_records:
+                batch = self._take_buffer()
+        if batch:
+            self._dispatch(batch)
+
+    def flush(self):
+        """Send whatever is currently buffered, including partial aggregates,
+        and wait for every queued batch."""
+        if self.aggregate:
+            self._drain_aggregators()
+        with self._lock:
+            batch = self._take_buffer()
+        if batch:
+            self._dispatch(batch)
+        if self._executor is not None:
+            # Holding every slot means no batch is queued or being sent
+            for _ in range(self._max_in_flight):
+                self._in_flight.acquire()
+            for _ in range(self._max_in_flight):
+                self._in_flight.release()
+
+    def close(self):
+        """Flush the buffer, stop the linger thread and senders and log a summary."""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        logger.info("Producer summary for %s: %s", self.stream_name, self.stats.summary())
+
+    def _take_buffer(self):
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        return batch
+
+    def _linger_loop(self):
+        interval = max(self.linger_seconds / 4, 0.005)
+        while not self._closed.wait(interval):
+            if (self._aggregate_started is not None
+                    and time.monotonic() - self._aggregate_started >= self.linger_seconds):
+                self._drain_aggregators()
+            batch = None
+            with self._lock:
+                if (self._buffer_started is not None
+                        and time.monotonic() - self._buffer_started >= self.linger_seconds):
+                    batch = self._take_buffer()
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        if self._executor is None:
+            self._send(batch)
+            return
+        # Blocks while the senders are saturated, pushing back on put()
+        self._in_flight.acquire()
+        future = self._executor.submit(self._send, batch)
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+    def _backoff(self, attempt):
+        # Full jitter: spread retries of concurrent producers over the window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _acquire_throughput(self, pending):
+        per_shard = {}
+        for _, shard_id, record_bytes in pending:
+            byte_count, record_count = per_shard.get(shard_id, (0, 0))
+            per_shard[shard_id] = (byte_count + record_bytes, record_count + 1)
+        for shard_id, (byte_count, record_count) in per_shard.items():
+            self.rate_limiter.acquire(shard_id, byte_count, record_count)
+
+    def _send(self, batch):
+        byte_count = sum(record_bytes for _, _, record_bytes in batch)
+        failed_count = 0
+        retried_count = 0
+        start = time.monotonic()
+        with self._send_lock:
+            pending = batch
+            attempt = 0
+            while pending:
+                if self.rate_limiter is not None:
+                    self._acquire_throughput(pending)
+                try:
+                    response = self.kinesis_client.put_records(
+                        StreamName=self.stream_name,
+                        Records=[entry for entry, _, _ in pending])
+                except ClientError as e:
+                    if (e.response['Error']['Code'] in RETRYABLE_ERROR_CODES
+                            and attempt < self.max_retries):
+                        attempt += 1
+                        retried_count += len(pending)
+                        time.sleep(self._backoff(attempt))
+                        continue
+                    logger.error(e)
+                    failed_count += len(pending)
+                    break
+
+                retry = []
+                for record, record_result in zip(pending, response['Records']):
+                    error_code = record_result.get('ErrorCode')
+                    if error_code is None:
+                        continue
+                    if error_code in RETRYABLE_ERROR_CODES:
+                        retry.append(record)
+                    else:
+                        logger.error("Record rejected by %s: %s %s", self.stream_name,
+                                     error_code, record_result.get('ErrorMessage'))
+                        failed_count += 1
+                if retry and attempt >= self.max_retries:
+                    failed_count += len(retry)
+                    break
+                if retry:
+                    attempt += 1
+                    retried_count += len(retry)
+                    time.sleep(self._backoff(attempt))
+                pending = retry
+        result = BatchResult(len(batch), byte_count, failed_count,
+                             time.monotonic() - start, retried_count)
+        self.stats.add(result)
+        logger.debug("Sent batch to %s: %s", self.stream_name, result)
+        if failed_count:
+            logger.warning("%d of %d records failed in PutRecords to %s",
+                           failed_count, len(batch), self.stream_name)
+        return result
@@ -0,0 +1,185 @@
+
+import bisect
+import hashlib
+import itertools
+import logging
+import threading
+import time
+import typing
+
+from botocore.exceptions import ClientError
+if typing.TYPE_CHECKING:
+    from mypy_boto3_kinesis import KinesisClient
+
+logger = logging.getLogger(__name__)
+
+# Per-shard write limits
+SHARD_BYTES_PER_SECOND = 1024 * 1024
+SHARD_RECORDS_PER_SECOND = 1000
+
+
+def hash_key_for_partition_key(partition_key):
+    """Return the 128-bit hash key Kinesis derives from a partition key."""
+    return int(hashlib.md5(partition_key.encode('utf-8')).hexdigest(), 16)
+
+
+def list_shards(kinesis_client: "KinesisClient", stream_name):
+    """List every shard of a stream, open or closed.
+
+    :param kinesis_client: The Boto3 Kinesis client object.
+    :param stream_name: Data stream name.
+    :return: Shard dicts as returned by ListShards. Raises ClientError if the
+             shards can't be listed.
+    """
+    shards = []
+    kwargs = {'StreamName': stream_name}
+    while True:
+        try:
+            result = kinesis_client.list_shards(**kwargs)
+        except ClientError:
+            logger.exception("Couldn't list shards of %s.", stream_name)
+            raise
+        shards.extend(result['Shards'])
+        if 'NextToken' not in result:
+            break
+        kwargs = {'NextToken': result['NextToken']}
+    logger.info("Stream %s has %d shards.", stream_name, len(shards))
+    return shards
+
+
+class ShardMap:
+    """The open shards of a stream, ordered by their hash key ranges."""
+
+    def __init__(self, shards):
+        """
+        :param shards: Shard dicts as returned by ListShards.
+        """
+        open_shards = [s for s in shards
+                       if 'EndingSequenceNumber' not in s.get('SequenceNumberRange', {})]
+        open_shards.sort(key=lambda s: int(s['HashKeyRange']['StartingHashKey']))
+        if not open_shards:
+            raise ValueError("Stream has no open shards")
+        self.shard_ids = [s['ShardId'] for s in open_shards]
+        self.starting_keys = [int(s['HashKeyRange']['StartingHashKey']) for s in open_shards]
+        self.ending_keys = [int(s['HashKeyRange']['EndingHashKey']) for s in open_shards]
+
+    @classmethod
+    def from_stream(cls, kinesis_client: "KinesisClient", stream_name):
+        """Build the map from the stream's current shard list.
+
+        :param kinesis_client: The Boto3 Kinesis client object.
+        :param stream_name: Data stream name.
+        :return: The shard map. Raises ClientError if the shards can't be listed.
+        """
+        return cls(list_shards(kinesis_client, stream_name))
+
+    def __len__(self):
+        return len(self.shard_ids)
+
+    def shard_for_hash_key(self, hash_key):
+        """Return the id of the shard whose hash key range contains hash_key."""
+        index = bisect.bisect_right(self.starting_keys, hash_key) - 1
+        return self.shard_ids[max(index, 0)]
+
+    def midpoint_hash_key(self, index):
+        """Return the hash key in the middle of the index-th shard's range."""
+        return (self.starting_keys[index] + self.ending_keys[index]) // 2
+
+
+class Partitioner:
+    """
+    Assigns records to shards.
+
+    Records with a meaningful partition key are routed by its MD5 hash, as
+    Kinesis itself does. Records without one are spread round-robin over the
+    shards with an explicit hash key, so a constant key can't pin all traffic
+    to one hot shard.
+    """
+
+    def __init__(self, shard_map):
+        self.shard_map = shard_map
+        self._next_shard = itertools.cycle(range(len(shard_map)))
+        self._lock = threading.Lock()
+
+    def assign(self, partition_key=None):
+        """Route one record.
+
+        :param partition_key: The record's partition key, or None to round-robin.
+        :return: Tuple of (shard id, explicit hash key or None).
+        """
+        if partition_key is not None:
+            hash_key = hash_key_for_partition_key(partition_key)
+            return self.shard_map.shard_for_hash_key(hash_key), None
+        with self._lock:
+            index = next(self._next_shard)
+        return self.shard_map.shard_ids[index], str(self.shard_map.midpoint_hash_key(index))
+
+    def explicit_hash_key_for(self, shard_id):
+        """Return an explicit hash key that routes a record to shard_id."""
+        return str(self.shard_map.midpoint_hash_key(self.shard_map.shard_ids.index(shard_id)))
+
+
+class TokenBucket:
+    """A thread-safe token bucket that blocks until enough tokens are available.
+
+    Requests larger than the bucket capacity are admitted once the bucket is
+    full and leave it in debt, so oversized batches are slowed down rather
+    than rejected.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Tokens added per second.
+        :param capacity: Maximum tokens held. Defaults to one second of rate.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Take amount tokens, sleeping until they are available.
+
+        :return: Seconds spent waiting.
+        """
+        waited = 0.0
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ShardRateLimiter:
+    """Keeps writes to each shard under the per-shard byte and record limits."""
+
+    def __init__(self, bytes_per_second=SHARD_BYTES_PER_SECOND,
+                 records_per_second=SHARD_RECORDS_PER_SECOND):
+        self.bytes_per_second = bytes_per_second
+        self.records_per_second = records_per_second
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, shard_id):
+        with self._lock:
+            if shard_id not in self._buckets:
+                self._buckets[shard_id] = (TokenBucket(self.bytes_per_second),
+                                           TokenBucket(self.records_per_second))
+            return self._buckets[shard_id]
+
+    def acquire(self, shard_id, byte_count, record_count=1):
+        """Block until shard_id can take byte_count bytes in record_count records.
+
+        :return: Seconds spent waiting.
+        """
+        byte_bucket, record_bucket = self._buckets_for(shard_id)
+        return byte_bucket.acquire(byte_count) + record_bucket.acquire(record_count)
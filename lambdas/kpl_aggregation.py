@@ -0,0 +1,269 @@
+
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# An aggregated record is MAGIC + AggregatedRecord protobuf + MD5(protobuf).
+# This is the wire format written by the Kinesis Producer Library (KPL):
+#
+#   message AggregatedRecord {
+#     repeated string partition_key_table     = 1;
+#     repeated string explicit_hash_key_table = 2;
+#     repeated Record records                 = 3;
+#   }
+#   message Record {
+#     required uint64 partition_key_index     = 1;
+#     optional uint64 explicit_hash_key_index = 2;
+#     required bytes  data                    = 3;
+#     repeated Tag    tags                    = 4;
+#   }
+MAGIC = b'\xf3\x89\x9a\xc2'
+DIGEST_SIZE = 16
+
+# Same default as the KPL AggregationMaxSize setting
+DEFAULT_MAX_AGGREGATED_BYTES = 51200
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH_DELIMITED = 2
+_WIRE_FIXED32 = 5
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _varint_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _decode_varint(buffer, pos):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buffer):
+            raise ValueError("Truncated varint")
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _length_delimited(field_number, payload):
+    return _encode_varint(field_number << 3 | _WIRE_LENGTH_DELIMITED) + _encode_varint(len(payload)) + payload
+
+
+def _length_delimited_size(payload_size):
+    # All field numbers used here are < 16, so every key fits in one byte
+    return 1 + _varint_size(payload_size) + payload_size
+
+
+def _iter_fields(buffer):
+    """Yield (field_number, wire_type, value) for each field of a protobuf message."""
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        key, pos = _decode_varint(buffer, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == _WIRE_VARINT:
+            value, pos = _decode_varint(buffer, pos)
+        elif wire_type == _WIRE_LENGTH_DELIMITED:
+            length, pos = _decode_varint(buffer, pos)
+            if pos + length > end:
+                raise ValueError("Truncated length-delimited field")
+            value = buffer[pos:pos + length]
+            pos += length
+        elif wire_type in (_WIRE_FIXED64, _WIRE_FIXED32):
+            length = 8 if wire_type == _WIRE_FIXED64 else 4
+            if pos + length > end:
+                raise ValueError("Truncated fixed-width field")
+            value = buffer[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        yield field_number, wire_type, value
+
+
+class RecordAggregator:
+    """
+    Packs user records into KPL aggregated records.
+
+    Records are added one at a time. When a record doesn't fit in the current
+    aggregate, the current aggregate is returned as a finished Kinesis record
+    and a new one is started with the record that didn't fit.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_AGGREGATED_BYTES):
+        """
+        :param max_bytes: Maximum size of an aggregated record, including the
+                          magic bytes, the digest and the partition key.
+        """
+        self.max_bytes = max_bytes
+        self._reset()
+
+    def _reset(self):
+        self._partition_keys = {}
+        self._explicit_hash_keys = {}
+        self._records = []
+        self._size = len(MAGIC) + DIGEST_SIZE
+
+    def __len__(self):
+        return len(self._records)
+
+    def _added_size(self, data, partition_key, explicit_hash_key):
+        size = 0
+        pk_index = self._partition_keys.get(partition_key)
+        if pk_index is None:
+            pk_index = len(self._partition_keys)
+            size += _length_delimited_size(len(partition_key.encode('utf-8')))
+        record_size = 1 + _varint_size(pk_index) + _length_delimited_size(len(data))
+        if explicit_hash_key is not None:
+            ehk_index = self._explicit_hash_keys.get(explicit_hash_key)
+            if ehk_index is None:
+                ehk_index = len(self._explicit_hash_keys)
+                size += _length_delimited_size(len(explicit_hash_key))
+            record_size += 1 + _varint_size(ehk_index)
+        return size + _length_delimited_size(record_size)
+
+    def add(self, data, partition_key, explicit_hash_key=None):
+        """Add a user record.
+
+        :param data: Record payload as bytes or str.
+        :param partition_key: The user record's partition key.
+        :param explicit_hash_key: Optional explicit hash key of the user record.
+        :return: A finished aggregated record as (data, partition_key,
+                 explicit_hash_key) if this record started a new aggregate,
+                 otherwise None.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        finished = None
+        added = self._added_size(data, partition_key, explicit_hash_key)
+        if self._records and self._size + added + len(self._first_partition_key()) > self.max_bytes:
+            finished = self.flush()
+            added = self._added_size(data, partition_key, explicit_hash_key)
+        if self._size + added + len(partition_key.encode('utf-8')) > self.max_bytes:
+            raise ValueError(f"Record of {len(data)} bytes doesn't fit in an aggregated record")
+
+        pk_index = self._partition_keys.setdefault(partition_key, len(self._partition_keys))
+        ehk_index = None
+        if explicit_hash_key is not None:
+            ehk_index = self._explicit_hash_keys.setdefault(explicit_hash_key,
+                                                            len(self._explicit_hash_keys))
+        self._records.append((pk_index, ehk_index, data))
+        self._size += added
+        return finished
+
+    def _first_partition_key(self):
+        return next(iter(self._partition_keys)).encode('utf-8')
+
+    def flush(self):
+        """Finish the current aggregate.
+
+        :return: (data, partition_key, explicit_hash_key) of the aggregated
+                 record, or None if no records were added.
+        """
+        if not self._records:
+            return None
+        message = bytearray()
+        for key in self._partition_keys:
+            message += _length_delimited(1, key.encode('utf-8'))
+        for key in self._explicit_hash_keys:
+            message += _length_delimited(2, key.encode('utf-8'))
+        for pk_index, ehk_index, data in self._records:
+            record = _encode_varint(1 << 3 | _WIRE_VARINT) + _encode_varint(pk_index)
+            if ehk_index is not None:
+                record += _encode_varint(2 << 3 | _WIRE_VARINT) + _encode_varint(ehk_index)
+            record += _length_delimited(3, data)
+            message += _length_delimited(3, record)
+        message = bytes(message)
+
+        partition_key = next(iter(self._partition_keys))
+        explicit_hash_key = next(iter(self._explicit_hash_keys), None)
+        self._reset()
+        return MAGIC + message + hashlib.md5(message).digest(), partition_key, explicit_hash_key
+
+
+def is_aggregated(data):
+    """Return True if data is a well-formed KPL aggregated record."""
+    if len(data) <= len(MAGIC) + DIGEST_SIZE or not data.startswith(MAGIC):
+        return False
+    message = data[len(MAGIC):-DIGEST_SIZE]
+    return hashlib.md5(message).digest() == data[-DIGEST_SIZE:]
+
+
+def _expect_wire_type(field_number, wire_type, expected):
+    if wire_type != expected:
+        raise ValueError(f"Field {field_number} has wire type {wire_type}, expected {expected}")
+
+
+def _table_entry(table, index, name):
+    if index is None:
+        return None
+    if index >= len(table):
+        raise ValueError(f"{name} index {index} is out of range for a table of {len(table)}")
+    return table[index]
+
+
+def deaggregate(data):
+    """Split a Kinesis record into its user records.
+
+    Records that are not KPL aggregated records are returned unchanged, so
+    consumers can call this on every record regardless of how it was produced.
+
+    :param data: The Kinesis record payload as bytes.
+    :return: List of (data, partition_key, explicit_hash_key) tuples. The keys
+             are None for records that were not aggregated. Raises ValueError
+             for an aggregate that has a valid digest but is malformed.
+    """
+    if not is_aggregated(data):
+        return [(data, None, None)]
+
+    message = data[len(MAGIC):-DIGEST_SIZE]
+    partition_keys = []
+    explicit_hash_keys = []
+    raw_records = []
+    for field_number, wire_type, value in _iter_fields(message):
+        if field_number in (1, 2, 3):
+            _expect_wire_type(field_number, wire_type, _WIRE_LENGTH_DELIMITED)
+        if field_number == 1:
+            partition_keys.append(value.decode('utf-8'))
+        elif field_number == 2:
+            explicit_hash_keys.append(value.decode('utf-8'))
+        elif field_number == 3:
+            raw_records.append(value)
+
+    records = []
+    for raw_record in raw_records:
+        pk_index = ehk_index = None
+        record_data = b''
+        for field_number, wire_type, value in _iter_fields(raw_record):
+            if field_number in (1, 2):
+                _expect_wire_type(field_number, wire_type, _WIRE_VARINT)
+            elif field_number == 3:
+                _expect_wire_type(field_number, wire_type, _WIRE_LENGTH_DELIMITED)
+            if field_number == 1:
+                pk_index = value
+            elif field_number == 2:
+                ehk_index = value
+            elif field_number == 3:
+                record_data = value
+        records.append((record_data,
+                        _table_entry(partition_keys, pk_index, 'Partition key'),
+                        _table_entry(explicit_hash_keys, ehk_index, 'Explicit hash key')))
+    return records
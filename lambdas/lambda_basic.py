@@ -1,15 +1,20 @@
+import hashlib
 import io
 import json
 import logging
 import os
+import secrets
+import sys
 import time
 import zipfile
-import boto3
 import typing
 import base64 
 import uuid
+import aws_clients
 import s3_basic as s3_helper
 import ssm_basic as ssm_helper
+from provisioner import Provisioner
+from waiters import WaiterError, status_check, wait_until
 from botocore.exceptions import ClientError
 if typing.TYPE_CHECKING:
     from mypy_boto3_s3 import S3Client
@@ -20,32 +25,103 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 
-s3: "S3Client" = boto3.resource(
-    "s3", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1'
-)
-lambda_client: "LambdaClient" = boto3.client(
-    "lambda", endpoint_url="http://localhost.localstack.cloud:4566"
-)
-iam_resource: "IAMClient" = boto3.resource(
-    "iam", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
-)
+s3: "S3Client" = aws_clients.lazy_resource("s3")
+lambda_client: "LambdaClient" = aws_clients.lazy_client("lambda")
+iam_resource: "IAMClient" = aws_clients.lazy_resource("iam")
 logger = logging.getLogger(__name__)
 
+# Pinned requirements of the demo function, deployed as a layer if set
+REQUIREMENTS_FILE = os.getenv("LAMBDA_REQUIREMENTS_FILE")
 
-def create_lambda_deployment_package(function_file_name):
+# Built packages, keyed by the hash of their input files
+PACKAGE_CACHE_DIR = os.getenv(
+    "LAMBDA_PACKAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lambda-package-cache"))
+
+# Runtime of the functions and compatible runtime of their layers
+LAMBDA_RUNTIME = 'python3.11'
+
+# Fixed metadata so the same sources always produce byte-identical archives
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_ZIP_FILE_MODE = 0o100644 << 16
+
+
+def create_lambda_deployment_package(function_file_name, *module_file_names):
     """
     Creates a Lambda deployment package in ZIP format in an in-memory buffer. This
     buffer can be passed directly to AWS Lambda when creating the function.
 
+    The archive is deterministic: entries are sorted and carry fixed timestamps
+    and permissions, so unchanged sources give an unchanged package and
+    CodeSha256. Packages are cached on disk by the hash of their sources and
+    are only rebuilt when a source file changes.
+
     :param function_file_name: The name of the file that contains the Lambda handler
                                function.
+    :param module_file_names: Names of helper module files the handler imports.
     :return: The deployment package.
     """
+    sources = {}
+    for file_name in sorted({function_file_name, *module_file_names}):
+        with open(file_name, 'rb') as source_file:
+            sources[file_name] = source_file.read()
+
+    digest = hashlib.sha256()
+    for file_name, content in sources.items():
+        digest.update(file_name.encode('utf-8') + b'\0' + hashlib.sha256(content).digest())
+    cache_path = os.path.join(PACKAGE_CACHE_DIR, f"{digest.hexdigest()}.zip")
+    if os.path.exists(cache_path):
+        logger.info("Using cached package %s for %s.", cache_path, function_file_name)
+        with open(cache_path, 'rb') as cached:
+            return cached.read()
+
+    package = create_deterministic_zip(sources)
+    cache_package(cache_path, package)
+    return package
+
+
+def create_deterministic_zip(entries):
+    """
+    Zips files so that the same contents always give the same archive bytes.
+
+    :param entries: Dict of archive path to file contents in bytes.
+    :return: The archive in ZIP format.
+    """
     buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, 'w') as zipped:
-        zipped.write(function_file_name)
-    buffer.seek(0)
-    return buffer.read()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipped:
+        for file_name in sorted(entries):
+            info = zipfile.ZipInfo(file_name, date_time=_ZIP_DATE_TIME)
+            info.external_attr = _ZIP_FILE_MODE
+            info.create_system = 3
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zipped.writestr(info, entries[file_name])
+    return buffer.getvalue()
+
+
+def cache_package(cache_path, package):
+    """
+    Stores a built package in the package cache. Failing to cache is not an error.
+
+    :param cache_path: Path of the cached file.
+    :param package: The package in ZIP format.
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as cached:
+            cached.write(package)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        logger.warning("Couldn't cache package %s.", cache_path, exc_info=True)
+
+
+def package_code_sha256(deployment_package):
+    """
+    Returns the CodeSha256 AWS Lambda reports for a deployment package.
+
+    :param deployment_package: The deployment package in ZIP format.
+    :return: The base64-encoded SHA-256 digest of the package.
+    """
+    return base64.b64encode(hashlib.sha256(deployment_package).digest()).decode('ascii')
 
 
 def create_iam_role_for_lambda(iam_resource, iam_role_name):
@@ -76,7 +152,8 @@ def create_iam_role_for_lambda(iam_resource, iam_role_name):
         role = iam_resource.create_role(
             RoleName=iam_role_name,
             AssumeRolePolicyDocument=json.dumps(lambda_assume_role_policy))
-        iam_resource.meta.client.get_waiter('role_exists').wait(RoleName=iam_role_name)
+        wait_until(lambda: _role_exists(iam_resource, iam_role_name), timeout=60,
+                   description=f"IAM role {iam_role_name}")
 
         logger.info("Created role %s.", role.name)
 
@@ -95,8 +172,42 @@ def create_iam_role_for_lambda(iam_resource, iam_role_name):
     return role
 
 
+def _role_exists(iam_resource, iam_role_name):
+    try:
+        iam_resource.meta.client.get_role(RoleName=iam_role_name)
+    except ClientError as error:
+        if error.response['Error']['Code'] == 'NoSuchEntity':
+            return False
+        raise
+    return True
+
+
+def wait_for_active_lambda_function(lambda_client, function_name, timeout=120):
+    """
+    Waits until an AWS Lambda function is Active, polling with backoff that
+    starts in milliseconds.
+
+    :param lambda_client: The Boto3 AWS Lambda client object.
+    :param function_name: The name of the function.
+    :param timeout: Seconds to wait before giving up.
+    :return: True when the function is active; otherwise, False.
+    """
+    def get_state():
+        configuration = lambda_client.get_function_configuration(FunctionName=function_name)
+        return configuration.get('State', 'Active')
+    try:
+        wait_until(status_check(get_state, ready='Active', failed=('Failed', 'Inactive'),
+                                description=f"Function {function_name}"),
+                   timeout=timeout, description=f"Function {function_name}")
+    except (ClientError, WaiterError):
+        logger.exception("Function %s did not become active.", function_name)
+        return False
+    return True
+
+
 def deploy_lambda_function(
-        lambda_client, function_name, handler_name, iam_role, deployment_package):
+        lambda_client, function_name, handler_name, iam_role, deployment_package,
+        environment=None, layers=None, requirements_file=None):
     """
     Deploys the AWS Lambda function.
 
@@ -107,15 +218,46 @@ def deploy_lambda_function(
     :param iam_role: The IAM role to use for the function.
     :param deployment_package: The deployment package that contains the function
                                code in ZIP format.
+    :param environment: Optional dict of environment variables for the function.
+    :param layers: Optional list of layer version ARNs, e.g. from
+                   lambda_layers.get_or_publish_layer, holding the function's
+                   third-party dependencies.
+    :param requirements_file: Optional pinned requirements file. Its layer,
+                              '<function_name>-dependencies', is published
+                              if no version with the same contents exists,
+                              and attached after `layers`.
     :return: The Amazon Resource Name (ARN) of the newly created function.
+
+    If the function already exists it is not created again: its CodeSha256 is
+    compared with the package's and the code is only uploaded when it changed.
+    A changed handler, role, environment or layer list is applied with one
+    configuration update.
     """
+    if requirements_file is not None:
+        # lambda_layers builds on this module's packaging helpers
+        from lambda_layers import get_or_publish_layer
+        layer_arn = get_or_publish_layer(lambda_client, f'{function_name}-dependencies', requirements_file)
+        layers = [*(layers or []), layer_arn]
+    try:
+        existing = lambda_client.get_function(FunctionName=function_name)['Configuration']
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ResourceNotFoundException':
+            logger.exception("Couldn't get function %s.", function_name)
+            raise
+        existing = None
+    if existing is not None:
+        return _update_lambda_function(lambda_client, existing, handler_name, iam_role, deployment_package,
+                                       environment, layers)
+
     try:
         response = lambda_client.create_function(
             FunctionName=function_name,
-            Runtime='python3.11',
+            Runtime=LAMBDA_RUNTIME,
             Role=iam_role.arn,
             Handler=handler_name,
             Code={'ZipFile': deployment_package},
+            Environment={'Variables': environment or {}},
+            Layers=list(layers or []),
             Publish=True)
         function_arn = response['FunctionArn']
         logger.info("Created function '%s' with ARN: '%s'.",
@@ -127,6 +269,55 @@ def deploy_lambda_function(
         return function_arn
 
 
+def wait_for_lambda_update(lambda_client, function_name, timeout=120):
+    """
+    Waits until the last code or configuration update of a function is applied.
+
+    :param lambda_client: The Boto3 AWS Lambda client object.
+    :param function_name: The name of the function.
+    :param timeout: Seconds to wait before giving up.
+    """
+    def get_update_status():
+        configuration = lambda_client.get_function_configuration(FunctionName=function_name)
+        return configuration.get('LastUpdateStatus', 'Successful')
+    wait_until(status_check(get_update_status, ready='Successful', failed=('Failed',),
+                            description=f"Update of function {function_name}"),
+               timeout=timeout, description=f"Update of function {function_name}")
+
+
+def _update_lambda_function(lambda_client, configuration, handler_name, iam_role, deployment_package,
+                            environment, layers):
+    function_name = configuration['FunctionName']
+    function_arn = configuration['FunctionArn']
+    try:
+        if configuration.get('CodeSha256') == package_code_sha256(deployment_package):
+            logger.info("Function '%s' code is unchanged; skipping upload.", function_name)
+        else:
+            lambda_client.update_function_code(
+                FunctionName=function_name, ZipFile=deployment_package, Publish=True)
+            logger.info("Updated code of function '%s'.", function_name)
+            wait_for_lambda_update(lambda_client, function_name)
+        changes = {}
+        if configuration.get('Handler') != handler_name:
+            changes['Handler'] = handler_name
+        if configuration.get('Role') != iam_role.arn:
+            changes['Role'] = iam_role.arn
+        current_environment = configuration.get('Environment', {}).get('Variables', {})
+        if environment is not None and environment != current_environment:
+            changes['Environment'] = {'Variables': environment}
+        current_layers = [layer['Arn'] for layer in configuration.get('Layers', [])]
+        if layers is not None and list(layers) != current_layers:
+            changes['Layers'] = list(layers)
+        if changes:
+            lambda_client.update_function_configuration(FunctionName=function_name, **changes)
+            logger.info("Updated %s of function '%s'.", ' and '.join(sorted(changes)), function_name)
+            wait_for_lambda_update(lambda_client, function_name)
+    except (ClientError, WaiterError):
+        logger.exception("Couldn't update function %s.", function_name)
+        raise
+    return function_arn
+
+
 def delete_lambda_function(lambda_client, function_name):
     """
     Deletes an AWS Lambda function.
@@ -155,6 +346,50 @@ def create_lambda_url_config_function(lambda_client, function_name):
         raise
     return response
 
+def add_s3_upload_notification(lambda_client, function_name, function_arn, bucket_name):
+    """
+    Makes S3 invoke an AWS Lambda function for every object created in a bucket.
+
+    :param lambda_client: The Boto3 AWS Lambda client object.
+    :param function_name: The name of the function to notify.
+    :param function_arn: The ARN of the function to notify.
+    :param bucket_name: The bucket whose ObjectCreated events are sent.
+    """
+    try:
+        lambda_client.add_permission(
+            FunctionName=function_name,
+            StatementId=f's3-upload-notification-{bucket_name}',
+            Action='lambda:InvokeFunction',
+            Principal='s3.amazonaws.com',
+            SourceArn=f'arn:aws:s3:::{bucket_name}')
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ResourceConflictException':
+            logger.exception("Couldn't allow S3 to invoke function %s.", function_name)
+            raise
+    try:
+        s3.meta.client.put_bucket_notification_configuration(
+            Bucket=bucket_name,
+            NotificationConfiguration={'LambdaFunctionConfigurations': [
+                {'LambdaFunctionArn': function_arn, 'Events': ['s3:ObjectCreated:*']}]})
+        logger.info("Bucket %s notifies function %s of new objects.", bucket_name, function_name)
+    except ClientError:
+        logger.exception("Couldn't add the notification of bucket %s.", bucket_name)
+        raise
+
+def ensure_upload_token(parameter_name):
+    """
+    Creates the token that function URL callers send to get a presigned
+    upload, unless it already exists.
+
+    :param parameter_name: The SSM SecureString parameter holding the token.
+    :return: The SSM parameter name.
+    """
+    if ssm_helper.get_parameter(parameter_name, use_cache=False) is None:
+        if ssm_helper.put_parameter(parameter_name, secrets.token_urlsafe(32), 'SecureString') is None:
+            raise RuntimeError(f"Couldn't create the upload token parameter {parameter_name}")
+        logger.info("Created the upload token in parameter %s.", parameter_name)
+    return parameter_name
+
 def invoke_lambda_function(lambda_client, function_name, function_params):
     """
     Invokes an AWS Lambda function.
@@ -188,19 +423,38 @@ def usage_demo():
     lambda_role_name = 'lambda-role'
     lambda_function_name = 'upload-image-to-s3'
     s3_bucket_name = 'localstack-poc-upload-images'
-
-    s3_helper.create_and_delete_my_bucket(s3_bucket_name, 1)
-
-    ssm_helper.put_parameter('/localstack-poc-upload-images/buckets/images', s3_bucket_name, 'String')
+    upload_token_parameter = '/localstack-poc-upload-images/upload-token'
 
     logger.info(f"Creating AWS Lambda function {lambda_function_name} from the "
           f"{lambda_handler_name} function in {lambda_function_filename}...")
-    
-    deployment_package = create_lambda_deployment_package(lambda_function_filename)
-    iam_role = create_iam_role_for_lambda(iam_resource, lambda_role_name)
 
-    deploy_lambda_function(lambda_client, lambda_function_name,lambda_handler_name, iam_role, deployment_package )
-    lambda_client.get_waiter("function_active").wait(FunctionName=lambda_function_name)
+    def deploy_function(results):
+        function_arn = deploy_lambda_function(lambda_client, lambda_function_name, lambda_handler_name,
+                                              results['iam_role'], results['deployment_package'],
+                                              requirements_file=REQUIREMENTS_FILE)
+        if not wait_for_active_lambda_function(lambda_client, lambda_function_name):
+            raise RuntimeError(f"Function {lambda_function_name} is not active")
+        return function_arn
+
+    # The bucket, its SSM parameter, the package and the role are independent
+    # and are created concurrently; the function waits for package and role.
+    provisioner = Provisioner()
+    provisioner.add('bucket', lambda results: s3_helper.create_and_delete_my_bucket(s3_bucket_name, 1))
+    provisioner.add('bucket_parameter', lambda results: ssm_helper.put_parameter(
+        '/localstack-poc-upload-images/buckets/images', s3_bucket_name, 'String', overwrite=True))
+    provisioner.add('upload_token', lambda results: ensure_upload_token(upload_token_parameter))
+    provisioner.add('deployment_package', lambda results: create_lambda_deployment_package(
+        lambda_function_filename, 'aws_clients.py', 'ttl_cache.py'))
+    provisioner.add('iam_role', lambda results: create_iam_role_for_lambda(iam_resource, lambda_role_name))
+    provisioner.add('function', deploy_function, depends_on=['deployment_package', 'iam_role'])
+    # Uploads made with a presigned POST/PUT are recorded by the same function
+    provisioner.add('upload_notification', lambda results: add_s3_upload_notification(
+        lambda_client, lambda_function_name, results['function'], s3_bucket_name),
+        depends_on=['bucket', 'function'])
+    provisioner.add('ready', lambda results: None,
+                    depends_on=['bucket', 'bucket_parameter', 'upload_token', 'function',
+                                'upload_notification'])
+    provisioner.run()
 
     file = os.path.join(os.path.dirname(__file__), "data/nyan-cat.png")
     with open(file, 'rb') as image_file:
@@ -217,6 +471,8 @@ def usage_demo():
     
     response = create_lambda_url_config_function(lambda_client, lambda_function_name)
     print(f"Please using the url for this function {response['FunctionUrl']} ")
+    print(f"Presign requests to the url need 'authorization: Bearer <token>' with the "
+          f"token in SSM parameter {upload_token_parameter}")
     print('-'*88)
     print("This is end of our Lambda basics demo.")
     print(f"Please check the S3 bucket with image name: 'test-integration-{uuid.uuid4().__str__()}'")
@@ -225,5 +481,17 @@ def usage_demo():
     # delete_lambda_function(lambda_client, lambda_function_name)
     # logger.info(f"Deleted function {lambda_function_name}.")
 
+def update_demo():
+    """Redeploys the upload-image-to-s3 function, uploading code only if it changed."""
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    deployment_package = create_lambda_deployment_package(
+        'lambda_upload_image_to_s3.py', 'aws_clients.py', 'ttl_cache.py')
+    iam_role = create_iam_role_for_lambda(iam_resource, 'lambda-role')
+    deploy_lambda_function(lambda_client, 'upload-image-to-s3', 'lambda_upload_image_to_s3.handler',
+                           iam_role, deployment_package, requirements_file=REQUIREMENTS_FILE)
+
 if __name__ == '__main__':
-    usage_demo()
\ No newline at end of file
+    if sys.argv[1:] == ['update']:
+        update_demo()
+    else:
+        usage_demo()
\ No newline at end of file
@@ -0,0 +1,176 @@
+
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import typing
+from botocore.exceptions import ClientError
+from lambda_basic import LAMBDA_RUNTIME, PACKAGE_CACHE_DIR, cache_package, create_deterministic_zip
+from resource_cache import resource_cache
+if typing.TYPE_CHECKING:
+    from mypy_boto3_lambda import LambdaClient
+
+logger = logging.getLogger(__name__)
+
+# Layer descriptions carry this tag so a published version can be found by content
+LAYER_HASH_TAG = 'sha256:'
+
+# Wheels are installed for the Lambda platform, not the machine building the layer
+LAYER_PLATFORM = os.getenv("LAMBDA_LAYER_PLATFORM", "manylinux2014_x86_64")
+
+# name[extras]==version, optionally followed by environment markers or --hash options
+_PINNED_REQUIREMENT = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*(\[[^\]]*\])?\s*===?\s*[^\s*,;]+\s*(;.*|--hash.*)?$')
+
+
+def read_requirements(requirements_file):
+    """
+    Reads a pip requirements file, dropping comments and blank lines.
+
+    :param requirements_file: Path of the requirements file.
+    :return: List of requirement specifiers.
+    """
+    requirements = []
+    with open(requirements_file) as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                requirements.append(line)
+    return requirements
+
+
+def check_pinned(requirements):
+    """
+    Rejects requirements that don't pin an exact version.
+
+    The layer hash covers the specifiers, not what pip resolves them to, so
+    an unpinned requirement would keep reusing a layer built from whatever
+    version was current when it was first published.
+
+    :param requirements: List of requirement specifiers.
+    """
+    unpinned = [r for r in requirements if not _PINNED_REQUIREMENT.match(r.strip())]
+    if unpinned:
+        raise ValueError(f"Layer requirements must pin exact versions (name==version): {', '.join(unpinned)}")
+
+
+def layer_content_hash(requirements, runtime=LAMBDA_RUNTIME, platform=LAYER_PLATFORM):
+    """
+    Hashes what goes into a layer. Equal hashes mean the layer can be reused.
+
+    :param requirements: List of pinned requirement specifiers. Raises
+                         ValueError if one doesn't pin an exact version.
+    :param runtime: The Lambda runtime the layer targets.
+    :param platform: The wheel platform the dependencies are installed for.
+    :return: Hex SHA-256 digest.
+    """
+    check_pinned(requirements)
+    digest = hashlib.sha256()
+    for part in [runtime, platform, *sorted(set(r.strip() for r in requirements))]:
+        digest.update(part.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+def build_layer_package(requirements, runtime=LAMBDA_RUNTIME, platform=LAYER_PLATFORM):
+    """
+    Installs dependencies into a Lambda layer package in ZIP format.
+
+    Packages go under python/, where the Python runtimes look for layer code.
+    Built layers are cached on disk by content hash, so pip only runs when
+    the requirements change.
+
+    :param requirements: List of requirement specifiers.
+    :param runtime: The Lambda runtime the layer targets, e.g. 'python3.11'.
+    :param platform: The wheel platform the dependencies are installed for.
+    :return: The layer package. Raises CalledProcessError if pip fails.
+    """
+    content_hash = layer_content_hash(requirements, runtime, platform)
+    cache_path = os.path.join(PACKAGE_CACHE_DIR, f"layer-{content_hash}.zip")
+    if os.path.exists(cache_path):
+        logger.info("Using cached layer package %s.", cache_path)
+        with open(cache_path, 'rb') as cached:
+            return cached.read()
+
+    python_version = runtime.replace('python', '')
+    with tempfile.TemporaryDirectory() as build_dir:
+        target = os.path.join(build_dir, 'python')
+        subprocess.run(
+            [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile',
+             '--target', target, '--platform', platform, '--implementation', 'cp',
+             '--python-version', python_version, '--only-binary=:all:', *requirements],
+            check=True)
+        entries = {}
+        for root, dirs, files in os.walk(target):
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            for file_name in files:
+                if file_name.endswith('.pyc'):
+                    continue
+                path = os.path.join(root, file_name)
+                with open(path, 'rb') as file:
+                    entries[os.path.relpath(path, build_dir).replace(os.sep, '/')] = file.read()
+    package = create_deterministic_zip(entries)
+    logger.info("Built layer package with %d files (%d bytes).", len(entries), len(package))
+    cache_package(cache_path, package)
+    return package
+
+
+def find_layer_version(lambda_client, layer_name, content_hash):
+    """
+    Finds a published version of a layer built from the same contents.
+
+    :param lambda_client: The Boto3 AWS Lambda client object.
+    :param layer_name: The name of the layer.
+    :param content_hash: Hash from layer_content_hash.
+    :return: The layer version ARN, or None if no version matches.
+    """
+    try:
+        paginator = lambda_client.get_paginator('list_layer_versions')
+        for page in paginator.paginate(LayerName=layer_name):
+            for version in page['LayerVersions']:
+                if LAYER_HASH_TAG + content_hash in version.get('Description', ''):
+                    return version['LayerVersionArn']
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ResourceNotFoundException':
+            logger.exception("Couldn't list versions of layer %s.", layer_name)
+            raise
+    return None
+
+
+def get_or_publish_layer(lambda_client, layer_name, requirements, runtime=LAMBDA_RUNTIME):
+    """
+    Returns a layer version holding the requirements, publishing one only if
+    no version with the same contents exists yet.
+
+    :param lambda_client: The Boto3 AWS Lambda client object.
+    :param layer_name: The name of the layer.
+    :param requirements: List of requirement specifiers, or the path of a
+                         requirements file.
+    :param runtime: The Lambda runtime the layer targets.
+    :return: The layer version ARN, to pass to deploy_lambda_function.
+    """
+    if isinstance(requirements, str):
+        requirements = read_requirements(requirements)
+    content_hash = layer_content_hash(requirements, runtime)
+    cache_name = f"{layer_name}:{content_hash}"
+
+    layer_arn = resource_cache.get('layer', cache_name, 'arn') or \
+        find_layer_version(lambda_client, layer_name, content_hash)
+    if layer_arn:
+        logger.info("Reusing layer version %s.", layer_arn)
+    else:
+        package = build_layer_package(requirements, runtime)
+        try:
+            response = lambda_client.publish_layer_version(
+                LayerName=layer_name,
+                Description=f"{LAYER_HASH_TAG}{content_hash}",
+                Content={'ZipFile': package},
+                CompatibleRuntimes=[runtime])
+        except ClientError:
+            logger.exception("Couldn't publish layer %s.", layer_name)
+            raise
+        layer_arn = response['LayerVersionArn']
+        logger.info("Published layer version %s.", layer_arn)
+    resource_cache.put('layer', cache_name, arn=layer_arn)
+    return layer_arn
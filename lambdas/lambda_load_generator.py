@@ -0,0 +1,331 @@
+
+import argparse
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+import typing
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+from firehose_emulator import percentile
+if typing.TYPE_CHECKING:
+    from mypy_boto3_lambda import LambdaClient
+
+logger = logging.getLogger(__name__)
+
+# Function deployed by lambda_basic.py
+FUNCTION_NAME = 'upload-image-to-s3'
+IMAGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/nyan-cat.png')
+
+# Fields of the REPORT line Lambda writes after every invocation
+_REPORT_FIELDS = {
+    'Duration': 'duration_ms',
+    'Billed Duration': 'billed_ms',
+    'Memory Size': 'memory_size_mb',
+    'Max Memory Used': 'max_memory_mb',
+    'Init Duration': 'init_ms',
+}
+_REPORT_FIELD_PATTERN = re.compile(r'(Duration|Billed Duration|Memory Size|Max Memory Used|Init Duration):'
+                                   r'\s*([\d.]+)\s*(?:ms|MB)')
+
+# Metric line logged by lambda_upload_image_to_s3._report_timing
+_TIMING_METRIC = 'upload_image_to_s3.timing'
+
+
+def parse_report(log_text):
+    """Read the REPORT line and the handler's timing metric from a log tail.
+
+    LocalStack doesn't always print Init Duration, so the cold_start flag of
+    the handler's timing metric is used when the REPORT line has none.
+
+    :param log_text: The decoded LogResult of an invocation.
+    :return: Dict with duration_ms, billed_ms, memory_size_mb, max_memory_mb,
+             init_ms and cold_start for whatever was found.
+    """
+    report = {}
+    for line in log_text.splitlines():
+        if line.startswith('REPORT'):
+            for name, value in _REPORT_FIELD_PATTERN.findall(line):
+                report[_REPORT_FIELDS[name]] = float(value)
+        elif _TIMING_METRIC in line:
+            try:
+                metric = json.loads(line[line.index('{'):])
+            except ValueError:
+                continue
+            report['cold_start'] = bool(metric.get('cold_start'))
+            report['handler_ms'] = metric.get('handler_ms')
+    if 'init_ms' in report:
+        report['cold_start'] = True
+    return report
+
+
+class InvocationResult:
+    """Outcome and timings of one invocation."""
+
+    def __init__(self, client_ms, report=None, status_code=None, function_error=None, error_code=None):
+        self.client_ms = client_ms
+        self.report = report or {}
+        self.status_code = status_code
+        self.function_error = function_error
+        self.error_code = error_code
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def error(self):
+        """The error code, function error or 'HTTP <status>' of a failed invocation, else None."""
+        if self.error_code is not None:
+            return self.error_code
+        if self.function_error is not None:
+            return self.function_error
+        # The handler reports its own failures, such as a bad request, as an error status
+        if isinstance(self.status_code, int) and self.status_code >= 400:
+            return f'HTTP {self.status_code}'
+        return None
+
+    @property
+    def cold_start(self):
+        return self.report.get('cold_start', False)
+
+
+def _latency_summary(values):
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 50), 1),
+        'p95': round(percentile(values, 95), 1),
+        'p99': round(percentile(values, 99), 1),
+        'max': round(max(values), 1),
+    }
+
+
+def _start_summary(results):
+    def values(key):
+        return [result.report[key] for result in results if result.report.get(key) is not None]
+    max_memory = values('max_memory_mb')
+    billed = values('billed_ms')
+    return {
+        'invocations': len(results),
+        'client_ms': _latency_summary([result.client_ms for result in results]),
+        'duration_ms': _latency_summary(values('duration_ms')),
+        'init_ms': _latency_summary(values('init_ms')),
+        'handler_ms': _latency_summary(values('handler_ms')),
+        'billed_ms_avg': round(sum(billed) / len(billed), 1) if billed else None,
+        'max_memory_mb': max(max_memory) if max_memory else None,
+    }
+
+
+class LoadReport:
+    """Invocation results of one run, split into cold and warm starts."""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    def summary(self):
+        """Return a dict with error counts and per start type latency percentiles."""
+        succeeded = [result for result in self.results if result.ok]
+        errors = {}
+        for result in self.results:
+            if not result.ok:
+                errors[result.error] = errors.get(result.error, 0) + 1
+        memory_sizes = {result.report['memory_size_mb'] for result in succeeded
+                        if 'memory_size_mb' in result.report}
+        return {
+            'invocations': len(self.results),
+            'errors': sum(errors.values()),
+            'error_codes': errors,
+            'elapsed_sec': round(self.elapsed, 3),
+            'invocations_per_sec': round(len(self.results) / self.elapsed, 1) if self.elapsed > 0 else 0.0,
+            'memory_size_mb': max(memory_sizes) if memory_sizes else None,
+            'cold': _start_summary([result for result in succeeded if result.cold_start]),
+            'warm': _start_summary([result for result in succeeded if not result.cold_start]),
+        }
+
+
+class LambdaLoadGenerator:
+    """
+    Invokes a function from a thread pool at a fixed concurrency and,
+    optionally, a target rate.
+
+    Every invocation asks for the log tail (LogType='Tail') so the REPORT
+    line can be parsed, and client round-trip latency is measured around the
+    call. Results are split into cold and warm starts because the two have
+    very different latency and memory profiles.
+    """
+
+    def __init__(self, lambda_client: "LambdaClient", function_name, payload,
+                 concurrency=10, rate=None, qualifier=None):
+        """
+        :param lambda_client: The Boto3 AWS Lambda client object. Its connection
+                              pool should hold at least `concurrency` connections.
+        :param function_name: The function to invoke.
+        :param payload: The event as a dict, or a function of the invocation
+                        number that returns the event.
+        :param concurrency: Invocations in flight at once.
+        :param rate: Target invocations per second, or None for as fast as
+                     the concurrency allows.
+        :param qualifier: Optional version or alias to invoke.
+        """
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+        self.payload = payload if callable(payload) else (lambda _: payload)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.qualifier = qualifier
+
+    def invoke(self, number):
+        """Invoke the function once.
+
+        :param number: Invocation number, passed to the payload function.
+        :return: The InvocationResult.
+        """
+        params = {
+            'FunctionName': self.function_name,
+            'Payload': json.dumps(self.payload(number)),
+            'LogType': 'Tail',
+        }
+        if self.qualifier:
+            params['Qualifier'] = self.qualifier
+        started = time.perf_counter()
+        try:
+            response = self.lambda_client.invoke(**params)
+            response_payload = response['Payload'].read()
+        except (ClientError, BotoCoreError) as e:
+            # Throttles (TooManyRequestsException) and timeouts count as errors
+            logger.debug("Invocation %d of %s failed: %s", number, self.function_name, e)
+            error_code = e.response['Error']['Code'] if isinstance(e, ClientError) else type(e).__name__
+            return InvocationResult((time.perf_counter() - started) * 1000, error_code=error_code)
+        client_ms = (time.perf_counter() - started) * 1000
+
+        log_text = base64.b64decode(response.get('LogResult', '')).decode('utf-8', 'replace')
+        function_error = response.get('FunctionError')
+        status_code = None
+        if not function_error:
+            try:
+                status_code = json.loads(response_payload).get('statusCode')
+            except (ValueError, AttributeError):
+                pass
+        return InvocationResult(client_ms, parse_report(log_text), status_code, function_error)
+
+    def run(self, invocations):
+        """Invoke the function `invocations` times.
+
+        :return: The LoadReport.
+        """
+        results = []
+        results_lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.concurrency)
+
+        def invoke(number):
+            started = time.perf_counter()
+            try:
+                result = self.invoke(number)
+            except Exception as e:
+                # The executor would keep the exception in a future nobody
+                # reads, so record it as a failed invocation instead
+                logger.warning("Invocation %d of %s raised %r", number, self.function_name, e)
+                result = InvocationResult((time.perf_counter() - started) * 1000, error_code=type(e).__name__)
+            finally:
+                slots.release()
+            with results_lock:
+                results.append(result)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for number in range(invocations):
+                if self.rate:
+                    delay = started + number / self.rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                # Wait for a free slot so the rate is measured from real starts
+                slots.acquire()
+                executor.submit(invoke, number)
+        return LoadReport(results, time.monotonic() - started)
+
+
+def image_upload_event(image_file=IMAGE_FILE, content_type='image/png'):
+    """Build events for upload-image-to-s3 with a unique file name per invocation.
+
+    :return: Function of the invocation number that returns the event.
+    """
+    with open(image_file, 'rb') as file:
+        body = base64.b64encode(file.read()).decode('utf-8')
+    run_id = uuid.uuid4().hex[:12]
+
+    def event(number):
+        return {'headers': {'content-type': content_type, 'filename': f'load-{run_id}-{number}'},
+                'body': body}
+    return event
+
+
+def set_memory_size(lambda_client, function_name, memory_mb):
+    """Change the function's memory and wait until the update is applied.
+
+    New execution environments are started afterwards, so the next
+    invocations are cold starts.
+    """
+    from lambda_basic import wait_for_lambda_update
+
+    lambda_client.update_function_configuration(FunctionName=function_name, MemorySize=memory_mb)
+    wait_for_lambda_update(lambda_client, function_name)
+
+
+def main():
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description="Invoke a Lambda function under load and report "
+                                                 "cold and warm start latency.")
+    parser.add_argument('--function', default=FUNCTION_NAME)
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10],
+                        help="Invocations in flight. Several values run in turn.")
+    parser.add_argument('--rate', type=float, default=0, help="Target invocations/sec; 0 for unlimited")
+    parser.add_argument('--memory-sizes', type=int, nargs='+',
+                        help="Set the function's MemorySize to each value in turn before running")
+    parser.add_argument('--payload-file', help="JSON event to send; defaults to an image upload event")
+    parser.add_argument('--qualifier')
+    parser.add_argument('--output', help="Append each result as a JSON line to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+    if args.payload_file:
+        with open(args.payload_file) as file:
+            payload = json.load(file)
+    else:
+        payload = image_upload_event()
+
+    aws_clients.configure(max_pool_connections=max(max(args.concurrency), 10))
+    lambda_client = aws_clients.get_client('lambda')
+    for memory_mb in args.memory_sizes or [None]:
+        if memory_mb is not None:
+            set_memory_size(lambda_client, args.function, memory_mb)
+        for concurrency in args.concurrency:
+            generator = LambdaLoadGenerator(lambda_client, args.function, payload, concurrency,
+                                            args.rate or None, args.qualifier)
+            result = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'function': args.function,
+                'concurrency': concurrency,
+                'target_rate': args.rate,
+                **generator.run(args.invocations).summary(),
+            }
+            line = json.dumps(result)
+            print(line)
+            if args.output:
+                with open(args.output, 'a') as output:
+                    output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,164 @@
-
-import json
 import base64
-import random 
-output = []
+import binascii
+import collections
+import io
+import json
+import logging
+import os
+from kpl_aggregation import deaggregate
+from record_schema import registry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RESULT_OK = 'Ok'
+RESULT_DROPPED = 'Dropped'
+RESULT_FAILED = 'ProcessingFailed'
+
+# Outcome totals across the warm invocations of this execution environment
+OUTCOME_COUNTS = collections.Counter()
+
+
+class RecordDropped(Exception):
+    """Raised for records that are deliberately not delivered, such as empty payloads."""
+
+
+class CsvBatchTransformer:
+    """
+    Converts the JSON records of one Firehose batch into CSV rows.
+
+    Rows are written by the encoder compiled for the record's schema version,
+    so columns follow the schema's field order whatever the key order of the
+    producer's JSON. A record selects a version with a 'schema_version' key;
+    otherwise the latest version is used. It may also name another registered
+    schema with a 'schema' key. A single text buffer is reused for
+    every record, so memory stays bounded by the largest record rather than
+    growing with the batch.
+
+    Errors are isolated per record: a record that can't be parsed is returned
+    as ProcessingFailed with its original data, and an empty one as Dropped,
+    while the rest of the batch is delivered. Firehose then only routes the bad
+    records to the error output instead of retrying the whole batch.
+    """
+
+    def __init__(self, schema_name='faker_record', partition_keys=()):
+        """
+        :param schema_name: Name of the registered schema the records follow.
+        :param partition_keys: JSON fields returned as Firehose dynamic
+                               partitioning keys. Firehose routes each record
+                               to one partition, so an aggregated record whose
+                               user records disagree on these keys fails
+                               processing rather than being misrouted.
+        """
+        self.schema_name = schema_name
+        self.partition_keys = tuple(partition_keys)
+        self._partition_values = None
+        self._buffer = io.StringIO()
+        self._encoders = {}
+        self.counts = collections.Counter()
+
+    def _encoder(self, payload):
+        key = (payload.get('schema', self.schema_name), payload.get('schema_version'))
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            encoder = self._encoders[key] = registry.encoder(*key)
+        return encoder
+
+    def transform_data(self, data):
+        """Convert one Kinesis/Firehose record payload into CSV text.
+
+        :param data: The decoded record payload. KPL aggregated records yield
+                     one row per user record.
+        :return: The CSV rows as a str. Raises RecordDropped for empty records,
+                 ValueError for records that aren't JSON objects, don't match
+                 the schema types or aggregate rows of different partitions,
+                 and KeyError for unknown schema versions.
+        """
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._partition_values = None
+        for user_data, _, _ in deaggregate(data):
+            if not user_data.strip():
+                continue
+            payload = json.loads(user_data)
+            if not isinstance(payload, dict):
+                raise ValueError(f"Expected a JSON object, got {type(payload).__name__}")
+            if payload:
+                self._write_row(payload)
+                self._check_partition_values(payload)
+        rows = self._buffer.getvalue()
+        if not rows:
+            raise RecordDropped()
+        return rows
+
+    def _check_partition_values(self, payload):
+        if not self.partition_keys:
+            return
+        values = {key: str(payload.get(key, 'unknown')) for key in self.partition_keys}
+        if self._partition_values is None:
+            self._partition_values = values
+        elif values != self._partition_values:
+            raise ValueError(f"Aggregated record mixes partitions {self._partition_values} and {values}")
+
+    def _write_row(self, payload):
+        self._buffer.write(self._encoder(payload).encode_csv(payload))
+
+    def transform_records(self, records):
+        """Transform Firehose records, echoing each input recordId.
+
+        :param records: The 'records' list of a Firehose transformation event.
+        :return: Generator of Firehose transformation result records.
+        """
+        for record in records:
+            try:
+                rows = self.transform_data(base64.b64decode(record['data'], validate=True))
+            except RecordDropped:
+                result = {'recordId': record['recordId'], 'result': RESULT_DROPPED,
+                          'data': record['data']}
+            except (binascii.Error, ValueError, TypeError, KeyError) as e:
+                # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+                logger.warning('Record %s failed processing: %s', record['recordId'], e)
+                result = {'recordId': record['recordId'], 'result': RESULT_FAILED,
+                          'data': record['data']}
+            else:
+                result = {'recordId': record['recordId'], 'result': RESULT_OK,
+                          'data': base64.b64encode(rows.encode('utf-8')).decode('ascii')}
+                if self.partition_keys:
+                    result['metadata'] = {'partitionKeys': self._partition_values}
+            self.counts[result['result']] += 1
+            yield result
+
+
+class JsonLinesBatchTransformer(CsvBatchTransformer):
+    """
+    Emits each record as one compact JSON line of typed schema fields instead
+    of a CSV row.
+
+    Used when Firehose converts the output to Parquet, which needs JSON input.
+    """
+
+    def _write_row(self, payload):
+        typed = self._encoder(payload).encode_typed(payload)
+        self._buffer.write(json.dumps(typed, separators=(',', ':')))
+        self._buffer.write('\n')
+
+
+TRANSFORMERS = {
+    'csv': CsvBatchTransformer,
+    'json': JsonLinesBatchTransformer,
+}
+
 
 def handler(event, context):
-    print(event)
-    for record in event['records']:
-        payload = json.loads(base64.b64decode(record['data']).decode('utf-8'))
-        print('payload:', payload)
-        random.seed(0)
-        output_payload=""   
-        for i in payload:
-            output_payload=output_payload+str(payload[i])
-            output_payload=output_payload+","
-            	
-        output_payload_clean=output_payload[:-1]+ "\n"
-        
-        output_payload_postprocessed = base64.b64encode(output_payload_clean.encode('utf-8'))
-        
-        output_record = {
-            'recordId': random.randint(1, 1000),
-            'result': 'Ok',
-            'data': output_payload_postprocessed
-        }
-        output.append(output_record)
-
-    print('Processed {} records.'.format(len(event['records'])))
-    
-    return {'records': output}
\ No newline at end of file
+    records = event['records']
+    transformer = TRANSFORMERS[os.getenv('TRANSFORM_OUTPUT_FORMAT', 'csv')](
+        os.getenv('TRANSFORM_SCHEMA', 'faker_record'),
+        [key for key in os.getenv('TRANSFORM_PARTITION_KEYS', '').split(',') if key])
+    output = list(transformer.transform_records(records))
+    OUTCOME_COUNTS.update(transformer.counts)
+    logger.info('Processed %d records: %s', len(records), json.dumps({
+        RESULT_OK: transformer.counts[RESULT_OK],
+        RESULT_DROPPED: transformer.counts[RESULT_DROPPED],
+        RESULT_FAILED: transformer.counts[RESULT_FAILED],
+    }))
+    return {'records': output}
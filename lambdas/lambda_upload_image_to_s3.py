@@ -1,11 +1,17 @@
+import time
+_module_init_started = time.perf_counter()
+
 import os
-import boto3
 import typing
 import base64
+import hmac
 import json
 import logging
 import uuid
+from urllib.parse import unquote_plus
 from botocore.exceptions import ClientError
+import aws_clients
+from ttl_cache import TTLCache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -18,35 +24,123 @@ endpoint_url = None
 if os.getenv("STAGE") == "local":
     endpoint_url = "https://localhost.localstack.cloud:4566"
 
-s3: "S3Client" = boto3.client("s3", endpoint_url=endpoint_url)
-ssm: "SSMClient" = boto3.client("ssm", endpoint_url=endpoint_url)
+# Clients and the bucket name are resolved on first use, not at import, so a
+# cold start doesn't pay for an SSM round trip before the handler runs.
+s3: "S3Client" = aws_clients.lazy_client("s3", endpoint_url=endpoint_url)
+ssm: "SSMClient" = aws_clients.lazy_client("ssm", endpoint_url=endpoint_url)
+
+BUCKET_PARAMETER_NAME = "/localstack-poc-upload-images/buckets/images"
+# Function URL requests for a presigned upload must send
+# `authorization: Bearer <token>` with this SecureString as the token
+UPLOAD_TOKEN_PARAMETER_NAME = "/localstack-poc-upload-images/upload-token"
+
+# Chunked uploads: the action comes from the `action` query string parameter
+# of a function URL request or the x-upload-action header, and the session
+# from x-upload-id / x-upload-key / x-part-number (or uploadId / key /
+# partNumber query string parameters).
+MULTIPART_ACTIONS = ('initiate', 'part', 'complete', 'abort')
+MAX_PART_NUMBER = 10000
+
+# Direct uploads: the `presign` action returns a presigned POST (or PUT with
+# method=PUT) so the image goes straight to S3 and never through the function.
+PRESIGN_METHODS = ('POST', 'PUT')
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+PRESIGNED_UPLOAD_EXPIRES_SECONDS = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES_SECONDS", "300"))
+# Metadata a presigned upload must carry: the POST policy requires it and the
+# PUT is signed for it, so the completion hook can tell those uploads apart.
+PRESIGNED_METADATA = {'upload-source': 'presigned'}
+_config_cache = TTLCache(int(os.getenv("CONFIG_TTL_SECONDS", "300")))
+
+_cold_start = True
+_lazy_init_ms = None
+
 
 def get_bucket_name() -> str:
-    parameter = ssm.get_parameter(Name="/localstack-poc-upload-images/buckets/images")
+    # BUCKET_NAME lets a deployment skip SSM entirely
+    if os.getenv("BUCKET_NAME"):
+        return os.environ["BUCKET_NAME"]
+    return _config_cache.get(BUCKET_PARAMETER_NAME, _load_bucket_name)
+
+
+def _load_bucket_name() -> str:
+    parameter = ssm.get_parameter(Name=BUCKET_PARAMETER_NAME)
+    return parameter["Parameter"]["Value"]
+
+
+def get_upload_token():
+    # UPLOAD_TOKEN lets a deployment skip SSM entirely
+    if os.getenv("UPLOAD_TOKEN"):
+        return os.environ["UPLOAD_TOKEN"]
+    return _config_cache.get(UPLOAD_TOKEN_PARAMETER_NAME, _load_upload_token)
+
+
+def _load_upload_token():
+    try:
+        parameter = ssm.get_parameter(Name=UPLOAD_TOKEN_PARAMETER_NAME, WithDecryption=True)
+    except ClientError as e:
+        # Without a token only IAM-authorized callers can presign
+        if e.response['Error']['Code'] == 'ParameterNotFound':
+            return None
+        raise
     return parameter["Parameter"]["Value"]
 
-s3_bucket = get_bucket_name()
+
+def _lazy_init():
+    """Resolve the configuration and clients the handler needs, once per environment."""
+    global _lazy_init_ms
+    started = time.perf_counter()
+    get_bucket_name()
+    aws_clients.get_client("s3", endpoint_url=endpoint_url)
+    _lazy_init_ms = (time.perf_counter() - started) * 1000
+
+
+def _report_timing(handler_started, status_code):
+    global _cold_start
+    report = {
+        'metric': 'upload_image_to_s3.timing',
+        'cold_start': _cold_start,
+        'handler_ms': round((time.perf_counter() - handler_started) * 1000, 2),
+        'status_code': status_code,
+    }
+    if _cold_start:
+        report['module_init_ms'] = round(MODULE_INIT_MS, 2)
+        report['lazy_init_ms'] = round(_lazy_init_ms, 2) if _lazy_init_ms is not None else None
+    _cold_start = False
+    logger.info(json.dumps(report))
+
 
 # main lambda handler method
 def handler(event, context):
+    handler_started = time.perf_counter()
+    response = _handle(event)
+    _report_timing(handler_started, response.get('statusCode'))
+    return response
+
+
+def _handle(event):
     # print(event)
+    if event.get('Records'):
+        return _record_uploads(event['Records'])
+
+    action = get_upload_action(event)
+    if action == 'presign':
+        return _handle_presign(event)
+    if action:
+        return _handle_multipart(action, event)
+
     payload = event.get('body')
     if not payload: 
         return {'statusCode': 400, 'message': 'Missing image data in body'}
-    
+
+    if _lazy_init_ms is None:
+        _lazy_init()
+    s3_bucket = get_bucket_name()
+
     # upload image to get s3 URL
     logger.info('upload_image_to_s3 , bucket=' + s3_bucket)
 
-    file_extension = get_file_extension_from_header(event)
-
-    # print(event.get('headers'))
+    file_name = get_file_name(event)
 
-    # check we have file name in input
-    if 'filename' in event.get('headers'):
-        file_name = f"{event.get('headers').get('filename')}.{file_extension}"
-    else:
-        file_name = f"{str(uuid.uuid1())}.{file_extension}"
-    
     file_content = base64.b64decode(payload)
 
     s3_upload(file_name, file_content, {})
@@ -64,14 +158,236 @@ def handler(event, context):
         'body': json.dumps(response)
     }
 
+def get_file_name(event):
+    file_extension = get_file_extension_from_header(event)
+
+    # check we have file name in input
+    if 'filename' in (event.get('headers') or {}):
+        return f"{event.get('headers').get('filename')}.{file_extension}"
+    return f"{str(uuid.uuid1())}.{file_extension}"
+
 def get_file_extension_from_header(event):
-    file_type = event.get('headers').get('content-type')
+    file_type = (event.get('headers') or {}).get('content-type')
     if file_type:
         return  file_type.split('/')[1]
     else:
         return 'png'
     # default to PNG if we are not able to extract extension or string is not bas64 encoded
 
+def get_upload_action(event):
+    query = event.get('queryStringParameters') or {}
+    return query.get('action') or (event.get('headers') or {}).get('x-upload-action')
+
+def _upload_param(event, header, query_name):
+    query = event.get('queryStringParameters') or {}
+    return query.get(query_name) or (event.get('headers') or {}).get(header)
+
+def _json_response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json'
+        },
+        'body': json.dumps(body)
+    }
+
+def _handle_multipart(action, event):
+    """
+    Runs one step of a chunked upload. A client initiates a session, sends
+    each part in its own request, in any order and in parallel, then
+    completes it; only one part is held in memory per invocation.
+
+    All parts except the last must be at least 5 MiB. Send them as binary
+    function URL requests, whose body limit fits a 5 MiB part; a base64 JSON
+    invoke payload doesn't.
+    """
+    if action not in MULTIPART_ACTIONS:
+        return {'statusCode': 400, 'message': f'Unknown upload action {action}'}
+    if _lazy_init_ms is None:
+        _lazy_init()
+    s3_bucket = get_bucket_name()
+
+    if action == 'initiate':
+        file_name = get_file_name(event)
+        content_type = (event.get('headers') or {}).get('content-type') or 'image/png'
+        if not content_type.startswith('image/'):
+            return {'statusCode': 400, 'message': f'Content type {content_type} is not an image'}
+        upload = s3_create_multipart_upload(file_name, content_type)
+        return _json_response(200, {'uploadId': upload['UploadId'], 'key': file_name})
+
+    upload_id = _upload_param(event, 'x-upload-id', 'uploadId')
+    file_name = _upload_param(event, 'x-upload-key', 'key')
+    if not upload_id or not file_name:
+        return {'statusCode': 400, 'message': 'Missing upload id or key'}
+
+    try:
+        if action == 'part':
+            payload = event.get('body')
+            if not payload:
+                return {'statusCode': 400, 'message': 'Missing image data in body'}
+            try:
+                part_number = int(_upload_param(event, 'x-part-number', 'partNumber'))
+            except (TypeError, ValueError):
+                part_number = 0
+            if not 1 <= part_number <= MAX_PART_NUMBER:
+                return {'statusCode': 400, 'message': f'Part number must be 1 to {MAX_PART_NUMBER}'}
+            # Function URLs only base64-encode binary bodies
+            if event.get('isBase64Encoded', True):
+                part_content = base64.b64decode(payload)
+            else:
+                part_content = payload.encode('utf-8')
+            etag = s3_upload_part(file_name, upload_id, part_number, part_content)
+            return _json_response(200, {'partNumber': part_number, 'etag': etag})
+
+        if action == 'abort':
+            s3_abort_multipart_upload(file_name, upload_id)
+            return _json_response(200, {'success': True, 'aborted': True})
+
+        try:
+            parts = _parse_parts(event.get('body'))
+        except ValueError as e:
+            return {'statusCode': 400, 'message': str(e)}
+        s3_complete_multipart_upload(file_name, upload_id, parts)
+    except ClientError as e:
+        # e.g. NoSuchUpload, InvalidPart or EntityTooSmall
+        return {'statusCode': 400, 'message': e.response['Error'].get('Message', str(e)),
+                'error': e.response['Error']['Code']}
+
+    return _json_response(200, {'success': True, 's3_url': create_presigned_url(s3_bucket, file_name)})
+
+def _parse_parts(body):
+    """
+    Reads the parts list of a complete request, as returned by the part
+    action, into S3 parts sorted by part number. Raises ValueError with the
+    message for the client if the body is malformed.
+    """
+    try:
+        request = json.loads(body or '{}')
+    except ValueError:
+        request = None
+    parts = request.get('parts') if isinstance(request, dict) else None
+    if not parts:
+        raise ValueError('Missing parts list in body')
+    if not isinstance(parts, list):
+        raise ValueError('Parts must be a list')
+    s3_parts = []
+    for part in parts:
+        if not isinstance(part, dict) or not isinstance(part.get('etag'), str):
+            raise ValueError('Every part needs a partNumber and an etag')
+        try:
+            part_number = int(part.get('partNumber'))
+        except (TypeError, ValueError):
+            part_number = 0
+        if not 1 <= part_number <= MAX_PART_NUMBER:
+            raise ValueError(f'Part number must be 1 to {MAX_PART_NUMBER}')
+        s3_parts.append({'PartNumber': part_number, 'ETag': part['etag']})
+    return sorted(s3_parts, key=lambda part: part['PartNumber'])
+
+def _is_authorized(event):
+    """
+    Direct invokes were authorized by IAM (lambda:InvokeFunction), and so
+    are function URL requests signed with SigV4 when the URL uses AWS_IAM
+    auth. Any other function URL request must present the upload token.
+    """
+    request_context = event.get('requestContext')
+    if not request_context:
+        return True
+    if (request_context.get('authorizer') or {}).get('iam'):
+        return True
+    token = get_upload_token()
+    presented = (event.get('headers') or {}).get('authorization') or ''
+    return bool(token) and hmac.compare_digest(presented.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+def _handle_presign(event):
+    """
+    Returns a presigned request that uploads the image straight to S3, once
+    the caller is authorized. The key is the one the handler would have
+    used below a server-generated folder, so a caller can't overwrite
+    existing objects. A POST policy makes S3 enforce the
+    content type and the size range; a presigned PUT is signed for the
+    content type and, when the client declares it, the length. Both carry
+    PRESIGNED_METADATA. S3 then calls the function with an ObjectCreated
+    notification, see _record_uploads.
+    """
+    if not _is_authorized(event):
+        return {'statusCode': 401, 'message': 'Missing or invalid upload token'}
+    headers = event.get('headers') or {}
+    query = event.get('queryStringParameters') or {}
+    content_type = headers.get('content-type') or 'image/png'
+    if not content_type.startswith('image/'):
+        return {'statusCode': 400, 'message': f'Content type {content_type} is not an image'}
+    method = (query.get('method') or headers.get('x-upload-method') or 'POST').upper()
+    if method not in PRESIGN_METHODS:
+        return {'statusCode': 400, 'message': f'Method must be one of {", ".join(PRESIGN_METHODS)}'}
+    declared_size = query.get('size') or headers.get('x-content-length')
+    try:
+        size = int(declared_size) if declared_size else None
+    except ValueError:
+        size = 0
+    if size is not None and not 0 < size <= MAX_UPLOAD_BYTES:
+        return {'statusCode': 400, 'message': f'Size must be 1 to {MAX_UPLOAD_BYTES} bytes'}
+
+    if _lazy_init_ms is None:
+        _lazy_init()
+    s3_bucket = get_bucket_name()
+    file_name = f"{uuid.uuid4().hex}/{get_file_name(event)}"
+    response = {'key': file_name, 'method': method, 'expiresIn': PRESIGNED_UPLOAD_EXPIRES_SECONDS,
+                'maxBytes': size or MAX_UPLOAD_BYTES}
+    if method == 'POST':
+        post = create_presigned_post(s3_bucket, file_name, content_type, size or MAX_UPLOAD_BYTES)
+        response.update(url=post['url'], fields=post['fields'])
+    else:
+        response.update(url=create_presigned_put(s3_bucket, file_name, content_type, size),
+                        headers={'Content-Type': content_type,
+                                 **{f'x-amz-meta-{name}': value for name, value in PRESIGNED_METADATA.items()}})
+    return _json_response(200, response)
+
+def _record_uploads(records):
+    """
+    Completion hook for S3 ObjectCreated notifications: logs each upload as a
+    metric line and deletes presigned uploads over MAX_UPLOAD_BYTES, which a
+    presigned PUT without a declared length can't prevent. Objects the
+    function writes itself, including completed multipart uploads, may be
+    larger and are kept. Records of other buckets are ignored, so an invoke
+    payload posing as a notification can't touch them.
+    """
+    if _lazy_init_ms is None:
+        _lazy_init()
+    upload_bucket = get_bucket_name()
+    recorded = 0
+    for record in records:
+        if record.get('eventSource') != 'aws:s3' or not record.get('eventName', '').startswith('ObjectCreated'):
+            continue
+        s3_bucket = record['s3']['bucket']['name']
+        if s3_bucket != upload_bucket:
+            logger.warning(f'Ignoring upload notification of bucket {s3_bucket}')
+            continue
+        s3_key = unquote_plus(record['s3']['object']['key'])
+        size = record['s3']['object'].get('size', 0)
+        upload = {
+            'metric': 'upload_image_to_s3.upload_completed',
+            'bucket': s3_bucket,
+            'key': s3_key,
+            'size': size,
+            'etag': record['s3']['object'].get('eTag'),
+            'event_name': record['eventName'],
+            'event_time': record.get('eventTime'),
+        }
+        if size > MAX_UPLOAD_BYTES and _is_presigned_upload(record['eventName'], s3_bucket, s3_key):
+            upload['rejected'] = 'too_large'
+            s3_delete(s3_bucket, s3_key)
+        logger.info(json.dumps(upload))
+        recorded += 1
+    return {'statusCode': 200, 'recorded': recorded}
+
+def _is_presigned_upload(event_name, s3_bucket, s3_key):
+    # Presigned requests only create objects with a single PUT or POST
+    if event_name not in ('ObjectCreated:Put', 'ObjectCreated:Post'):
+        return False
+    metadata = s3_get_metadata(s3_bucket, s3_key)
+    return metadata is not None and all(metadata.get(name) == value
+                                        for name, value in PRESIGNED_METADATA.items())
+
 # The response contains the presigned URL
 def create_presigned_url(bucket_name, object_name, expiration=3600):
     try:
@@ -80,8 +396,35 @@ def create_presigned_url(bucket_name, object_name, expiration=3600):
         logging.error(e)
         raise
 
+# The response contains the URL and form fields of a presigned POST
+def create_presigned_post(bucket_name, object_name, content_type, max_bytes, expiration=PRESIGNED_UPLOAD_EXPIRES_SECONDS):
+    metadata_fields = {f'x-amz-meta-{name}': value for name, value in PRESIGNED_METADATA.items()}
+    try:
+        return s3.generate_presigned_post(
+            bucket_name, object_name,
+            Fields={'Content-Type': content_type, **metadata_fields},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_bytes],
+                        *({name: value} for name, value in metadata_fields.items())],
+            ExpiresIn=expiration)
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+# The response contains a presigned PUT URL signed for the content type
+def create_presigned_put(bucket_name, object_name, content_type, size=None, expiration=PRESIGNED_UPLOAD_EXPIRES_SECONDS):
+    params = {'Bucket': bucket_name, 'Key': object_name, 'ContentType': content_type,
+              'Metadata': PRESIGNED_METADATA}
+    if size:
+        params['ContentLength'] = size
+    try:
+        return s3.generate_presigned_url('put_object', Params=params, ExpiresIn=expiration)
+    except ClientError as e:
+        logging.error(e)
+        raise
+
 # upload object to s3
 def s3_upload(s3_key, file_content, metadata):
+    s3_bucket = get_bucket_name()
     logger.info(f'saving_s3_file , bucket={s3_bucket} , path={s3_key}')
     try:
         response = s3.put_object(Body=file_content, Bucket=s3_bucket, Key=s3_key, Metadata=metadata)
@@ -90,3 +433,62 @@ def s3_upload(s3_key, file_content, metadata):
         logging.error(e)
         raise
 
+# start a multipart upload
+def s3_create_multipart_upload(s3_key, content_type):
+    s3_bucket = get_bucket_name()
+    logger.info(f'create_multipart_upload , bucket={s3_bucket} , path={s3_key}')
+    try:
+        return s3.create_multipart_upload(Bucket=s3_bucket, Key=s3_key, ContentType=content_type)
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+# upload one part of a multipart upload, returns its ETag
+def s3_upload_part(s3_key, upload_id, part_number, part_content):
+    s3_bucket = get_bucket_name()
+    try:
+        response = s3.upload_part(Body=part_content, Bucket=s3_bucket, Key=s3_key,
+                                  UploadId=upload_id, PartNumber=part_number)
+        return response['ETag']
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+def s3_complete_multipart_upload(s3_key, upload_id, parts):
+    s3_bucket = get_bucket_name()
+    logger.info(f'complete_multipart_upload , bucket={s3_bucket} , path={s3_key} , parts={len(parts)}')
+    try:
+        return s3.complete_multipart_upload(Bucket=s3_bucket, Key=s3_key, UploadId=upload_id,
+                                            MultipartUpload={'Parts': parts})
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+def s3_abort_multipart_upload(s3_key, upload_id):
+    s3_bucket = get_bucket_name()
+    try:
+        s3.abort_multipart_upload(Bucket=s3_bucket, Key=s3_key, UploadId=upload_id)
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+# user metadata of an object, None if it no longer exists
+def s3_get_metadata(s3_bucket, s3_key):
+    try:
+        return s3.head_object(Bucket=s3_bucket, Key=s3_key)['Metadata']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return None
+        logging.error(e)
+        raise
+
+def s3_delete(s3_bucket, s3_key):
+    logger.info(f'delete_s3_file , bucket={s3_bucket} , path={s3_key}')
+    try:
+        s3.delete_object(Bucket=s3_bucket, Key=s3_key)
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+
+MODULE_INIT_MS = (time.perf_counter() - _module_init_started) * 1000
@@ -0,0 +1,276 @@
+
+import argparse
+import json
+import logging
+import time
+import uuid
+
+from firehose_emulator import FirehoseEmulator, LocalS3, percentile
+from record_schema import BENCHMARK_RECORD_SCHEMA
+from s3_delivery_verifier import iter_rows
+
+logger = logging.getLogger(__name__)
+
+# Names used by kinesis-firehose-to-s3.py
+KINESIS_STREAM_NAME = 'kinesis-test-stream'
+BUCKET_NAME = 'kinesis-poc-storage'
+
+_FIELD_NAMES = [field_name for field_name, _ in BENCHMARK_RECORD_SCHEMA.fields]
+_ID_COLUMN = _FIELD_NAMES.index('id')
+_SEQ_COLUMN = _FIELD_NAMES.index('seq')
+_PRODUCED_AT_COLUMN = _FIELD_NAMES.index('produced_at')
+
+
+def benchmark_record(run_id, seq):
+    """Build one record stamped with its sequence id and production time.
+
+    :param run_id: Identifies the run, so rows of earlier runs in the bucket are ignored.
+    :param seq: Sequence id of the record within the run.
+    :return: The record as JSON bytes.
+    """
+    return json.dumps({
+        'schema': BENCHMARK_RECORD_SCHEMA.name,
+        'schema_version': BENCHMARK_RECORD_SCHEMA.version,
+        'name': 'Jane Doe',
+        'city': 'Port Jennifer',
+        'phone': '(555) 010-4477',
+        'id': f'{run_id}-{seq}',
+        'seq': seq,
+        'produced_at': time.time(),
+    }).encode('utf-8')
+
+
+class DeliveryTracker:
+    """
+    Polls the destination bucket and records when each record shows up.
+
+    A record's delivery time is when the poll first sees the object holding
+    it, so latencies are accurate to the poll interval. Objects that were in
+    the bucket before the run are ignored, as are rows of other runs.
+    """
+
+    def __init__(self, s3_client, bucket, run_id, prefix=''):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.run_id = run_id
+        self.prefix = prefix
+        self.latencies = {}
+        self.duplicates = 0
+        self.objects = 0
+        self.bytes_written = 0
+        self.last_delivery = None
+        self._seen_keys = set(self._list_keys())
+
+    def _list_keys(self):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+    def poll(self):
+        """Read objects that appeared since the last poll.
+
+        :return: Number of new records of this run found.
+        """
+        found = 0
+        for key in self._list_keys():
+            if key in self._seen_keys:
+                continue
+            seen_at = time.time()
+            self._seen_keys.add(key)
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+            self.objects += 1
+            self.bytes_written += response['ContentLength']
+            found += self._read_rows(iter_rows(response['Body'], key), seen_at)
+        return found
+
+    def _read_rows(self, rows, seen_at):
+        found = 0
+        id_prefix = f'{self.run_id}-'
+        for row in rows:
+            if len(row) != len(_FIELD_NAMES) or not row[_ID_COLUMN].startswith(id_prefix):
+                continue
+            seq = int(row[_SEQ_COLUMN])
+            if seq in self.latencies:
+                self.duplicates += 1
+                continue
+            self.latencies[seq] = seen_at - float(row[_PRODUCED_AT_COLUMN])
+            self.last_delivery = seen_at
+            found += 1
+        return found
+
+
+def drive(put_records, record_count, rate, batch_size, run_id):
+    """Produce records at a steady rate.
+
+    :param put_records: Function that sends a list of record payloads.
+    :param record_count: Records to send.
+    :param rate: Target records per second, or 0 for as fast as possible.
+    :param batch_size: Records handed to put_records at a time.
+    :param run_id: Identifies the run in the records.
+    :return: Seconds spent sending.
+    """
+    started = time.monotonic()
+    for start in range(0, record_count, batch_size):
+        if rate:
+            delay = started + start / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        put_records([benchmark_record(run_id, seq)
+                     for seq in range(start, min(start + batch_size, record_count))])
+    return time.monotonic() - started
+
+
+def run_benchmark(put_records, finish, s3_client, bucket, record_count, rate=0, batch_size=500,
+                  prefix='', timeout=300, poll_interval=0.5):
+    """Send records through a pipeline and wait for them to land in S3.
+
+    :param put_records: Function that sends a list of record payloads.
+    :param finish: Function called once everything is sent, e.g. to flush a producer.
+    :param s3_client: Client used to read the destination bucket.
+    :param bucket: Destination bucket.
+    :param record_count: Records to send.
+    :param rate: Target records per second, or 0 for as fast as possible.
+    :param batch_size: Records sent at a time.
+    :param prefix: Key prefix of delivered objects.
+    :param timeout: Seconds to wait for delivery after sending.
+    :param poll_interval: Seconds between bucket listings.
+    :return: Dict of results.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    tracker = DeliveryTracker(s3_client, bucket, run_id, prefix)
+    first_produced = time.time()
+    send_seconds = drive(put_records, record_count, rate, batch_size, run_id)
+    finish()
+
+    deadline = time.monotonic() + timeout
+    while len(tracker.latencies) < record_count and time.monotonic() < deadline:
+        tracker.poll()
+        if len(tracker.latencies) < record_count:
+            time.sleep(poll_interval)
+
+    latencies = list(tracker.latencies.values())
+    delivered = len(latencies)
+    elapsed = (tracker.last_delivery - first_produced) if tracker.last_delivery else 0.0
+    return {
+        'run_id': run_id,
+        'records_sent': record_count,
+        'records_delivered': delivered,
+        'records_lost': record_count - delivered,
+        'records_duplicated': tracker.duplicates,
+        'objects_written': tracker.objects,
+        'bytes_written': tracker.bytes_written,
+        'send_records_per_sec': round(record_count / send_seconds, 1) if send_seconds > 0 else 0.0,
+        'sustained_records_per_sec': round(delivered / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_ms_p50': round(percentile(latencies, 50) * 1000, 1),
+        'latency_ms_p95': round(percentile(latencies, 95) * 1000, 1),
+        'latency_ms_p99': round(percentile(latencies, 99) * 1000, 1),
+        'latency_ms_max': round(max(latencies, default=0.0) * 1000, 1),
+        'poll_interval_ms': round(poll_interval * 1000),
+    }
+
+
+def emulator_target(args):
+    """Send to an in-process FirehoseEmulator writing to a LocalS3."""
+    s3 = LocalS3()
+    emulator = FirehoseEmulator(s3_client=s3, bucket=BUCKET_NAME,
+                                buffer_size_mb=args.buffer_size_mb,
+                                buffer_interval_seconds=args.buffer_interval,
+                                s3_buffer_size_mb=args.s3_buffer_size_mb,
+                                s3_buffer_interval_seconds=args.s3_buffer_interval)
+
+    def put_records(payloads):
+        emulator.put_record_batch(Records=[{'Data': payload} for payload in payloads])
+
+    return put_records, lambda: None, emulator.close, s3
+
+
+def kinesis_target(args):
+    """Send to the LocalStack Kinesis stream that feeds the Firehose."""
+    import aws_clients
+    from kinesis_producer import KinesisBatchProducer
+
+    producer = KinesisBatchProducer.for_stream(aws_clients.get_client('kinesis'), args.stream,
+                                               aggregate=args.aggregate)
+
+    def put_records(payloads):
+        for payload in payloads:
+            producer.put(payload)
+
+    return put_records, producer.flush, producer.close, aws_clients.get_client('s3')
+
+
+def firehose_target(args):
+    """Send straight to a LocalStack DirectPut delivery stream with PutRecordBatch."""
+    import aws_clients
+    from firehose_producer import FirehoseBatchProducer
+
+    producer = FirehoseBatchProducer(aws_clients.get_client('firehose'), args.delivery_stream,
+                                     senders=args.senders)
+
+    def put_records(payloads):
+        for payload in payloads:
+            producer.put(payload)
+
+    return put_records, producer.flush, producer.close, aws_clients.get_client('s3')
+
+
+TARGETS = {
+    'emulator': emulator_target,
+    'kinesis': kinesis_target,
+    'firehose': firehose_target,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure end-to-end latency and throughput of the pipeline.")
+    parser.add_argument('--target', choices=sorted(TARGETS), default='emulator',
+                        help="'kinesis' drives the LocalStack stream set up by kinesis-firehose-to-s3.py; "
+                             "'firehose' writes straight to a DirectPut delivery stream")
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--rate', type=float, nargs='+', default=[0],
+                        help="Target records/sec; 0 sends as fast as possible. Several rates run in turn.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait for delivery")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--stream', default=KINESIS_STREAM_NAME)
+    # kinesis-firehose-to-s3.py only creates a KinesisStreamAsSource stream,
+    # which rejects PutRecordBatch, so there is no sensible default
+    parser.add_argument('--delivery-stream',
+                        help="DirectPut delivery stream for the 'firehose' target (required by it)")
+    parser.add_argument('--senders', type=int, default=4, help="Concurrent PutRecordBatch senders")
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--aggregate', action='store_true', help="KPL-aggregate Kinesis records")
+    parser.add_argument('--buffer-size-mb', type=float, default=1)
+    parser.add_argument('--buffer-interval', type=float, default=1.0)
+    parser.add_argument('--s3-buffer-size-mb', type=float, default=5)
+    parser.add_argument('--s3-buffer-interval', type=float, default=1.0)
+    parser.add_argument('--output', help="Append each result as a JSON line to this file")
+    args = parser.parse_args()
+    if args.target == 'firehose' and not args.delivery_stream:
+        parser.error("--target firehose requires --delivery-stream")
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+
+    for rate in args.rate:
+        put_records, finish, close, s3_client = TARGETS[args.target](args)
+        try:
+            result = run_benchmark(put_records, finish, s3_client, args.bucket, args.records, rate,
+                                   args.batch_size, args.prefix, args.timeout, args.poll_interval)
+        finally:
+            close()
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'target': args.target,
+            'target_rate': rate,
+            **result,
+        }
+        line = json.dumps(result)
+        print(line)
+        if args.output:
+            with open(args.output, 'a') as output:
+                output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisioningError(Exception):
+    """Raised when one or more resources in the graph could not be provisioned."""
+
+    def __init__(self, failed, skipped):
+        self.failed = failed
+        self.skipped = skipped
+        super().__init__(f"Provisioning failed for {', '.join(sorted(failed))}; "
+                         f"skipped {', '.join(sorted(skipped)) or 'nothing'}")
+
+
+class Node:
+    """One resource in the provisioning graph."""
+
+    def __init__(self, name, func, depends_on):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Provisioner:
+    """
+    Creates resources modelled as a dependency graph.
+
+    Each node is a function that receives a dict with the results of the
+    nodes it depends on and returns its own result (for example an ARN). A
+    node starts as soon as all its dependencies have finished, so independent
+    resources are created concurrently and total time approaches the
+    critical path rather than the sum of all steps. A node signals failure by
+    raising; nodes that depend on it are skipped.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.results = {}
+        self._started = None
+
+    def add(self, name, func, depends_on=()):
+        """Add a resource to the graph.
+
+        :param name: Unique node name.
+        :param func: Function called as func(results) where results maps each
+                     dependency name to its result.
+        :param depends_on: Names of nodes that must finish first.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Node {name} is already defined")
+        self.nodes[name] = Node(name, func, depends_on)
+        return name
+
+    def _check_graph(self):
+        for node in self.nodes.values():
+            unknown = [d for d in node.depends_on if d not in self.nodes]
+            if unknown:
+                raise ValueError(f"Node {node.name} depends on unknown nodes {unknown}")
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self.nodes[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.nodes:
+            visit(name)
+
+    def _run_node(self, node, results):
+        node.started = time.monotonic()
+        logger.info("Provisioning %s...", node.name)
+        try:
+            return node.func(results)
+        finally:
+            node.finished = time.monotonic()
+            logger.info("Provisioned %s in %.2fs", node.name, node.duration)
+
+    def run(self):
+        """Provision every node.
+
+        :return: Dict of node name to result. Raises ProvisioningError if any
+                 node failed, after the nodes that could still run have run.
+        """
+        self._check_graph()
+        self._started = time.monotonic()
+        pending = dict(self.nodes)
+        running = {}
+        failed = set()
+        skipped = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if any(d in failed or d in skipped for d in node.depends_on):
+                        skipped.add(name)
+                        del pending[name]
+                    elif all(d in self.results for d in node.depends_on):
+                        dependencies = {d: self.results[d] for d in node.depends_on}
+                        running[executor.submit(self._run_node, node, dependencies)] = name
+                        del pending[name]
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception:
+                        logger.exception("Couldn't provision %s.", name)
+                        failed.add(name)
+
+        self.log_timings()
+        if failed:
+            raise ProvisioningError(failed, skipped)
+        return self.results
+
+    def critical_path(self):
+        """Return the chain of nodes with the longest total duration, root first."""
+        best = {}
+
+        def longest(name):
+            if name not in best:
+                node = self.nodes[name]
+                chains = [longest(d) for d in node.depends_on]
+                head = max(chains, key=lambda c: c[0], default=(0.0, []))
+                best[name] = (head[0] + (node.duration or 0.0), head[1] + [name])
+            return best[name]
+
+        if not self.nodes:
+            return []
+        return max((longest(name) for name in self.nodes), key=lambda c: c[0])[1]
+
+    def timings(self):
+        """Return per-node (start offset, duration) in seconds, in start order."""
+        started = [n for n in self.nodes.values() if n.started is not None]
+        started.sort(key=lambda n: n.started)
+        return {n.name: (n.started - self._started, n.duration) for n in started}
+
+    def log_timings(self):
+        if self._started is None:
+            return
+        total = time.monotonic() - self._started
+        for name, (offset, duration) in self.timings().items():
+            logger.info("  %-24s start +%6.2fs  took %6.2fs", name, offset, duration or 0.0)
+        logger.info("Provisioned %d resources in %.2fs (critical path: %s)",
+                    len(self.results), total, ' -> '.join(self.critical_path()))
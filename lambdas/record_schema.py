@@ -0,0 +1,217 @@
+
+import collections
+import threading
+
+# Glue column types used when a schema declares the Parquet table
+GLUE_TYPES = {
+    'string': 'string',
+    'int': 'bigint',
+    'float': 'double',
+    'bool': 'boolean',
+}
+
+
+def _to_string(value):
+    return '' if value is None else str(value)
+
+
+def _to_int(value):
+    return '' if value is None else str(int(value))
+
+
+def _to_float(value):
+    return '' if value is None else repr(float(value))
+
+
+def _to_bool(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        value = value.strip().lower() in ('1', 'true', 'yes')
+    return 'true' if value else 'false'
+
+
+def _typed_int(value):
+    return None if value is None else int(value)
+
+
+def _typed_float(value):
+    return None if value is None else float(value)
+
+
+def _typed_bool(value):
+    if value is None or not isinstance(value, str):
+        return None if value is None else bool(value)
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+
+def _escape(text):
+    # Same quoting as csv.QUOTE_MINIMAL with the default dialect
+    if ',' in text or '"' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+_CSV_CONVERTERS = {
+    'string': '_to_string',
+    'int': '_to_int',
+    'float': '_to_float',
+    'bool': '_to_bool',
+}
+
+_TYPED_CONVERTERS = {
+    'string': None,
+    'int': '_typed_int',
+    'float': '_typed_float',
+    'bool': '_typed_bool',
+}
+
+_NAMESPACE = {
+    '_escape': _escape,
+    '_to_string': _to_string,
+    '_to_int': _to_int,
+    '_to_float': _to_float,
+    '_to_bool': _to_bool,
+    '_typed_int': _typed_int,
+    '_typed_float': _typed_float,
+    '_typed_bool': _typed_bool,
+}
+
+
+class Schema:
+    """A named, versioned record layout: ordered fields with types."""
+
+    def __init__(self, name, version, fields):
+        """
+        :param name: Schema name, e.g. 'faker_record'.
+        :param version: Integer schema version.
+        :param fields: Ordered list of (field name, type) pairs. Types are
+                       'string', 'int', 'float' or 'bool'.
+        """
+        for field_name, field_type in fields:
+            if field_type not in _CSV_CONVERTERS:
+                raise ValueError(f"Unsupported type {field_type} for field {field_name}")
+        self.name = name
+        self.version = version
+        self.fields = list(fields)
+
+    @property
+    def key(self):
+        return self.name, self.version
+
+    def glue_columns(self):
+        """Return the schema as Glue column definitions."""
+        return [{'Name': field_name, 'Type': GLUE_TYPES[field_type]}
+                for field_name, field_type in self.fields]
+
+
+class RecordEncoder:
+    """
+    Encoders generated for one schema.
+
+    encode_csv turns a payload dict into a CSV line with the schema's column
+    order, and encode_typed into an ordered dict of typed values. Both are
+    compiled into straight-line functions, so there is no per-field dispatch
+    or dict iteration at run time. Payload keys outside the schema are ignored
+    and missing fields are empty.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.encode_csv = self._compile_csv(schema)
+        self.encode_typed = self._compile_typed(schema)
+
+    @staticmethod
+    def _compile_csv(schema):
+        parts = []
+        for field_name, field_type in schema.fields:
+            converted = f"{_CSV_CONVERTERS[field_type]}(get({field_name!r}))"
+            if field_type == 'string':
+                converted = f"_escape({converted})"
+            parts.append(converted)
+        body = " + ',' + ".join(parts) if parts else "''"
+        source = f"def encode_csv(payload):\n    get = payload.get\n    return {body} + '\\n'\n"
+        namespace = dict(_NAMESPACE)
+        exec(compile(source, f"<csv encoder {schema.name} v{schema.version}>", 'exec'), namespace)
+        return namespace['encode_csv']
+
+    @staticmethod
+    def _compile_typed(schema):
+        items = []
+        for field_name, field_type in schema.fields:
+            converter = _TYPED_CONVERTERS[field_type]
+            value = f"get({field_name!r})"
+            items.append(f"({field_name!r}, {converter}({value}))"
+                         if converter else f"({field_name!r}, {value})")
+        source = (f"def encode_typed(payload):\n    get = payload.get\n"
+                  f"    return dict([{', '.join(items)}])\n")
+        namespace = dict(_NAMESPACE)
+        exec(compile(source, f"<typed encoder {schema.name} v{schema.version}>", 'exec'), namespace)
+        return namespace['encode_typed']
+
+
+class SchemaRegistry:
+    """
+    Registered schemas plus an LRU cache of their compiled encoders.
+
+    Keep one registry per process: in a Lambda the cache then survives across
+    warm invocations and each schema version is compiled once.
+    """
+
+    def __init__(self, max_cached_encoders=32):
+        self.max_cached_encoders = max_cached_encoders
+        self._schemas = {}
+        self._latest = {}
+        self._encoders = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, schema):
+        """Add a schema version. Re-registering a version drops its cached encoder."""
+        with self._lock:
+            self._schemas[schema.key] = schema
+            if schema.version >= self._latest.get(schema.name, schema.version):
+                self._latest[schema.name] = schema.version
+            self._encoders.pop(schema.key, None)
+        return schema
+
+    def get(self, name, version=None):
+        """Return a schema by name and version. Version None means the latest."""
+        if version is None:
+            version = self._latest.get(name)
+        schema = self._schemas.get((name, int(version) if version is not None else None))
+        if schema is None:
+            raise KeyError(f"Unknown schema {name} version {version}")
+        return schema
+
+    def encoder(self, name, version=None):
+        """Return the compiled encoder of a schema version, compiling it on first use."""
+        schema = self.get(name, version)
+        with self._lock:
+            encoder = self._encoders.get(schema.key)
+            if encoder is not None:
+                self._encoders.move_to_end(schema.key)
+                return encoder
+        encoder = RecordEncoder(schema)
+        with self._lock:
+            self._encoders[schema.key] = encoder
+            while len(self._encoders) > self.max_cached_encoders:
+                self._encoders.popitem(last=False)
+        return encoder
+
+
+FAKER_RECORD_SCHEMA = Schema('faker_record', 1, [
+    ('name', 'string'),
+    ('city', 'string'),
+    ('phone', 'string'),
+    ('id', 'string'),
+])
+
+# Faker records stamped by pipeline_benchmark to measure delivery latency
+BENCHMARK_RECORD_SCHEMA = Schema('benchmark_record', 1, FAKER_RECORD_SCHEMA.fields + [
+    ('seq', 'int'),
+    ('produced_at', 'float'),
+])
+
+registry = SchemaRegistry()
+registry.register(FAKER_RECORD_SCHEMA)
+registry.register(BENCHMARK_RECORD_SCHEMA)
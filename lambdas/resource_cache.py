@@ -0,0 +1,60 @@
+
+import logging
+import os
+import threading
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceStateCache:
+    """
+    Remembers what describe and create calls said about a resource.
+
+    Entries are keyed by (kind, name), e.g. ('kinesis', 'my-stream'), and hold
+    fields such as 'arn' and 'status'. Helpers record the fields found in
+    responses they already have and look them up before making another
+    describe call. Anything that changes a resource must invalidate it.
+    Only resources known to exist are cached; a missing resource is always
+    looked up again.
+    """
+
+    def __init__(self, ttl_seconds=300):
+        self._cache = TTLCache(ttl_seconds)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, name, field=None):
+        """Return the cached state dict, or one field of it, or None if unknown."""
+        state = self._cache.peek((kind, name))
+        with self._lock:
+            if state is None or (field is not None and field not in state):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return state if field is None else state[field]
+
+    def put(self, kind, name, **fields):
+        """Merge fields into the cached state of a resource."""
+        with self._lock:
+            state = dict(self._cache.peek((kind, name)) or {})
+            state.update(fields)
+            self._cache.set((kind, name), state)
+
+    def invalidate(self, kind=None, name=None):
+        """Forget one resource, every resource of a kind, or everything."""
+        if kind is None:
+            self._cache.invalidate()
+            return
+        if name is not None:
+            self._cache.invalidate((kind, name))
+            return
+        for key in self._cache.keys():
+            if key[0] == kind:
+                self._cache.invalidate(key)
+
+
+# Shared by the helper modules so each lookup is made once per run
+resource_cache = ResourceStateCache(int(os.getenv("RESOURCE_CACHE_TTL_SECONDS", "300")))
@@ -1,8 +1,10 @@
 
 import logging
 import os
-import boto3
 import typing
+import aws_clients
+from resource_cache import resource_cache
+from waiters import WaiterError, wait_until
 
 from botocore.exceptions import ClientError
 if typing.TYPE_CHECKING:
@@ -12,14 +14,47 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 
-s3: "S3Client" = boto3.resource(
-    "s3", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1'
-)
+s3: "S3Client" = aws_clients.lazy_resource("s3")
 logger = logging.getLogger(__name__)
 
 def list_my_buckets(s3):
-    for b in s3.buckets.all() : 
-        logger.info('My Buckets: %s', b.name)
+    for name in _bucket_names(s3):
+        logger.info('My Buckets: %s', name)
+
+
+def _bucket_names(s3):
+    # ListBuckets is made once; creates and deletes keep the cached list current
+    names = resource_cache.get('s3', '*', 'buckets')
+    if names is None:
+        names = [b.name for b in s3.buckets.all()]
+        resource_cache.put('s3', '*', buckets=names)
+    return names
+
+
+def _remember_bucket(bucket_name, exists):
+    names = resource_cache.get('s3', '*', 'buckets')
+    if names is not None:
+        names = [n for n in names if n != bucket_name] + ([bucket_name] if exists else [])
+        resource_cache.put('s3', '*', buckets=names)
+    if exists:
+        resource_cache.put('s3', bucket_name, exists=True)
+    else:
+        resource_cache.invalidate('s3', bucket_name)
+
+
+def _forget_bucket(bucket_name):
+    # The bucket's state is unknown, so the next lookup asks S3 again
+    resource_cache.invalidate('s3', bucket_name)
+    resource_cache.invalidate('s3', '*')
+
+
+def _wait_and_remember(bucket_name, exists):
+    # As with the resource waiters, a bucket that never reaches the state is an error
+    if not wait_for_bucket(bucket_name, exists):
+        _forget_bucket(bucket_name)
+        raise WaiterError(f"Bucket {bucket_name} did not {'appear' if exists else 'go away'}")
+    _remember_bucket(bucket_name, exists)
+
 
 def create_and_delete_my_bucket(bucket_name, keep_bucket):
 
@@ -33,20 +68,47 @@ def create_and_delete_my_bucket(bucket_name, keep_bucket):
     except ClientError as e:
         print(e)
         logger.exception("Exiting the script because bucket creation failed. %s.", e)
+        raise
 
-    bucket.wait_until_exists()
+    _wait_and_remember(bucket_name, True)
     list_my_buckets(s3)
 
     if not keep_bucket:
         logger.info('Deleting bucket: %s.', bucket.name)
         bucket.delete()
 
-        bucket.wait_until_not_exists()
+        _wait_and_remember(bucket_name, False)
         list_my_buckets(s3)
     else:
         logger.info('Keeping bucket: %s.', bucket.name)
 
 
+def wait_for_bucket(bucket_name, exists=True, timeout=60):
+    """
+    Wait until a bucket exists, or no longer exists.
+
+    Polls HeadBucket with backoff starting in milliseconds instead of the
+    resource waiter's fixed 5 second interval.
+
+    :param bucket_name: The name of the bucket.
+    :param exists: Wait for the bucket to exist (True) or to be gone (False).
+    :param timeout: Seconds to wait before giving up.
+    :return: True when the bucket reached the state; otherwise, False.
+    """
+    def check():
+        try:
+            s3.meta.client.head_bucket(Bucket=bucket_name)
+            return exists
+        except ClientError:
+            return not exists
+    try:
+        wait_until(check, timeout=timeout, description=f"Bucket {bucket_name}")
+    except WaiterError as e:
+        logger.error(e)
+        return False
+    return True
+
+
 def bucket_exists(bucket_name):
     """
     Determine whether a bucket with the specified name exists.
@@ -56,9 +118,13 @@ def bucket_exists(bucket_name):
     :param bucket_name: The name of the bucket to check.
     :return: True when the bucket exists; otherwise, False.
     """
+    if resource_cache.get('s3', bucket_name, 'exists'):
+        logger.info("Bucket %s exists.", bucket_name)
+        return True
     try:
         s3.meta.client.head_bucket(Bucket=bucket_name)
         logger.info("Bucket %s exists.", bucket_name)
+        resource_cache.put('s3', bucket_name, exists=True)
         exists = True
     except ClientError:
         logger.warning("Bucket %s doesn't exist or you don't have access to it.",
@@ -73,11 +139,12 @@ def delete_bucket(bucket):
 
     Usage is shown in usage_demo at the end of this module.
 
-    :param bucket: The bucket to delete.
+    :param bucket: The bucket to delete. Raises WaiterError if it is still
+                   there once the wait times out.
     """
     try:
         bucket.delete()
-        bucket.wait_until_not_exists()
+        _wait_and_remember(bucket.name, False)
         logger.info("Bucket %s successfully deleted.", bucket.name)
     except ClientError:
         logger.exception("Couldn't delete bucket %s.", bucket.name)
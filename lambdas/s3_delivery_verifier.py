@@ -0,0 +1,273 @@
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from record_schema import FAKER_RECORD_SCHEMA
+if typing.TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+logger = logging.getLogger(__name__)
+
+# Bucket the demo Firehose delivers to
+BUCKET_NAME = 'kinesis-poc-storage'
+DEFAULT_ERROR_OUTPUT_PREFIX = 'processing-failed/'
+
+# Column of the record id in the transform's CSV output
+DEFAULT_ID_COLUMN = [field_name for field_name, _ in FAKER_RECORD_SCHEMA.fields].index('id')
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class _SnappyStreamReader(io.RawIOBase):
+    """Decompresses a snappy framed stream chunk by chunk."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._decompressor = snappy.StreamDecompressor()
+        self._pending = b''
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            chunk = self._stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                self._eof = True
+                self._decompressor.flush()
+                break
+            self._pending = self._decompressor.decompress(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def decompressed_stream(stream, key):
+    """Wrap an object body so it reads decompressed, based on the key's extension.
+
+    Firehose names GZIP objects *.gz and Snappy objects *.snappy. Nothing is
+    read ahead beyond one chunk, so whole objects are never held in memory.
+
+    :param stream: The object body, e.g. the StreamingBody from get_object.
+    :param key: The object key.
+    :return: A binary file-like object.
+    """
+    if key.endswith('.gz'):
+        return gzip.GzipFile(fileobj=stream)
+    if key.endswith('.snappy'):
+        if snappy is None:
+            raise ValueError(f"python-snappy is needed to read {key}")
+        return io.BufferedReader(_SnappyStreamReader(stream), READ_CHUNK_BYTES)
+    return stream
+
+
+def iter_rows(stream, key):
+    """Yield the CSV rows of an object body one at a time.
+
+    :param stream: The object body.
+    :param key: The object key, which tells how it is compressed.
+    :return: Generator of rows as lists of strings.
+    """
+    text = io.TextIOWrapper(decompressed_stream(stream, key), encoding='utf-8', newline='')
+    yield from csv.reader(text)
+
+
+def read_ids_file(path):
+    """Read expected record ids, one per line."""
+    with open(path) as file:
+        return {line.strip() for line in file if line.strip()}
+
+
+class VerificationResult:
+    """Reconciliation of delivered rows against the expected record ids."""
+
+    def __init__(self, expected_ids=None):
+        self.expected_ids = expected_ids
+        self.seen_ids = set()
+        self.duplicates = 0
+        self.malformed_rows = 0
+        self.rows = 0
+        self.objects = 0
+        self.bytes = 0
+        self.failed_objects = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add_object(self, byte_count, ids, malformed_rows):
+        self.objects += 1
+        self.bytes += byte_count
+        self.malformed_rows += malformed_rows
+        self.rows += len(ids) + malformed_rows
+        for record_id in ids:
+            if record_id in self.seen_ids:
+                self.duplicates += 1
+            else:
+                self.seen_ids.add(record_id)
+
+    @property
+    def missing_ids(self):
+        return set() if self.expected_ids is None else self.expected_ids - self.seen_ids
+
+    @property
+    def unexpected_ids(self):
+        return set() if self.expected_ids is None else self.seen_ids - self.expected_ids
+
+    @property
+    def ok(self):
+        return not (self.missing_ids or self.duplicates or self.failed_objects)
+
+    def summary(self, sample_size=10):
+        """Return a dict with counts, a sample of missing ids and throughput."""
+        elapsed = (self.finished or time.monotonic()) - self.started
+        missing = self.missing_ids
+        return {
+            'ok': self.ok,
+            'objects': self.objects,
+            'failed_objects': len(self.failed_objects),
+            'bytes': self.bytes,
+            'rows': self.rows,
+            'unique_ids': len(self.seen_ids),
+            'expected_ids': len(self.expected_ids) if self.expected_ids is not None else None,
+            'missing_ids': len(missing),
+            'missing_sample': sorted(missing)[:sample_size],
+            'unexpected_ids': len(self.unexpected_ids),
+            'duplicates': self.duplicates,
+            'malformed_rows': self.malformed_rows,
+            'elapsed_sec': round(elapsed, 3),
+            'objects_per_sec': round(self.objects / elapsed, 1) if elapsed > 0 else 0.0,
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            'mb_per_sec': round(self.bytes / elapsed / 1024 / 1024, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class S3DeliveryVerifier:
+    """
+    Checks that every produced record was delivered to S3 exactly once.
+
+    Keys are listed page by page and objects are fetched on a bounded thread
+    pool. At most a few objects per worker are queued at a time, so memory
+    stays flat with tens of thousands of objects. Each object is decompressed
+    and parsed as CSV while it streams in, and only the record ids are kept.
+    """
+
+    def __init__(self, s3_client: "S3Client", bucket=BUCKET_NAME, prefix='',
+                 exclude_prefixes=(DEFAULT_ERROR_OUTPUT_PREFIX,), id_column=DEFAULT_ID_COLUMN,
+                 column_count=len(FAKER_RECORD_SCHEMA.fields), max_workers=16):
+        """
+        :param s3_client: The Boto3 S3 client object.
+        :param bucket: The bucket Firehose delivers to.
+        :param prefix: Only verify keys under this prefix.
+        :param exclude_prefixes: Skip keys under these prefixes, e.g. Firehose error output.
+        :param id_column: Index of the record id in each CSV row.
+        :param column_count: Expected columns per row, or None to accept any.
+        :param max_workers: Objects fetched at once.
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.id_column = id_column
+        self.column_count = column_count
+        self.max_workers = max_workers
+
+    def keys(self):
+        """Yield the keys to verify, one listing page at a time."""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].startswith(self.exclude_prefixes):
+                    yield obj['Key']
+
+    def read_object(self, key):
+        """Fetch one object and collect its record ids.
+
+        :return: Tuple of (compressed bytes, list of ids, malformed row count).
+        """
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        ids = []
+        malformed_rows = 0
+        for row in iter_rows(response['Body'], key):
+            if not row:
+                continue
+            if (self.column_count is not None and len(row) != self.column_count) or self.id_column >= len(row):
+                malformed_rows += 1
+                continue
+            ids.append(row[self.id_column])
+        return response.get('ContentLength', 0), ids, malformed_rows
+
+    def verify(self, expected_ids=None):
+        """Read every delivered object and reconcile it against expected_ids.
+
+        :param expected_ids: Set of record ids the producer wrote, or None to
+                             only count rows and duplicates.
+        :return: The VerificationResult.
+        """
+        result = VerificationResult(set(expected_ids) if expected_ids is not None else None)
+        max_pending = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+
+            def collect(futures):
+                for future in futures:
+                    key = pending.pop(future)
+                    try:
+                        result.add_object(*future.result())
+                    except Exception:
+                        logger.exception("Couldn't verify object %s.", key)
+                        result.failed_objects.append(key)
+
+            for key in self.keys():
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[executor.submit(self.read_object, key)] = key
+            collect(list(pending))
+        result.finished = time.monotonic()
+        logger.info("Verified s3://%s/%s: %s", self.bucket, self.prefix, json.dumps(result.summary()))
+        return result
+
+
+def main():
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description="Verify that Firehose delivered every record to S3.")
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--ids-file', help="File with the expected record ids, one per line")
+    parser.add_argument('--id-column', type=int, default=DEFAULT_ID_COLUMN)
+    parser.add_argument('--columns', type=int, default=len(FAKER_RECORD_SCHEMA.fields),
+                        help="Expected columns per row; 0 accepts any")
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+    aws_clients.configure(max_pool_connections=max(args.workers, 10))
+    verifier = S3DeliveryVerifier(aws_clients.get_client('s3'), args.bucket, args.prefix,
+                                  id_column=args.id_column, column_count=args.columns or None,
+                                  max_workers=args.workers)
+    result = verifier.verify(read_ids_file(args.ids_file) if args.ids_file else None)
+    print(json.dumps(result.summary()))
+    if not result.ok:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
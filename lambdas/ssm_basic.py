@@ -1,8 +1,10 @@
 
 import logging
 import os
-import boto3
 import typing
+from concurrent.futures import ThreadPoolExecutor
+import aws_clients
+from ttl_cache import TTLCache
 
 from botocore.exceptions import ClientError
 if typing.TYPE_CHECKING:
@@ -11,17 +13,24 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 
-ssm_client: "SSMClient" = boto3.client(
-    "ssm", endpoint_url="http://localhost.localstack.cloud:4566"
-)
+ssm_client: "SSMClient" = aws_clients.lazy_client("ssm")
 logger = logging.getLogger(__name__)
 
-def put_parameter(parameter_name, parameter_value, parameter_type):
+# GetParameters accepts at most 10 names per call
+GET_PARAMETERS_BATCH_SIZE = 10
+
+# Parameter values already read in this process, by name and by path. Keys
+# include with_decryption so a SecureString's ciphertext is never served to a
+# caller that asked for the decrypted value, or the other way round.
+_parameter_cache = TTLCache(int(os.getenv("SSM_CACHE_TTL_SECONDS", "300")))
+
+def put_parameter(parameter_name, parameter_value, parameter_type, overwrite=False):
     """Creates new parameter in AWS SSM
 
     :param parameter_name: Name of the parameter to create in AWS SSM
     :param parameter_value: Value of the parameter to create in AWS SSM
     :param parameter_type: Type of the parameter to create in AWS SSM ('String'|'StringList'|'SecureString')
+    :param overwrite: Replace the value if the parameter already exists
     :return: Return version of the parameter if successfully created else None
     """
 
@@ -29,9 +38,125 @@ def put_parameter(parameter_name, parameter_value, parameter_type):
         result = ssm_client.put_parameter(
             Name=parameter_name,
             Value=parameter_value,
-            Type=parameter_type
+            Type=parameter_type,
+            Overwrite=overwrite
         )
     except ClientError as e:
         logging.error(e)
         return None
-    return result['Version']
\ No newline at end of file
+    finally:
+        invalidate_cache(parameter_name)
+    return result['Version']
+
+
+def put_parameters(parameters, overwrite=False, max_workers=4):
+    """Creates many parameters in AWS SSM concurrently
+
+    SSM has no batch put, so the puts run on a thread pool. Throttled calls
+    are retried by the shared client's retry configuration.
+
+    :param parameters: Iterable of (name, value, type) tuples
+    :param overwrite: Replace values of parameters that already exist
+    :param max_workers: Number of concurrent PutParameter calls
+    :return: Dict of parameter name to its new version, or None if the put failed
+    """
+
+    parameters = list(parameters)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        versions = executor.map(
+            lambda parameter: put_parameter(*parameter, overwrite=overwrite), parameters)
+        return {name: version for (name, _, _), version in zip(parameters, versions)}
+
+
+def get_parameter(parameter_name, with_decryption=True, use_cache=True):
+    """Reads one parameter from AWS SSM
+
+    :param parameter_name: Name of the parameter
+    :param with_decryption: Decrypt SecureString values
+    :param use_cache: Serve the value from the in-process cache if it is fresh
+    :return: The parameter value, or None if it doesn't exist
+    """
+
+    return get_parameters([parameter_name], with_decryption, use_cache).get(parameter_name)
+
+
+def get_parameters(parameter_names, with_decryption=True, use_cache=True):
+    """Reads many parameters from AWS SSM in as few calls as possible
+
+    Cached values are served from memory; the rest are fetched with
+    GetParameters, ten names per call.
+
+    :param parameter_names: Names of the parameters
+    :param with_decryption: Decrypt SecureString values
+    :param use_cache: Serve values from the in-process cache if they are fresh
+    :return: Dict of parameter name to value. Missing parameters are left out.
+    """
+
+    values = {}
+    missing = []
+    for name in dict.fromkeys(parameter_names):
+        cached = _parameter_cache.peek(('name', name, with_decryption)) if use_cache else None
+        if cached is not None:
+            values[name] = cached
+        else:
+            missing.append(name)
+
+    for start in range(0, len(missing), GET_PARAMETERS_BATCH_SIZE):
+        batch = missing[start:start + GET_PARAMETERS_BATCH_SIZE]
+        try:
+            result = ssm_client.get_parameters(Names=batch, WithDecryption=with_decryption)
+        except ClientError as e:
+            logging.error(e)
+            continue
+        for parameter in result['Parameters']:
+            values[parameter['Name']] = parameter['Value']
+            _parameter_cache.set(('name', parameter['Name'], with_decryption), parameter['Value'])
+        if result.get('InvalidParameters'):
+            logger.warning("Parameters not found: %s", ', '.join(result['InvalidParameters']))
+    return values
+
+
+def get_parameters_by_path(path, recursive=True, with_decryption=True, use_cache=True):
+    """Reads every parameter under a path from AWS SSM, following pagination
+
+    :param path: Parameter hierarchy, e.g. '/localstack-poc-upload-images/'
+    :param recursive: Include parameters in nested levels of the hierarchy
+    :param with_decryption: Decrypt SecureString values
+    :param use_cache: Serve the result from the in-process cache if it is fresh
+    :return: Dict of parameter name to value. If error, returns None.
+    """
+
+    cache_key = ('path', path, recursive, with_decryption)
+    if use_cache:
+        cached = _parameter_cache.peek(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+    values = {}
+    paginator = ssm_client.get_paginator('get_parameters_by_path')
+    try:
+        for page in paginator.paginate(Path=path, Recursive=recursive,
+                                       WithDecryption=with_decryption):
+            for parameter in page['Parameters']:
+                values[parameter['Name']] = parameter['Value']
+                _parameter_cache.set(('name', parameter['Name'], with_decryption), parameter['Value'])
+    except ClientError as e:
+        logging.error(e)
+        return None
+    _parameter_cache.set(cache_key, dict(values))
+    return values
+
+
+def invalidate_cache(parameter_name=None):
+    """Drops cached parameter values
+
+    :param parameter_name: Name of the parameter to drop, or None to drop all.
+        Cached path lookups are always dropped because they may contain it.
+    """
+
+    if parameter_name is None:
+        _parameter_cache.invalidate()
+        return
+    for key in _parameter_cache.keys():
+        if key[0] == 'path' or key[1] == parameter_name:
+            _parameter_cache.invalidate(key)
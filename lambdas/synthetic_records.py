@@ -0,0 +1,209 @@
+
+import argparse
+import itertools
+import json
+import random
+import time
+
+from record_schema import FAKER_RECORD_SCHEMA, registry
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from faker import Faker
+except ImportError:
+    Faker = None
+
+DEFAULT_POOL_SIZE = 1024
+
+_FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+                'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+                'Charles', 'Karen', 'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Betty', 'Mark', 'Sandra']
+_LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+               'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+               'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', "O'Neil"]
+_CITY_PREFIXES = ['North', 'South', 'East', 'West', 'New', 'Port', 'Lake', 'Fort', 'Mount', 'Saint']
+_CITY_NAMES = ['Jennifer', 'Haven', 'Bridge', 'Springs', 'Field', 'Ville', 'Burgh', 'Wood', 'Ridge', 'Falls',
+               'Harbor', 'Valley', 'Creek', 'Grove', 'Point', 'Shore', 'Hill', 'Glen', 'Dale', 'Brook']
+
+
+def _name(rng):
+    return f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+
+
+def _city(rng):
+    return f"{rng.choice(_CITY_PREFIXES)} {rng.choice(_CITY_NAMES)}"
+
+
+def _phone(rng):
+    number = f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+    return number if rng.random() < 0.8 else f"{number} x{rng.randint(1, 9999)}"
+
+
+# Builders for well-known string fields; other strings get random words
+_STRING_BUILDERS = {
+    'name': _name,
+    'city': _city,
+    'phone': _phone,
+}
+
+# Faker providers used for the same fields when Faker is installed
+_FAKER_PROVIDERS = {
+    'name': 'name',
+    'city': 'city',
+    'phone': 'phone_number',
+}
+
+
+def _word(rng):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 12)))
+
+
+class SyntheticRecordGenerator:
+    """
+    Produces large volumes of reproducible JSON records for load tests.
+
+    Values are drawn from pools built once per field from the seed (with
+    Faker when it's installed, otherwise from built-in word lists), and each
+    pool is stored as pre-encoded JSON fragments. A batch then only samples
+    pool indices - with NumPy in one vectorized call per field when it's
+    available - and joins fragments, so no per-record Faker calls or JSON
+    encoding are needed. 'id' fields are unique per record and derived from
+    the seed and a counter rather than uuid4.
+
+    The same seed, schema, pool size and backend (NumPy or not) always give
+    the same records. Records carry the schema's 'schema' and
+    'schema_version' keys, and can be padded to a fixed size with a 'pad'
+    field, which encoders ignore.
+    """
+
+    def __init__(self, schema=FAKER_RECORD_SCHEMA, seed=0, pool_size=DEFAULT_POOL_SIZE,
+                 record_bytes=None, use_numpy=None, use_faker=None):
+        """
+        :param schema: The record_schema.Schema of the records.
+        :param seed: Seed of the pools and the sampling.
+        :param pool_size: Distinct values per field.
+        :param record_bytes: Pad each record to at least this many bytes.
+        :param use_numpy: Sample with NumPy. Defaults to whether it's installed.
+        :param use_faker: Build pools with Faker. Defaults to whether it's installed.
+        """
+        if use_numpy and numpy is None:
+            raise ValueError("NumPy is not installed")
+        if use_faker and Faker is None:
+            raise ValueError("Faker is not installed")
+        self.schema = schema
+        self.seed = seed
+        self.pool_size = pool_size
+        self.record_bytes = record_bytes
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.use_faker = Faker is not None if use_faker is None else use_faker
+        self.count = 0
+
+        pool_rng = random.Random(seed)
+        faker = None
+        if self.use_faker:
+            faker = Faker()
+            faker.seed_instance(seed)
+        self._head = ('{' + json.dumps('schema') + ': ' + json.dumps(schema.name) + ', ' +
+                      json.dumps('schema_version') + ': ' + str(schema.version)).encode('utf-8')
+        self._id_field = None
+        self._pools = []
+        for field_name, field_type in schema.fields:
+            if field_name == 'id' and field_type == 'string':
+                self._id_field = len(self._pools)
+                self._pools.append(None)
+                continue
+            values = [self._value(field_name, field_type, pool_rng, faker) for _ in range(pool_size)]
+            fragments = [f", {json.dumps(field_name)}: {json.dumps(v)}".encode('utf-8') for v in values]
+            self._pools.append(numpy.array(fragments, dtype=object) if self.use_numpy else fragments)
+        self._id_prefix = f'{seed & 0xffffffff:08x}-0000-4000-8000-'
+        self._sampler = numpy.random.default_rng(seed) if self.use_numpy else random.Random(seed + 1)
+        self._padding = b'x' * (record_bytes or 0)
+
+    @staticmethod
+    def _value(field_name, field_type, rng, faker):
+        if field_type == 'int':
+            return rng.randint(0, 1000000)
+        if field_type == 'float':
+            return round(rng.uniform(0, 1000), 3)
+        if field_type == 'bool':
+            return rng.random() < 0.5
+        if faker is not None and field_name in _FAKER_PROVIDERS:
+            return getattr(faker, _FAKER_PROVIDERS[field_name])()
+        return _STRING_BUILDERS.get(field_name, _word)(rng)
+
+    def _sample(self, pool, count):
+        if self.use_numpy:
+            return pool[self._sampler.integers(0, len(pool), count)].tolist()
+        return self._sampler.choices(pool, k=count)
+
+    def batch(self, count):
+        """Generate the next count records.
+
+        :param count: Number of records.
+        :return: List of JSON-encoded records as bytes, ready for put_records.
+        """
+        columns = [itertools.repeat(self._head, count)]
+        for index, pool in enumerate(self._pools):
+            if index == self._id_field:
+                columns.append([f', "id": "{self._id_prefix}{n:012x}"'.encode('ascii')
+                                for n in range(self.count, self.count + count)])
+            else:
+                columns.append(self._sample(pool, count))
+        columns.append(itertools.repeat(b'}', count))
+        self.count += count
+        records = [b''.join(parts) for parts in zip(*columns)]
+        if self.record_bytes:
+            records = [self._pad(record) for record in records]
+        return records
+
+    def _pad(self, record):
+        # ', "pad": ""' adds 11 bytes before the padding itself
+        missing = self.record_bytes - len(record) - 11
+        if missing < 0:
+            return record
+        return record[:-1] + b', "pad": "' + self._padding[:missing] + b'"}'
+
+    def records(self, total=None, batch_size=10000):
+        """Stream records batch by batch.
+
+        :param total: Number of records, or None for an endless stream.
+        :param batch_size: Records generated at a time.
+        :return: Generator of JSON-encoded records as bytes.
+        """
+        produced = 0
+        while total is None or produced < total:
+            count = batch_size if total is None else min(batch_size, total - produced)
+            yield from self.batch(count)
+            produced += count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure synthetic record generation speed.")
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--schema', default=FAKER_RECORD_SCHEMA.name)
+    parser.add_argument('--schema-version', type=int)
+    parser.add_argument('--record-bytes', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = SyntheticRecordGenerator(registry.get(args.schema, args.schema_version),
+                                         seed=args.seed, record_bytes=args.record_bytes)
+    start = time.perf_counter()
+    byte_count = sum(len(record) for record in generator.records(args.records))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'records': args.records,
+        'bytes': byte_count,
+        'numpy': generator.use_numpy,
+        'faker_pools': generator.use_faker,
+        'records_per_sec': round(args.records / elapsed),
+        'mb_per_sec': round(byte_count / elapsed / 1024 / 1024, 1),
+    }))
+
+
+if __name__ == '__main__':
+    main()
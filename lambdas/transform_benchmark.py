@@ -0,0 +1,85 @@
+
+import argparse
+import base64
+import json
+import time
+import uuid
+
+import lambda_transform_json_to_csv as transform
+
+# Firehose invokes the transform Lambda with at most 6 MB of request payload
+MAX_EVENT_BYTES = 6 * 1024 * 1024
+
+
+def build_firehose_event(target_bytes, record_template=None):
+    """Build a Firehose transformation event of roughly target_bytes.
+
+    :param target_bytes: Approximate serialized size of the event.
+    :param record_template: Dict used as the JSON payload of every record.
+    :return: The event dict.
+    """
+    record_template = record_template or {
+        "name": "Jane Doe",
+        "city": "Port Jennifer",
+        "phone": "(555) 010-4477",
+        "id": str(uuid.uuid4()),
+    }
+    records = []
+    size = 0
+    i = 0
+    while size < target_bytes:
+        data = base64.b64encode(json.dumps(record_template).encode('utf-8')).decode('ascii')
+        record = {
+            'recordId': f'{i:056d}',
+            'approximateArrivalTimestamp': 1700000000000,
+            'data': data,
+        }
+        records.append(record)
+        size += len(data) + 120
+        i += 1
+    return {
+        'invocationId': str(uuid.uuid4()),
+        'deliveryStreamArn': 'arn:aws:firehose:us-east-1:000000000000:deliverystream/benchmark',
+        'region': 'us-east-1',
+        'records': records,
+    }
+
+
+def run(event_bytes, iterations):
+    """Time the transform handler on an event of event_bytes.
+
+    :return: Dict with record count and best/average throughput.
+    """
+    event = build_firehose_event(event_bytes)
+    record_count = len(event['records'])
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = transform.handler(event, None)
+        timings.append(time.perf_counter() - start)
+        assert len(result['records']) == record_count
+    best = min(timings)
+    average = sum(timings) / len(timings)
+    return {
+        'event_mb': round(event_bytes / 1024 / 1024, 2),
+        'records': record_count,
+        'best_ms': round(best * 1000, 2),
+        'avg_ms': round(average * 1000, 2),
+        'records_per_sec': round(record_count / best),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Firehose JSON to CSV transform.")
+    parser.add_argument('--sizes-mb', type=float, nargs='+', default=[0.1, 1, 3, 6],
+                        help="Event sizes in MB (capped at Firehose's 6 MB)")
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    for size_mb in args.sizes_mb:
+        event_bytes = min(int(size_mb * 1024 * 1024), MAX_EVENT_BYTES)
+        print(json.dumps(run(event_bytes, args.iterations)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    A small thread-safe in-process cache whose entries expire after a TTL.
+
+    Values are loaded on demand. If reloading an expired entry fails, the
+    stale value is served and the reload is retried on the next call, so a
+    slow or failing backend doesn't take down callers that already had a
+    value.
+    """
+
+    def __init__(self, ttl_seconds, clock=time.monotonic):
+        """
+        :param ttl_seconds: How long a loaded value stays fresh.
+        :param clock: Function returning the current time in seconds.
+        """
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Return the cached value of key, calling loader() if it is missing or expired.
+
+        :param key: Cache key.
+        :param loader: Zero-argument function that loads the value.
+        :return: The value. Raises whatever loader raises if there is no stale value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        now = self._clock()
+        if entry is not None and now < entry[1]:
+            return entry[0]
+        try:
+            value = loader()
+        except Exception:
+            if entry is None:
+                raise
+            logger.warning("Refreshing %s failed; serving the cached value.", key, exc_info=True)
+            return entry[0]
+        self.set(key, value)
+        return value
+
+    def peek(self, key):
+        """Return the cached value of key if it is fresh, otherwise None."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self._clock() < entry[1]:
+            return entry[0]
+        return None
+
+    def set(self, key, value):
+        """Store a value with a fresh TTL."""
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+
+    def keys(self):
+        """Return a snapshot of the cached keys, fresh or expired."""
+        with self._lock:
+            return list(self._entries)
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
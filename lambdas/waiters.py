@@ -0,0 +1,99 @@
+
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_INITIAL_DELAY = 0.05
+DEFAULT_MAX_DELAY = 5.0
+
+
+class WaiterError(Exception):
+    """Raised by a check when the resource reached a state it will not recover from."""
+
+
+class WaiterTimeout(WaiterError):
+    """Raised when the deadline passes before the resource is ready."""
+
+
+def wait_until(check, timeout=DEFAULT_TIMEOUT, initial_delay=DEFAULT_INITIAL_DELAY,
+               max_delay=DEFAULT_MAX_DELAY, factor=2.0, description='resource'):
+    """Poll check() with exponential backoff until it succeeds or the deadline passes.
+
+    Polling starts after a few milliseconds and backs off towards max_delay,
+    so resources that are ready almost at once (as on LocalStack) are picked
+    up quickly while slow ones aren't hammered.
+
+    :param check: Function returning True when ready and False to keep waiting.
+                  It raises WaiterError for a terminal failure.
+    :param timeout: Overall deadline in seconds.
+    :param initial_delay: First delay between polls in seconds.
+    :param max_delay: Upper bound of the delay between polls in seconds.
+    :param factor: Backoff multiplier.
+    :param description: What is being waited for, used in messages.
+    :return: Seconds waited. Raises WaiterTimeout when the deadline passes.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial_delay
+    attempts = 0
+    while True:
+        attempts += 1
+        if check():
+            waited = time.monotonic() - started
+            logger.debug("%s ready after %.3fs and %d checks", description, waited, attempts)
+            return waited
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise WaiterTimeout(f"{description} not ready after {timeout}s ({attempts} checks)")
+        # Jitter keeps concurrent waiters from polling in lockstep
+        time.sleep(min(delay * random.uniform(0.8, 1.2), remaining))
+        delay = min(delay * factor, max_delay)
+
+
+def wait_all(checks, timeout=DEFAULT_TIMEOUT, max_workers=None, **backoff):
+    """Wait for many resources at once under one shared deadline.
+
+    :param checks: Dict of description to check function, as for wait_until.
+    :param timeout: Overall deadline in seconds for all of them.
+    :param max_workers: Concurrent waiters. Defaults to one per check.
+    :param backoff: initial_delay, max_delay and factor for wait_until.
+    :return: Dict of description to True if ready, or the WaiterError raised.
+    """
+    if not checks:
+        return {}
+    deadline = time.monotonic() + timeout
+
+    def wait_one(description, check):
+        try:
+            wait_until(check, timeout=max(deadline - time.monotonic(), 0),
+                       description=description, **backoff)
+            return True
+        except WaiterError as e:
+            logger.error(e)
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(checks)) as executor:
+        futures = {description: executor.submit(wait_one, description, check)
+                   for description, check in checks.items()}
+        return {description: future.result() for description, future in futures.items()}
+
+
+def status_check(get_status, ready='ACTIVE', failed=('DELETING',), description='resource'):
+    """Build a check from a function that returns a resource's status string.
+
+    :param get_status: Function returning the current status.
+    :param ready: Status that means ready.
+    :param failed: Statuses that mean the resource will never become ready.
+    :param description: What is being waited for, used in messages.
+    :return: A check function for wait_until.
+    """
+    def check():
+        status = get_status()
+        if status in failed:
+            raise WaiterError(f"{description} is {status}")
+        return status == ready
+    return check
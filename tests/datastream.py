@@ -1,38 +1,25 @@
 import boto3
-import json
-from datetime import datetime
-import calendar
 import os
-import time
-import json
-from faker import Faker
-import uuid
+import sys
 import typing
-from time import sleep
 if typing.TYPE_CHECKING:
     from mypy_boto3_kinesis import KinesisClient
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from kinesis_producer import KinesisBatchProducer
+from synthetic_records import SyntheticRecordGenerator
+
 os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 
 my_stream_name = 'kinesis_test_stream'
+record_count = int(os.getenv("RECORD_COUNT", "9"))
 kinesis_client: "KinesisClient" = boto3.client(
     "kinesis", endpoint_url="http://localhost.localstack.cloud:4566",region_name='us-east-1', 
 )
-faker = Faker()
-for i in range(1, 10):
-    json_data = {
-        "name":faker.name(),
-        "city":faker.city(),
-        "phone":faker.phone_number(),
-        "id":uuid.uuid4().__str__()
-    }
-    print(json_data)
-    sleep(0.5)
-
-    put_response = kinesis_client.put_record(
-        StreamName=my_stream_name,
-        Data=json.dumps(json_data),
-        PartitionKey='name')
-    print(put_response)
\ No newline at end of file
+generator = SyntheticRecordGenerator(seed=int(os.getenv("RECORD_SEED", "0")))
+with KinesisBatchProducer.for_stream(kinesis_client, my_stream_name) as producer:
+    for record in generator.records(record_count):
+        producer.put(record)
+print(producer.stats.summary())
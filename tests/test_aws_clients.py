@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("boto3")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import aws_clients
+
+
+class FakeSession:
+    """Hands out plain objects that remember how they were created."""
+
+    created = []
+
+    def client(self, service_name, endpoint_url, region_name, config):
+        client = type('FakeClient', (), {'service_name': service_name, 'endpoint_url': endpoint_url,
+                                         'region_name': region_name, 'config': config})()
+        FakeSession.created.append(client)
+        return client
+
+    resource = client
+
+
+@pytest.fixture(autouse=True)
+def fake_session(monkeypatch):
+    FakeSession.created = []
+    monkeypatch.setattr(aws_clients.boto3.session, 'Session', FakeSession)
+    monkeypatch.setattr(aws_clients, '_session', None)
+    monkeypatch.setattr(aws_clients, '_settings', dict(aws_clients._settings))
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    aws_clients.clear()
+    yield
+    aws_clients.clear()
+
+
+def test_clients_are_cached_per_service_endpoint_and_region():
+    kinesis = aws_clients.get_client('kinesis')
+
+    assert aws_clients.get_client('kinesis') is kinesis
+    assert aws_clients.get_client('kinesis', region_name='us-east-1') is kinesis
+    assert kinesis.region_name == 'us-east-1'
+    others = {aws_clients.get_client('s3'), aws_clients.get_client('kinesis', endpoint_url=None),
+              aws_clients.get_client('kinesis', region_name='eu-west-1')}
+    assert kinesis not in others and len(others) == 3
+    assert len(FakeSession.created) == 4
+    # Resources have their own cache
+    assert aws_clients.get_resource('s3') is aws_clients.get_resource('s3')
+    assert len(FakeSession.created) == 5
+
+
+def test_configure_rebuilds_clients_with_the_new_settings():
+    before = aws_clients.get_client('lambda')
+
+    aws_clients.configure(max_pool_connections=7, read_timeout=3, max_attempts=2, retry_mode='standard')
+    after = aws_clients.get_client('lambda')
+
+    assert after is not before
+    assert after.config.max_pool_connections == 7
+    assert after.config.read_timeout == 3
+    assert after.config.retries == {'max_attempts': 2, 'mode': 'standard'}
+    assert before.config.max_pool_connections != 7
+
+
+def test_configure_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        aws_clients.configure(pool_size=7)
+
+
+def test_lazy_client_is_created_on_first_attribute_access():
+    s3 = aws_clients.lazy_client('s3')
+    assert FakeSession.created == []
+
+    assert s3.service_name == 's3'
+    assert s3.endpoint_url == aws_clients.LOCALSTACK_ENDPOINT
+    assert len(FakeSession.created) == 1
+    # Later accesses reuse the cached client
+    assert s3.config is aws_clients.get_client('s3').config
+    assert len(FakeSession.created) == 1
+
+
+def test_importing_a_handler_creates_no_client(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'lambda_upload_image_to_s3', raising=False)
+
+    import lambda_upload_image_to_s3
+
+    assert FakeSession.created == []
+    assert lambda_upload_image_to_s3.s3.service_name == 's3'
+    assert len(FakeSession.created) == 1
@@ -0,0 +1,70 @@
+import io
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from chunked_upload import ChunkedUploader, UploadError
+
+
+class FakeUploadFunction:
+    """Answers upload requests like upload-image-to-s3 and keeps parts in memory."""
+
+    def __init__(self, fail_part=None):
+        self.parts = {}
+        self.objects = {}
+        self.aborted = []
+        self.fail_part = fail_part
+        self.part_attempts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, action, params, body=b'', headers=None):
+        if action == 'initiate':
+            return 200, {'uploadId': 'upload-1', 'key': f"{headers.get('filename', 'generated')}.png"}
+        if action == 'part':
+            number = params['partNumber']
+            with self._lock:
+                self.part_attempts[number] = self.part_attempts.get(number, 0) + 1
+                if number == self.fail_part:
+                    return 400, {'message': 'Bad part'}
+                # The first attempt of every second part is throttled
+                if number % 2 == 0 and self.part_attempts[number] == 1:
+                    return 429, {'message': 'Too many requests'}
+                self.parts[number] = body
+            return 200, {'partNumber': number, 'etag': f'"etag-{number}"'}
+        if action == 'complete':
+            parts = json.loads(body)['parts']
+            self.objects[params['key']] = b''.join(self.parts[part['partNumber']] for part in
+                                                   sorted(parts, key=lambda part: part['partNumber']))
+            return 200, {'success': True, 's3_url': f"https://bucket/{params['key']}"}
+        if action == 'abort':
+            self.aborted.append(params['uploadId'])
+            return 200, {'success': True, 'aborted': True}
+
+
+def test_parts_are_sent_in_parallel_and_reassembled_in_order():
+    data = os.urandom(10 * 1024 + 123)
+    function = FakeUploadFunction()
+    uploader = ChunkedUploader(function, part_size=1024, concurrency=3, backoff_base=0.001)
+
+    result = uploader.upload(io.BytesIO(data), filename='big-image')
+
+    assert result['key'] == 'big-image.png'
+    assert result['parts'] == 11
+    assert result['bytes'] == len(data)
+    assert function.objects['big-image.png'] == data
+    assert function.part_attempts[2] == 2
+
+
+def test_failed_part_aborts_the_upload():
+    function = FakeUploadFunction(fail_part=3)
+    uploader = ChunkedUploader(function, part_size=1024, concurrency=2)
+
+    with pytest.raises(UploadError):
+        uploader.upload(io.BytesIO(os.urandom(5 * 1024)))
+
+    assert function.aborted == ['upload-1']
+    assert function.objects == {}
@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from firehose_emulator import FirehoseEmulator, LocalS3, percentile
+
+RECORD = {"name": "Jane Doe", "city": "Port Jennifer", "phone": "(555) 010-4477", "id": "42"}
+
+
+def _objects(s3, prefix=''):
+    keys = [o['Key'] for page in s3.get_paginator('list_objects_v2').paginate(Bucket='local-firehose', Prefix=prefix)
+            for o in page['Contents']]
+    return [s3.get_object(Bucket='local-firehose', Key=key)['Body'].read() for key in keys]
+
+
+def test_full_buffer_is_transformed_and_written_to_s3():
+    s3 = LocalS3()
+    emulator = FirehoseEmulator(s3_client=s3, buffer_size_mb=0.001, s3_buffer_size_mb=0.0001)
+    emulator.put_record_batch(Records=[{'Data': json.dumps(RECORD).encode('utf-8')}] * 20)
+
+    body = b''.join(_objects(s3))
+    assert body.decode('utf-8').splitlines()[0] == 'Jane Doe,Port Jennifer,(555) 010-4477,42'
+    assert emulator.stats.invocations
+    emulator.close()
+    assert emulator.stats.records_ok == 20
+
+
+def test_partial_buffers_are_flushed_after_the_interval():
+    s3 = LocalS3()
+    with FirehoseEmulator(s3_client=s3, buffer_interval_seconds=0.05, s3_buffer_interval_seconds=0.05) as emulator:
+        emulator.put_record(Record={'Data': json.dumps(RECORD)})
+        deadline = time.monotonic() + 2
+        while not _objects(s3) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(_objects(s3)) == 1
+
+    summary = emulator.stats.summary()
+    assert summary['records_delivered'] == 1
+    assert summary['flush_latency_ms_max'] >= 50
+
+
+def test_failed_records_go_to_the_error_prefix():
+    s3 = LocalS3()
+    with FirehoseEmulator(s3_client=s3) as emulator:
+        emulator.put_record(Record={'Data': b'not json'})
+        emulator.put_record(Record={'Data': json.dumps(RECORD)})
+
+    errors = [json.loads(line) for body in _objects(s3, 'processing-failed/') for line in body.splitlines()]
+    assert [e['errorCode'] for e in errors] == ['Lambda.ProcessingFailed']
+    assert emulator.stats.records_failed == 1
+    assert emulator.stats.records_ok == 1
+
+
+def test_buffering_hints_are_read_from_the_destination_config():
+    emulator = FirehoseEmulator.from_destination_config({
+        'BucketARN': 'arn:aws:s3:::my-bucket',
+        'BufferingHints': {'IntervalInSeconds': 60, 'SizeInMBs': 64},
+        'ProcessingConfiguration': {'Processors': [{'Type': 'Lambda', 'Parameters': [
+            {'ParameterName': 'BufferSizeInMBs', 'ParameterValue': '1'},
+            {'ParameterName': 'BufferIntervalInSeconds', 'ParameterValue': '30'},
+        ]}]},
+    })
+    emulator.close()
+
+    assert emulator.bucket == 'my-bucket'
+    assert emulator.buffer_bytes == 1024 * 1024
+    assert emulator.buffer_interval_seconds == 30
+    assert emulator.s3_buffer_bytes == 64 * 1024 * 1024
+
+
+def test_batches_over_the_service_limit_are_rejected():
+    with FirehoseEmulator() as emulator:
+        with pytest.raises(ValueError):
+            emulator.put_record_batch(Records=[{'Data': b'{}'}] * 501)
+
+
+def test_gzip_compression_is_read_from_the_destination_config():
+    s3 = LocalS3()
+    with FirehoseEmulator.from_destination_config({'CompressionFormat': 'GZIP'}, s3_client=s3) as emulator:
+        emulator.put_record(Record={'Data': json.dumps(RECORD)})
+
+    keys = [o['Key'] for o in s3.list_objects_v2(Bucket='local-firehose')['Contents']]
+    assert len(keys) == 1 and keys[0].endswith('.gz')
+    assert gzip.decompress(_objects(s3)[0]) == b'Jane Doe,Port Jennifer,(555) 010-4477,42\n'
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([], 50) == 0.0
+    assert percentile([7], 99) == 7
+    ten = list(range(10, 0, -1))
+    assert percentile(ten, 50) == 5
+    assert percentile(ten, 90) == 9
+    assert percentile(ten, 91) == 10
+    hundred = list(range(1, 101))
+    assert percentile(hundred, 29) == 29
+    assert percentile(hundred, 50) == 50
+    assert percentile(hundred, 95) == 95
+    assert percentile(hundred, 99) == 99
+    assert percentile(hundred, 100) == 100
+    assert percentile(hundred, 0) == 1
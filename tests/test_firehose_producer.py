@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("botocore")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from firehose_emulator import FirehoseEmulator
+from firehose_producer import FirehoseBatchProducer
+from kinesis_producer import ProducerStats
+
+
+class FlakyFirehose:
+    """Fails every third record the first time it is sent."""
+
+    def __init__(self):
+        self.calls = []
+        self.received = []
+        self.attempted = set()
+        self._lock = threading.Lock()
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        with self._lock:
+            self.calls.append(len(Records))
+            responses = []
+            for record in Records:
+                first_attempt = record['Data'] not in self.attempted
+                self.attempted.add(record['Data'])
+                if first_attempt and len(self.attempted) % 3 == 1:
+                    responses.append({'ErrorCode': 'ServiceUnavailableException', 'ErrorMessage': 'Slow down'})
+                else:
+                    self.received.append(record['Data'])
+                    responses.append({'RecordId': str(len(self.received))})
+        return {'FailedPutCount': sum('ErrorCode' in r for r in responses), 'RequestResponses': responses}
+
+
+def test_batches_respect_the_record_limit_and_only_failed_entries_are_resent():
+    firehose = FlakyFirehose()
+    with FirehoseBatchProducer(firehose, 'stream', senders=3, backoff_base=0.001) as producer:
+        for n in range(1200):
+            producer.put(f'{{"id": {n}}}')
+
+    assert sorted(firehose.received) == sorted(f'{{"id": {n}}}'.encode() for n in range(1200))
+    assert max(firehose.calls) == 500
+    assert producer.stats.records_failed == 0
+    assert producer.stats.records_retried == 400
+
+
+def test_batches_respect_the_byte_limit():
+    firehose = FlakyFirehose()
+    with FirehoseBatchProducer(firehose, 'stream', backoff_base=0.001) as producer:
+        for _ in range(10):
+            producer.put(b'x' * (900 * 1024))
+
+    assert len(firehose.received) == 10
+    assert all(count <= 4 for count in firehose.calls)
+
+
+def test_producer_writes_to_the_emulator_with_delimiters():
+    with FirehoseEmulator(transform_handler=None) as emulator:
+        with FirehoseBatchProducer(emulator, 'local-firehose', record_delimiter=b'\n') as producer:
+            producer.put('a')
+            producer.put('b')
+
+    assert emulator.stats.records_ok == 2
+    assert emulator.stats.bytes_delivered == 4
+
+
+class RacyStats(ProducerStats):
+    """Yields to other threads between reading and writing user_records."""
+
+    @property
+    def user_records(self):
+        value = self._user_records
+        time.sleep(0)
+        return value
+
+    @user_records.setter
+    def user_records(self, value):
+        self._user_records = value
+
+
+def test_puts_from_several_threads_are_all_counted():
+    producer = FirehoseBatchProducer(FlakyFirehose(), 'stream', senders=2, backoff_base=0.001)
+    producer.stats = RacyStats()
+
+    def put_many(thread):
+        for n in range(200):
+            producer.put(f'{thread}-{n}')
+    workers = [threading.Thread(target=put_many, args=(thread,)) for thread in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    producer.close()
+
+    assert producer.stats.user_records == 1600
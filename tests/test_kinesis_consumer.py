@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("botocore")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from kinesis_consumer import FileCheckpointStore, KinesisShardConsumer
+from kpl_aggregation import RecordAggregator
+
+
+class FakeKinesis:
+    """Serves fixed records per shard, one record per GetRecords call."""
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.iterator_requests = []
+
+    def list_shards(self, StreamName):
+        return {'Shards': [{'ShardId': shard_id, **parents} for shard_id, (parents, _) in self.shards.items()]}
+
+    def get_shard_iterator(self, StreamName, ShardId, ShardIteratorType, **kwargs):
+        self.iterator_requests.append((ShardId, ShardIteratorType, kwargs))
+        records = self.shards[ShardId][1]
+        start = 0
+        if ShardIteratorType == 'AFTER_SEQUENCE_NUMBER':
+            start = [r['SequenceNumber'] for r in records].index(kwargs['StartingSequenceNumber']) + 1
+        return {'ShardIterator': f'{ShardId}:{start}'}
+
+    def get_records(self, ShardIterator, Limit):
+        shard_id, position = ShardIterator.rsplit(':', 1)
+        records = self.shards[shard_id][1][int(position):int(position) + 1]
+        next_iterator = f'{shard_id}:{int(position) + 1}' if records else None
+        return {'Records': records, 'NextShardIterator': next_iterator, 'MillisBehindLatest': 0}
+
+
+def _record(sequence_number, data, partition_key='pk'):
+    return {'SequenceNumber': str(sequence_number), 'Data': data, 'PartitionKey': partition_key}
+
+
+def _consumer(kinesis, **kwargs):
+    return KinesisShardConsumer(kinesis, 'stream', poll_interval=0.01, idle_seconds=0.05, **kwargs)
+
+
+def test_all_shards_are_read_and_aggregates_split(monkeypatch):
+    monkeypatch.setattr('kinesis_consumer.MIN_GET_RECORDS_INTERVAL', 0)
+    aggregator = RecordAggregator()
+    aggregator.add(b'a', 'k1')
+    aggregator.add(b'b', 'k2')
+    aggregate, _, _ = aggregator.flush()
+    kinesis = FakeKinesis({
+        'shard-0': ({}, [_record(1, b'x'), _record(2, b'y')]),
+        'shard-1': ({}, [_record(3, aggregate)]),
+    })
+    seen = []
+
+    stats = _consumer(kinesis).consume(lambda shard_id, records: seen.extend(
+        (shard_id, r['Data'], r['PartitionKey']) for r in records))
+
+    assert sorted(seen) == [('shard-0', b'x', 'pk'), ('shard-0', b'y', 'pk'),
+                            ('shard-1', b'a', 'k1'), ('shard-1', b'b', 'k2')]
+    assert stats.summary()['user_records'] == 4
+    assert stats.summary()['out_of_order'] == 0
+
+
+def test_restart_resumes_after_the_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr('kinesis_consumer.MIN_GET_RECORDS_INTERVAL', 0)
+    records = [_record(1, b'x'), _record(2, b'y')]
+    kinesis = FakeKinesis({'shard-0': ({}, records)})
+    store = FileCheckpointStore(str(tmp_path / 'checkpoints.json'))
+    _consumer(kinesis, checkpoint_store=store).consume(lambda shard_id, batch: None)
+
+    records.append(_record(3, b'z'))
+    seen = []
+    _consumer(kinesis, checkpoint_store=FileCheckpointStore(store.path)).consume(
+        lambda shard_id, batch: seen.extend(r['Data'] for r in batch))
+
+    assert seen == [b'z']
+    assert kinesis.iterator_requests[-1] == ('shard-0', 'AFTER_SEQUENCE_NUMBER', {'StartingSequenceNumber': '2'})
+
+
+def test_child_shard_is_read_after_its_parent(monkeypatch):
+    monkeypatch.setattr('kinesis_consumer.MIN_GET_RECORDS_INTERVAL', 0)
+    kinesis = FakeKinesis({
+        'parent': ({}, [_record(1, b'old'), _record(2, b'older')]),
+        'child': ({'ParentShardId': 'parent'}, [_record(3, b'new')]),
+    })
+    seen = []
+
+    _consumer(kinesis, max_workers=2).consume(lambda shard_id, batch: seen.extend(r['Data'] for r in batch))
+
+    assert seen == [b'old', b'older', b'new']
+
+
+def test_children_listed_first_do_not_starve_their_parents_of_workers(monkeypatch):
+    monkeypatch.setattr('kinesis_consumer.MIN_GET_RECORDS_INTERVAL', 0)
+    kinesis = FakeKinesis({
+        'merged': ({'ParentShardId': 'split-a', 'AdjacentParentShardId': 'split-b'}, [_record(5, b'merged')]),
+        'split-a': ({'ParentShardId': 'root'}, [_record(3, b'a')]),
+        'split-b': ({'ParentShardId': 'root'}, [_record(4, b'b')]),
+        'root': ({}, [_record(1, b'root')]),
+    })
+    seen = []
+    consumer = _consumer(kinesis, max_workers=1)
+    reader = threading.Thread(target=consumer.consume,
+                              args=(lambda shard_id, batch: seen.extend(r['Data'] for r in batch),), daemon=True)
+    reader.start()
+    reader.join(timeout=10)
+
+    assert not reader.is_alive(), "consume() deadlocked"
+    assert seen[0] == b'root'
+    assert sorted(seen[1:3]) == [b'a', b'b']
+    assert seen[3] == b'merged'
+
+
+def test_start_timestamp_uses_at_timestamp(monkeypatch):
+    monkeypatch.setattr('kinesis_consumer.MIN_GET_RECORDS_INTERVAL', 0)
+    kinesis = FakeKinesis({'shard-0': ({}, [])})
+
+    _consumer(kinesis, start_timestamp=1700000000).consume(lambda shard_id, batch: None)
+
+    shard_id, iterator_type, kwargs = kinesis.iterator_requests[0]
+    assert iterator_type == 'AT_TIMESTAMP'
+    assert kwargs['Timestamp'].timestamp() == 1700000000
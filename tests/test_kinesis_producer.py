@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("botocore")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from kinesis_producer import KinesisBatchProducer, ProducerStats
+
+
+class FakeKinesis:
+    """Records PutRecords calls; entries listed in fail_once fail on their first send."""
+
+    def __init__(self, fail_once=(), error_code='ProvisionedThroughputExceededException'):
+        self.calls = []
+        self.received = []
+        self.fail_once = set(fail_once)
+        self.error_code = error_code
+        self._lock = threading.Lock()
+
+    def put_records(self, StreamName, Records):
+        with self._lock:
+            self.calls.append([record['Data'] for record in Records])
+            results = []
+            for record in Records:
+                if record['Data'] in self.fail_once:
+                    self.fail_once.discard(record['Data'])
+                    results.append({'ErrorCode': self.error_code, 'ErrorMessage': 'Rate exceeded'})
+                else:
+                    self.received.append(record['Data'])
+                    results.append({'SequenceNumber': str(len(self.received)), 'ShardId': 'shardId-0'})
+        return {'FailedRecordCount': sum('ErrorCode' in r for r in results), 'Records': results}
+
+
+def test_batch_is_sent_when_it_reaches_max_records():
+    kinesis = FakeKinesis()
+    with KinesisBatchProducer(kinesis, 'stream', max_records=10, linger_seconds=60) as producer:
+        for n in range(25):
+            producer.put(f'record-{n}', partition_key='key')
+        assert [len(call) for call in kinesis.calls] == [10, 10]
+
+    assert [len(call) for call in kinesis.calls] == [10, 10, 5]
+    assert kinesis.received == [f'record-{n}'.encode('utf-8') for n in range(25)]
+
+
+def test_batch_is_sent_before_it_exceeds_max_bytes():
+    kinesis = FakeKinesis()
+    # Each record is 100 bytes of data plus a 3 byte partition key
+    with KinesisBatchProducer(kinesis, 'stream', max_bytes=250, linger_seconds=60) as producer:
+        for _ in range(5):
+            producer.put(b'x' * 100, partition_key='key')
+
+    assert [len(call) for call in kinesis.calls] == [2, 2, 1]
+
+
+def test_batch_is_sent_after_linger_seconds():
+    kinesis = FakeKinesis()
+    with KinesisBatchProducer(kinesis, 'stream', linger_seconds=0.05) as producer:
+        producer.put(b'lonely', partition_key='key')
+        deadline = time.monotonic() + 2
+        while not kinesis.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert kinesis.calls == [[b'lonely']]
+
+
+def test_only_failed_entries_are_resent():
+    kinesis = FakeKinesis(fail_once={b'record-1', b'record-3'})
+    with KinesisBatchProducer(kinesis, 'stream', linger_seconds=60, backoff_base=0.001) as producer:
+        for n in range(5):
+            producer.put(f'record-{n}', partition_key='key')
+
+    assert len(kinesis.calls) == 2
+    assert kinesis.calls[1] == [b'record-1', b'record-3']
+    assert sorted(kinesis.received) == [f'record-{n}'.encode('utf-8') for n in range(5)]
+    assert producer.stats.records_retried == 2
+    assert producer.stats.records_failed == 0
+
+
+def test_non_retryable_errors_are_not_resent():
+    kinesis = FakeKinesis(fail_once={b'record-0'}, error_code='AccessDeniedException')
+    with KinesisBatchProducer(kinesis, 'stream', linger_seconds=60) as producer:
+        producer.put(b'record-0', partition_key='key')
+        producer.put(b'record-1', partition_key='key')
+
+    assert len(kinesis.calls) == 1
+    assert producer.stats.records_failed == 1
+
+
+def test_concurrent_senders_deliver_every_record():
+    kinesis = FakeKinesis()
+    with KinesisBatchProducer(kinesis, 'stream', max_records=7, linger_seconds=60, senders=4) as producer:
+        for n in range(200):
+            producer.put(f'record-{n}', partition_key=str(n))
+        producer.flush()
+        assert len(kinesis.received) == 200
+
+    assert sorted(kinesis.received) == sorted(f'record-{n}'.encode('utf-8') for n in range(200))
+    assert producer.stats.records_sent == 200
+
+
+class RacyStats(ProducerStats):
+    """Yields to other threads between reading and writing user_records."""
+
+    @property
+    def user_records(self):
+        value = self._user_records
+        time.sleep(0)
+        return value
+
+    @user_records.setter
+    def user_records(self, value):
+        self._user_records = value
+
+
+def put_from_threads(producer, threads=8, records=200, **put_kwargs):
+    def put_many(thread):
+        for n in range(records):
+            producer.put(f'{thread}-{n}', **put_kwargs)
+    workers = [threading.Thread(target=put_many, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@pytest.mark.parametrize('aggregate', [False, True])
+def test_puts_from_several_threads_are_all_counted(aggregate):
+    producer = KinesisBatchProducer(FakeKinesis(), 'stream', max_records=50, linger_seconds=60,
+                                    aggregate=aggregate)
+    producer.stats = RacyStats()
+
+    put_from_threads(producer, partition_key='key')
+    producer.close()
+
+    assert producer.stats.user_records == 1600
@@ -0,0 +1,116 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("botocore")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import kinesis_shards
+from kinesis_shards import Partitioner, ShardMap, TokenBucket, hash_key_for_partition_key
+
+MAX_HASH_KEY = 2 ** 128 - 1
+QUARTER = 2 ** 126
+
+
+def _shard(shard_id, start, end, closed=False):
+    shard = {
+        'ShardId': shard_id,
+        'HashKeyRange': {'StartingHashKey': str(start), 'EndingHashKey': str(end)},
+        'SequenceNumberRange': {'StartingSequenceNumber': '1'},
+    }
+    if closed:
+        shard['SequenceNumberRange']['EndingSequenceNumber'] = '2'
+    return shard
+
+
+def _four_shards():
+    # Listed out of order, plus a closed parent that must be ignored
+    return [
+        _shard('shardId-2', 2 * QUARTER, 3 * QUARTER - 1),
+        _shard('shardId-0', 0, QUARTER - 1),
+        _shard('shardId-3', 3 * QUARTER, MAX_HASH_KEY),
+        _shard('shardId-1', QUARTER, 2 * QUARTER - 1),
+        _shard('shardId-parent', 0, MAX_HASH_KEY, closed=True),
+    ]
+
+
+def test_shard_map_finds_the_shard_of_a_hash_key():
+    shard_map = ShardMap(_four_shards())
+
+    assert shard_map.shard_ids == ['shardId-0', 'shardId-1', 'shardId-2', 'shardId-3']
+    assert shard_map.shard_for_hash_key(0) == 'shardId-0'
+    assert shard_map.shard_for_hash_key(QUARTER - 1) == 'shardId-0'
+    assert shard_map.shard_for_hash_key(QUARTER) == 'shardId-1'
+    assert shard_map.shard_for_hash_key(3 * QUARTER - 1) == 'shardId-2'
+    assert shard_map.shard_for_hash_key(MAX_HASH_KEY) == 'shardId-3'
+
+
+def test_shard_map_needs_an_open_shard():
+    with pytest.raises(ValueError):
+        ShardMap([_shard('shardId-0', 0, MAX_HASH_KEY, closed=True)])
+
+
+def test_partitioner_routes_partition_keys_by_md5():
+    shard_map = ShardMap(_four_shards())
+    partitioner = Partitioner(shard_map)
+
+    for key in ('Port Jennifer', 'Lake Amy', 'New Diane'):
+        shard_id, explicit_hash_key = partitioner.assign(key)
+        assert explicit_hash_key is None
+        assert shard_id == shard_map.shard_for_hash_key(hash_key_for_partition_key(key))
+
+
+def test_partitioner_spreads_keyless_records_with_explicit_hash_keys():
+    shard_map = ShardMap(_four_shards())
+    partitioner = Partitioner(shard_map)
+
+    assigned = [partitioner.assign() for _ in range(8)]
+
+    assert [shard_id for shard_id, _ in assigned] == shard_map.shard_ids * 2
+    for shard_id, explicit_hash_key in assigned:
+        # The explicit hash key lands inside the shard's own range
+        assert shard_map.shard_for_hash_key(int(explicit_hash_key)) == shard_id
+        assert partitioner.explicit_hash_key_for(shard_id) == explicit_hash_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(kinesis_shards.time, 'monotonic', fake.monotonic)
+    monkeypatch.setattr(kinesis_shards.time, 'sleep', fake.sleep)
+    return fake
+
+
+def test_token_bucket_starts_full_and_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=100)
+
+    assert bucket.acquire(100) == 0
+    assert clock.sleeps == []
+
+    # Empty: 50 tokens take half a second to refill
+    assert bucket.acquire(50) == pytest.approx(0.5)
+    clock.now += 10
+    # Refill is capped at the capacity
+    assert bucket.acquire(100) == 0
+    assert bucket.acquire(1) == pytest.approx(0.01)
+
+
+def test_token_bucket_admits_oversized_requests_into_debt(clock):
+    bucket = TokenBucket(rate=100)
+
+    assert bucket.acquire(300) == 0
+    # The 200 token debt plus the next token must refill first
+    assert bucket.acquire(1) == pytest.approx(2.01)
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from kpl_aggregation import (DIGEST_SIZE, MAGIC, RecordAggregator, _length_delimited, deaggregate,
+                             is_aggregated)
+
+
+def test_round_trip_keeps_data_and_keys_in_order():
+    aggregator = RecordAggregator()
+    user_records = [(f'{{"n": {n}}}'.encode('utf-8'), f'key-{n % 3}', None) for n in range(50)]
+    user_records.append((b'routed', 'key-0', '12345678901234567890'))
+    for data, partition_key, explicit_hash_key in user_records:
+        assert aggregator.add(data, partition_key, explicit_hash_key) is None
+
+    data, partition_key, explicit_hash_key = aggregator.flush()
+
+    assert is_aggregated(data)
+    assert partition_key == 'key-0'
+    assert explicit_hash_key == '12345678901234567890'
+    assert deaggregate(data) == user_records
+    assert len(aggregator) == 0
+    assert aggregator.flush() is None
+
+
+def test_aggregates_respect_max_bytes():
+    aggregator = RecordAggregator(max_bytes=1024)
+    finished = []
+    for n in range(100):
+        aggregate = aggregator.add(b'x' * 90, f'key-{n}')
+        if aggregate:
+            finished.append(aggregate)
+    finished.append(aggregator.flush())
+
+    assert len(finished) > 1
+    for data, partition_key, _ in finished:
+        # The Kinesis record size counts the partition key too
+        assert len(data) + len(partition_key.encode('utf-8')) <= 1024
+    assert sum(len(deaggregate(data)) for data, _, _ in finished) == 100
+
+
+def test_record_that_can_never_fit_is_rejected():
+    aggregator = RecordAggregator(max_bytes=100)
+    with pytest.raises(ValueError):
+        aggregator.add(b'x' * 200, 'key')
+
+
+def test_corrupted_digest_or_magic_is_not_treated_as_aggregated():
+    aggregator = RecordAggregator()
+    aggregator.add(b'payload', 'key')
+    data, _, _ = aggregator.flush()
+    assert data.startswith(MAGIC)
+    assert data[-DIGEST_SIZE:] == hashlib.md5(data[len(MAGIC):-DIGEST_SIZE]).digest()
+
+    bad_digest = data[:-1] + bytes([data[-1] ^ 0xFF])
+    bad_magic = b'\x00' + data[1:]
+    for corrupted in (bad_digest, bad_magic):
+        assert not is_aggregated(corrupted)
+        assert deaggregate(corrupted) == [(corrupted, None, None)]
+
+
+def test_plain_records_pass_through():
+    for data in (b'{"name": "Jane"}', b'', MAGIC, MAGIC + b'short'):
+        assert not is_aggregated(data)
+        assert deaggregate(data) == [(data, None, None)]
+
+
+def forge_aggregate(message):
+    """Wrap a hand-built AggregatedRecord message with the magic bytes and a valid digest."""
+    return MAGIC + message + hashlib.md5(message).digest()
+
+
+def _record(*fields):
+    return _length_delimited(3, b''.join(fields) + _length_delimited(3, b'data'))
+
+
+@pytest.mark.parametrize('message', [
+    # partition_key_index 5 of a one-entry table
+    _length_delimited(1, b'key') + _record(b'\x08\x05'),
+    # explicit_hash_key_index 1 of an empty table
+    _length_delimited(1, b'key') + _record(b'\x08\x00', b'\x10\x01'),
+    # partition key table entry sent as a varint
+    b'\x08\x01' + _record(b'\x08\x00'),
+    # truncated varint inside a record
+    _length_delimited(1, b'key') + _length_delimited(3, b'\x08\x80'),
+    # truncated fixed64 field
+    _length_delimited(1, b'key') + b'\x21\x00',
+])
+def test_malformed_aggregate_with_a_valid_digest_raises_value_error(message):
+    data = forge_aggregate(message)
+    assert is_aggregated(data)
+
+    with pytest.raises(ValueError):
+        deaggregate(data)
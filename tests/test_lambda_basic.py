@@ -0,0 +1,124 @@
+import base64
+import hashlib
+import os
+import sys
+import types
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import lambda_basic
+
+ROLE = types.SimpleNamespace(arn='arn:aws:iam::000000000000:role/lambda-role')
+HANDLER = 'lambda_upload_image_to_s3.handler'
+FUNCTION_ARN = 'arn:aws:lambda:us-east-1:000000000000:function:upload-image-to-s3'
+
+
+@pytest.fixture
+def stubbed_lambda():
+    client = boto3.client('lambda', region_name='us-east-1',
+                          aws_access_key_id='test', aws_secret_access_key='test')
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def _configuration(package, handler=HANDLER, role=ROLE.arn):
+    return {
+        'FunctionName': 'upload-image-to-s3',
+        'FunctionArn': FUNCTION_ARN,
+        'CodeSha256': lambda_basic.package_code_sha256(package),
+        'Handler': handler,
+        'Role': role,
+        'Environment': {'Variables': {}},
+    }
+
+
+def test_package_is_byte_identical_across_builds(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'handler.py').write_text('def handler(event, context):\n    return event\n')
+    (tmp_path / 'helper.py').write_text('VALUE = 1\n')
+
+    monkeypatch.setattr(lambda_basic, 'PACKAGE_CACHE_DIR', str(tmp_path / 'cache-1'))
+    first = lambda_basic.create_lambda_deployment_package('handler.py', 'helper.py')
+    # A fresh cache forces a rebuild; argument order doesn't matter
+    monkeypatch.setattr(lambda_basic, 'PACKAGE_CACHE_DIR', str(tmp_path / 'cache-2'))
+    os.utime(tmp_path / 'handler.py', (0, 0))
+    second = lambda_basic.create_lambda_deployment_package('helper.py', 'handler.py')
+
+    assert first == second
+    assert lambda_basic.package_code_sha256(first) == \
+        base64.b64encode(hashlib.sha256(second).digest()).decode('ascii')
+
+    (tmp_path / 'helper.py').write_text('VALUE = 2\n')
+    assert lambda_basic.create_lambda_deployment_package('handler.py', 'helper.py') != first
+
+
+def test_matching_code_sha256_skips_the_code_upload(stubbed_lambda):
+    client, stubber = stubbed_lambda
+    package = lambda_basic.create_deterministic_zip({'handler.py': b'def handler(e, c): pass\n'})
+    stubber.add_response('get_function', {'Configuration': _configuration(package)},
+                         {'FunctionName': 'upload-image-to-s3'})
+
+    assert lambda_basic.deploy_lambda_function(client, 'upload-image-to-s3', HANDLER, ROLE, package) == FUNCTION_ARN
+
+
+def test_changed_handler_and_role_are_updated_without_uploading_code(stubbed_lambda):
+    client, stubber = stubbed_lambda
+    package = lambda_basic.create_deterministic_zip({'handler.py': b'def handler(e, c): pass\n'})
+    stubber.add_response('get_function', {'Configuration': _configuration(
+        package, handler='old.handler', role='arn:aws:iam::000000000000:role/old-role')},
+        {'FunctionName': 'upload-image-to-s3'})
+    stubber.add_response('update_function_configuration', {},
+                         {'FunctionName': 'upload-image-to-s3', 'Handler': HANDLER, 'Role': ROLE.arn})
+    stubber.add_response('get_function_configuration', {'LastUpdateStatus': 'Successful'},
+                         {'FunctionName': 'upload-image-to-s3'})
+
+    lambda_basic.deploy_lambda_function(client, 'upload-image-to-s3', HANDLER, ROLE, package)
+
+
+def test_changed_code_is_uploaded(stubbed_lambda):
+    client, stubber = stubbed_lambda
+    old_package = lambda_basic.create_deterministic_zip({'handler.py': b'old\n'})
+    package = lambda_basic.create_deterministic_zip({'handler.py': b'new\n'})
+    stubber.add_response('get_function', {'Configuration': _configuration(old_package)},
+                         {'FunctionName': 'upload-image-to-s3'})
+    stubber.add_response('update_function_code', {},
+                         {'FunctionName': 'upload-image-to-s3', 'ZipFile': package, 'Publish': True})
+    stubber.add_response('get_function_configuration', {'LastUpdateStatus': 'Successful'},
+                         {'FunctionName': 'upload-image-to-s3'})
+
+    lambda_basic.deploy_lambda_function(client, 'upload-image-to-s3', HANDLER, ROLE, package)
+
+
+def test_requirements_file_attaches_the_dependency_layer(stubbed_lambda, tmp_path, monkeypatch):
+    import lambda_layers
+    from resource_cache import resource_cache
+
+    client, stubber = stubbed_lambda
+    requirements_file = tmp_path / 'requirements.txt'
+    requirements_file.write_text('# image handling\nPillow==10.3.0\n')
+    content_hash = lambda_layers.layer_content_hash(['Pillow==10.3.0'])
+    layer_arn = 'arn:aws:lambda:us-east-1:000000000000:layer:upload-image-to-s3-dependencies:1'
+    monkeypatch.setattr(lambda_layers, 'build_layer_package', lambda *args: b'layer-zip')
+    resource_cache.invalidate('layer')
+    package = lambda_basic.create_deterministic_zip({'handler.py': b'def handler(e, c): pass\n'})
+
+    stubber.add_response('list_layer_versions', {'LayerVersions': []},
+                         {'LayerName': 'upload-image-to-s3-dependencies'})
+    stubber.add_response('publish_layer_version', {'LayerVersionArn': layer_arn}, {
+        'LayerName': 'upload-image-to-s3-dependencies', 'Description': f'sha256:{content_hash}',
+        'Content': {'ZipFile': b'layer-zip'}, 'CompatibleRuntimes': [lambda_basic.LAMBDA_RUNTIME]})
+    stubber.add_client_error('get_function', 'ResourceNotFoundException',
+                             expected_params={'FunctionName': 'upload-image-to-s3'})
+    stubber.add_response('create_function', {'FunctionArn': FUNCTION_ARN}, {
+        'FunctionName': 'upload-image-to-s3', 'Runtime': lambda_basic.LAMBDA_RUNTIME, 'Role': ROLE.arn,
+        'Handler': HANDLER, 'Code': {'ZipFile': package}, 'Environment': {'Variables': {}},
+        'Layers': [layer_arn], 'Publish': True})
+
+    assert lambda_basic.deploy_lambda_function(client, 'upload-image-to-s3', HANDLER, ROLE, package,
+                                               requirements_file=str(requirements_file)) == FUNCTION_ARN
+    resource_cache.invalidate('layer')
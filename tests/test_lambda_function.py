@@ -56,3 +56,105 @@ def test_failure_handler_with_no_image_data():
    # Assert response and message
   assert 'Missing image data in body' in response_data["message"]
   assert response_data['statusCode'] == 400
+
+
+def _invoke_upload(headers, body=''):
+  response = awslambda.invoke(
+            FunctionName="upload-image-to-s3",
+            Payload=json.dumps({'headers': headers, 'body': body})
+        )
+  return json.loads(response['Payload'].read())
+
+def test_chunked_upload_with_image_data():
+
+  file = os.path.join(os.path.dirname(__file__), "nyan-cat.png")
+  with open(file, 'rb') as image_file:
+    image_data = image_file.read()
+
+  response_data = _invoke_upload({'x-upload-action': 'initiate', 'content-type': 'image/png',
+                                  'filename': 'test-integration-chunked'})
+  assert response_data['statusCode'] == 200
+  session = json.loads(response_data['body'])
+  assert session['key'] == 'test-integration-chunked.png'
+  session_headers = {'x-upload-id': session['uploadId'], 'x-upload-key': session['key']}
+
+  # A single part may be smaller than the 5 MiB S3 minimum
+  response_data = _invoke_upload({'x-upload-action': 'part', 'x-part-number': '1', **session_headers},
+                                 base64.b64encode(image_data).decode('utf-8'))
+  assert response_data['statusCode'] == 200
+  part = json.loads(response_data['body'])
+  assert part['partNumber'] == 1
+
+  response_data = _invoke_upload({'x-upload-action': 'complete', **session_headers},
+                                 json.dumps({'parts': [part]}))
+  assert response_data['statusCode'] == 200
+  assert '\"success\": true' in response_data["body"]
+
+  stored = s3.get_object(Bucket='localstack-poc-upload-images', Key=session['key'])
+  assert stored['Body'].read() == image_data
+
+def test_chunked_upload_abort_and_bad_requests():
+
+  response_data = _invoke_upload({'x-upload-action': 'initiate', 'content-type': 'image/png'})
+  session = json.loads(response_data['body'])
+  session_headers = {'x-upload-id': session['uploadId'], 'x-upload-key': session['key']}
+
+  response_data = _invoke_upload({'x-upload-action': 'part', 'x-part-number': '0', **session_headers}, 'AAAA')
+  assert response_data['statusCode'] == 400
+
+  response_data = _invoke_upload({'x-upload-action': 'complete', **session_headers}, '{}')
+  assert 'Missing parts list in body' in response_data["message"]
+
+  response_data = _invoke_upload({'x-upload-action': 'complete', **session_headers},
+                                 json.dumps({'parts': [{'partNumber': 1}]}))
+  assert response_data['statusCode'] == 400
+
+  response_data = _invoke_upload({'x-upload-action': 'initiate', 'content-type': 'text/html'})
+  assert response_data['statusCode'] == 400
+
+  response_data = _invoke_upload({'x-upload-action': 'abort', **session_headers})
+  assert response_data['statusCode'] == 200
+
+  # The session is gone once aborted
+  response_data = _invoke_upload({'x-upload-action': 'part', 'x-part-number': '1', **session_headers}, 'AAAA')
+  assert response_data['statusCode'] == 400
+
+def test_presigned_post_upload_request():
+
+  response_data = _invoke_upload({'x-upload-action': 'presign', 'content-type': 'image/png',
+                                  'filename': 'test-integration-presigned'})
+  assert response_data['statusCode'] == 200
+  upload = json.loads(response_data['body'])
+  assert upload['method'] == 'POST'
+  assert upload['key'].endswith('/test-integration-presigned.png')
+  assert upload['fields']['key'] == upload['key']
+  assert upload['fields']['Content-Type'] == 'image/png'
+  assert upload['fields']['x-amz-meta-upload-source'] == 'presigned'
+
+def test_presigned_put_upload_request_rejects_bad_conditions():
+
+  response_data = _invoke_upload({'x-upload-action': 'presign', 'x-upload-method': 'PUT',
+                                  'content-type': 'image/png', 'x-content-length': '1024'})
+  assert response_data['statusCode'] == 200
+  upload = json.loads(response_data['body'])
+  assert upload['headers'] == {'Content-Type': 'image/png', 'x-amz-meta-upload-source': 'presigned'}
+  assert upload['maxBytes'] == 1024
+
+  response_data = _invoke_upload({'x-upload-action': 'presign', 'content-type': 'text/html'})
+  assert response_data['statusCode'] == 400
+
+  response_data = _invoke_upload({'x-upload-action': 'presign', 'content-type': 'image/png',
+                                  'x-content-length': str(10 * 1024 * 1024 * 1024)})
+  assert response_data['statusCode'] == 400
+
+def test_upload_completion_hook_records_s3_events():
+
+  event = {'Records': [{'eventSource': 'aws:s3', 'eventName': 'ObjectCreated:Post',
+                        's3': {'bucket': {'name': 'localstack-poc-upload-images'},
+                               'object': {'key': 'test-integration-presigned.png', 'size': 1024}}}]}
+  response = awslambda.invoke(
+            FunctionName="upload-image-to-s3",
+            Payload=json.dumps(event)
+        )
+  response_data = json.loads(response['Payload'].read())
+  assert response_data == {'statusCode': 200, 'recorded': 1}
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import lambda_layers
+from resource_cache import resource_cache
+
+LAYER_ARN = 'arn:aws:lambda:us-east-1:000000000000:layer:deps'
+
+
+def test_content_hash_ignores_order_and_changes_with_versions():
+    first = lambda_layers.layer_content_hash(['requests==2.31.0', 'Pillow==10.3.0'])
+
+    assert first == lambda_layers.layer_content_hash(['Pillow==10.3.0', ' requests==2.31.0'])
+    assert first != lambda_layers.layer_content_hash(['requests==2.32.0', 'Pillow==10.3.0'])
+    assert first != lambda_layers.layer_content_hash(['requests==2.31.0', 'Pillow==10.3.0'],
+                                                     runtime='python3.12')
+
+
+@pytest.mark.parametrize('requirement', ['requests', 'requests>=2.20', 'requests==2.*', 'requests~=2.31'])
+def test_unpinned_requirements_are_rejected(requirement):
+    with pytest.raises(ValueError):
+        lambda_layers.layer_content_hash([requirement])
+
+
+def test_pinned_requirements_with_extras_markers_and_hashes_are_accepted():
+    lambda_layers.layer_content_hash([
+        'requests[socks]==2.31.0',
+        'tomli==2.0.1; python_version < "3.11"',
+        'idna==3.7 --hash=sha256:82fee1fc78add43492d3a1898bfa6d8a904cc97d8427f683ed8e798d07761aa0',
+    ])
+
+
+def test_existing_layer_version_is_reused(monkeypatch):
+    requirements = ['requests==2.31.0']
+    content_hash = lambda_layers.layer_content_hash(requirements)
+    client = boto3.client('lambda', region_name='us-east-1',
+                          aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(lambda_layers, 'build_layer_package',
+                        lambda *args: pytest.fail("an existing layer must not be rebuilt"))
+    resource_cache.invalidate('layer')
+
+    with Stubber(client) as stubber:
+        stubber.add_response('list_layer_versions', {'LayerVersions': [
+            {'LayerVersionArn': f'{LAYER_ARN}:2', 'Description': 'sha256:other'},
+            {'LayerVersionArn': f'{LAYER_ARN}:1', 'Description': f'sha256:{content_hash}'},
+        ]}, {'LayerName': 'deps'})
+
+        assert lambda_layers.get_or_publish_layer(client, 'deps', requirements) == f'{LAYER_ARN}:1'
+        # The second lookup is answered from the resource cache
+        assert lambda_layers.get_or_publish_layer(client, 'deps', requirements) == f'{LAYER_ARN}:1'
+        stubber.assert_no_pending_responses()
+    resource_cache.invalidate('layer')
+
+
+def test_layer_is_published_when_no_version_matches(monkeypatch):
+    requirements = ['requests==2.31.0']
+    content_hash = lambda_layers.layer_content_hash(requirements)
+    client = boto3.client('lambda', region_name='us-east-1',
+                          aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(lambda_layers, 'build_layer_package', lambda *args: b'zip')
+    resource_cache.invalidate('layer')
+
+    with Stubber(client) as stubber:
+        stubber.add_response('list_layer_versions', {'LayerVersions': []}, {'LayerName': 'deps'})
+        stubber.add_response('publish_layer_version', {'LayerVersionArn': f'{LAYER_ARN}:3'}, {
+            'LayerName': 'deps', 'Description': f'sha256:{content_hash}',
+            'Content': {'ZipFile': b'zip'}, 'CompatibleRuntimes': [lambda_layers.LAMBDA_RUNTIME]})
+
+        assert lambda_layers.get_or_publish_layer(client, 'deps', requirements) == f'{LAYER_ARN}:3'
+        stubber.assert_no_pending_responses()
+    resource_cache.invalidate('layer')
@@ -0,0 +1,113 @@
+import base64
+import io
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("botocore")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from lambda_load_generator import LambdaLoadGenerator, parse_report
+
+COLD_LOG = (
+    'START RequestId: 1f2e Version: $LATEST\n'
+    '[INFO]\t2024-05-01T10:00:00.000Z\t1f2e\t{"metric": "upload_image_to_s3.timing", '
+    '"cold_start": true, "handler_ms": 41.5, "status_code": 200}\n'
+    'END RequestId: 1f2e\n'
+    'REPORT RequestId: 1f2e\tDuration: 42.17 ms\tBilled Duration: 43 ms\tMemory Size: 128 MB\t'
+    'Max Memory Used: 71 MB\tInit Duration: 312.90 ms\t\n'
+)
+WARM_LOG = (
+    'START RequestId: 2a3b Version: $LATEST\n'
+    'END RequestId: 2a3b\n'
+    'REPORT RequestId: 2a3b\tDuration: 8.02 ms\tBilled Duration: 9 ms\tMemory Size: 128 MB\t'
+    'Max Memory Used: 72 MB\t\n'
+)
+
+
+class FakeLambda:
+    """Returns a cold start log for the first invocation and warm ones afterwards."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, Payload, LogType):
+        assert LogType == 'Tail'
+        with self.lock:
+            self.calls += 1
+            log = COLD_LOG if self.calls == 1 else WARM_LOG
+        return {
+            'StatusCode': 200,
+            'LogResult': base64.b64encode(log.encode('utf-8')).decode('ascii'),
+            'Payload': io.BytesIO(json.dumps({'statusCode': 200}).encode('utf-8')),
+        }
+
+
+def test_parse_report_reads_the_report_line():
+    report = parse_report(COLD_LOG)
+    assert report['duration_ms'] == 42.17
+    assert report['billed_ms'] == 43
+    assert report['memory_size_mb'] == 128
+    assert report['max_memory_mb'] == 71
+    assert report['init_ms'] == 312.9
+    assert report['cold_start'] is True
+    assert report['handler_ms'] == 41.5
+
+    warm = parse_report(WARM_LOG)
+    assert 'init_ms' not in warm
+    assert not warm.get('cold_start')
+
+
+def test_parse_report_falls_back_to_the_handler_metric_for_cold_starts():
+    log = COLD_LOG.replace('\tInit Duration: 312.90 ms', '')
+    report = parse_report(log)
+    assert 'init_ms' not in report
+    assert report['cold_start'] is True
+
+
+def test_load_generator_splits_cold_and_warm_starts():
+    generator = LambdaLoadGenerator(FakeLambda(), 'upload-image-to-s3', {'body': ''}, concurrency=4)
+    summary = generator.run(20).summary()
+
+    assert summary['invocations'] == 20
+    assert summary['errors'] == 0
+    assert summary['memory_size_mb'] == 128
+    assert summary['cold']['invocations'] == 1
+    assert summary['cold']['init_ms']['p50'] == 312.9
+    assert summary['warm']['invocations'] == 19
+    assert summary['warm']['duration_ms']['p95'] == 8.0
+    assert summary['warm']['init_ms'] is None
+    assert summary['warm']['max_memory_mb'] == 72
+
+
+class FailingLambda(FakeLambda):
+    """Answers with a 400 status, a function error or a non-AWS exception in turn."""
+
+    def invoke(self, FunctionName, Payload, LogType):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call % 3 == 0:
+            raise RuntimeError("connection reset")
+        response = {
+            'StatusCode': 200,
+            'LogResult': base64.b64encode(WARM_LOG.encode('utf-8')).decode('ascii'),
+            'Payload': io.BytesIO(json.dumps({'statusCode': 400}).encode('utf-8')),
+        }
+        if call % 3 == 2:
+            response['FunctionError'] = 'Unhandled'
+            response['Payload'] = io.BytesIO(b'{"errorMessage": "boom"}')
+        return response
+
+
+def test_error_statuses_and_unexpected_exceptions_are_counted():
+    generator = LambdaLoadGenerator(FailingLambda(), 'upload-image-to-s3', {'body': ''}, concurrency=4)
+    summary = generator.run(9).summary()
+
+    assert summary['invocations'] == 9
+    assert summary['errors'] == 9
+    assert summary['error_codes'] == {'HTTP 400': 3, 'Unhandled': 3, 'RuntimeError': 3}
+    assert summary['warm']['invocations'] == 0
@@ -0,0 +1,166 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import lambda_transform_json_to_csv as transform
+from kpl_aggregation import MAGIC, RecordAggregator, _length_delimited
+from record_schema import Schema, SchemaRegistry
+
+
+def _firehose_event(*payloads):
+    return {'records': [
+        {'recordId': f'record-{i}', 'data': base64.b64encode(payload).decode('ascii')}
+        for i, payload in enumerate(payloads)
+    ]}
+
+
+def _decoded(record):
+    return base64.b64decode(record['data']).decode('utf-8')
+
+
+def test_transform_echoes_record_ids_and_writes_csv():
+    event = _firehose_event(
+        json.dumps({"name": "Jane Doe", "city": "Springfield", "phone": "555-0100", "id": "a1"}).encode(),
+        json.dumps({"name": "Doe, John", "city": "Shelbyville", "phone": "555-0101", "id": "b2"}).encode(),
+    )
+
+    response = transform.handler(event, None)
+
+    assert [r['recordId'] for r in response['records']] == ['record-0', 'record-1']
+    assert all(r['result'] == 'Ok' for r in response['records'])
+    assert _decoded(response['records'][0]) == 'Jane Doe,Springfield,555-0100,a1\n'
+    assert _decoded(response['records'][1]) == '"Doe, John",Shelbyville,555-0101,b2\n'
+
+
+def test_warm_invocations_do_not_accumulate_records():
+    event = _firehose_event(json.dumps({"name": "Jane Doe", "city": "Springfield", "id": "a1"}).encode())
+
+    transform.handler(event, None)
+    response = transform.handler(event, None)
+
+    assert len(response['records']) == 1
+
+
+def test_aggregated_record_yields_one_row_per_user_record():
+    aggregator = RecordAggregator()
+    for i in range(3):
+        aggregator.add(json.dumps({"name": f"user-{i}", "city": "Springfield", "id": str(i)}), f"key-{i}")
+    aggregated, _, _ = aggregator.flush()
+
+    response = transform.handler(_firehose_event(aggregated), None)
+
+    assert _decoded(response['records'][0]) == (
+        'user-0,Springfield,,0\nuser-1,Springfield,,1\nuser-2,Springfield,,2\n')
+
+
+def test_bad_records_fail_individually_and_empty_records_are_dropped():
+    good = json.dumps({"name": "Jane Doe", "city": "Springfield", "phone": "555-0100", "id": "a1"}).encode()
+    event = _firehose_event(good, b'{"name": "truncated', b'', b'[1, 2]', good)
+
+    response = transform.handler(event, None)
+
+    results = [r['result'] for r in response['records']]
+    assert results == ['Ok', 'ProcessingFailed', 'Dropped', 'ProcessingFailed', 'Ok']
+    assert response['records'][1]['data'] == event['records'][1]['data']
+    assert _decoded(response['records'][4]) == 'Jane Doe,Springfield,555-0100,a1\n'
+
+
+def test_json_output_mode_emits_json_lines_for_parquet_conversion(monkeypatch):
+    monkeypatch.setenv('TRANSFORM_OUTPUT_FORMAT', 'json')
+    event = _firehose_event(json.dumps({"id": "a1", "name": "Jane Doe", "extra": 1}).encode())
+
+    response = transform.handler(event, None)
+
+    assert _decoded(response['records'][0]) == (
+        '{"name":"Jane Doe","city":null,"phone":null,"id":"a1"}\n')
+
+
+def test_columns_follow_schema_order_not_producer_key_order():
+    event = _firehose_event(
+        json.dumps({"id": "a1", "phone": "555-0100", "city": "Springfield", "name": "Jane Doe"}).encode(),
+        json.dumps({"name": "Jane Doe", "unknown": "x", "id": "a1", "city": "Springfield", "phone": "555-0100"}).encode(),
+    )
+
+    response = transform.handler(event, None)
+
+    assert _decoded(response['records'][0]) == 'Jane Doe,Springfield,555-0100,a1\n'
+    assert _decoded(response['records'][1]) == 'Jane Doe,Springfield,555-0100,a1\n'
+
+
+def test_registry_compiles_typed_encoder_once_per_schema_version():
+    registry = SchemaRegistry(max_cached_encoders=1)
+    registry.register(Schema('reading', 1, [('sensor', 'string'), ('value', 'float')]))
+    registry.register(Schema('reading', 2, [('sensor', 'string'), ('value', 'float'), ('count', 'int')]))
+
+    latest = registry.encoder('reading')
+    assert registry.encoder('reading', 2) is latest
+    assert latest.encode_csv({'count': '3', 'value': 1, 'sensor': 'a"b'}) == '"a""b",1.0,3\n'
+    assert registry.encoder('reading', 1).encode_csv({'sensor': 'a', 'value': '2.5'}) == 'a,2.5\n'
+    # The LRU only holds one encoder, so version 2 is compiled again
+    assert registry.encoder('reading', 2) is not latest
+
+
+def test_unknown_schema_version_fails_only_that_record():
+    event = _firehose_event(
+        json.dumps({"name": "Jane Doe", "schema_version": 99}).encode(),
+        json.dumps({"name": "Jane Doe", "schema_version": 1}).encode(),
+    )
+
+    response = transform.handler(event, None)
+
+    assert [r['result'] for r in response['records']] == ['ProcessingFailed', 'Ok']
+
+
+def test_record_can_name_another_registered_schema():
+    event = _firehose_event(
+        json.dumps({"schema": "benchmark_record", "id": "r-7", "seq": 7, "produced_at": 1.5}).encode(),
+        json.dumps({"schema": "no_such_schema", "id": "r-8"}).encode(),
+    )
+
+    response = transform.handler(event, None)
+
+    assert _decoded(response['records'][0]) == ',,,r-7,7,1.5\n'
+    assert response['records'][1]['result'] == 'ProcessingFailed'
+
+
+def test_partition_keys_are_returned_for_dynamic_partitioning(monkeypatch):
+    monkeypatch.setenv('TRANSFORM_PARTITION_KEYS', 'city')
+    event = _firehose_event(
+        json.dumps({"name": "Jane Doe", "city": "Springfield", "id": "a1"}).encode(),
+        json.dumps({"name": "John Doe", "id": "a2"}).encode(),
+    )
+
+    response = transform.handler(event, None)
+
+    assert response['records'][0]['metadata'] == {'partitionKeys': {'city': 'Springfield'}}
+    assert response['records'][1]['metadata'] == {'partitionKeys': {'city': 'unknown'}}
+
+
+def test_aggregate_mixing_partition_values_fails_instead_of_misrouting(monkeypatch):
+    monkeypatch.setenv('TRANSFORM_PARTITION_KEYS', 'city')
+    same_city, mixed = RecordAggregator(), RecordAggregator()
+    for city in ('Springfield', 'Springfield'):
+        same_city.add(json.dumps({"name": "Jane Doe", "city": city}).encode(), city)
+    for city in ('Springfield', 'Shelbyville'):
+        mixed.add(json.dumps({"name": "Jane Doe", "city": city}).encode(), city)
+    event = _firehose_event(same_city.flush()[0], mixed.flush()[0])
+
+    response = transform.handler(event, None)
+
+    assert response['records'][0]['result'] == 'Ok'
+    assert response['records'][0]['metadata'] == {'partitionKeys': {'city': 'Springfield'}}
+    assert response['records'][1]['result'] == 'ProcessingFailed'
+
+
+def test_forged_aggregate_fails_only_that_record():
+    # Valid digest, but the only record points at partition key 5 of 1
+    message = _length_delimited(1, b'key') + _length_delimited(3, b'\x08\x05' + _length_delimited(3, b'{}'))
+    forged = MAGIC + message + hashlib.md5(message).digest()
+    good = json.dumps({"name": "Jane Doe", "city": "Springfield", "id": "a1"}).encode()
+
+    response = transform.handler(_firehose_event(forged, good), None)
+
+    assert [r['result'] for r in response['records']] == ['ProcessingFailed', 'Ok']
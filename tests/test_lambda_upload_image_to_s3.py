@@ -0,0 +1,173 @@
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("boto3")
+from botocore.exceptions import ClientError
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import lambda_upload_image_to_s3 as upload
+
+BUCKET = 'localstack-poc-upload-images'
+
+
+class FakeS3:
+    """Records the calls the handler makes instead of talking to S3."""
+
+    def __init__(self):
+        self.metadata = {}
+        self.created = []
+        self.completed = []
+        self.deleted = []
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        self.created.append((Key, ContentType))
+        return {'UploadId': 'upload-1'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed.append(MultipartUpload['Parts'])
+        return {}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.metadata:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'Metadata': self.metadata[Key]}
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}/{Params['Key']}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields, Conditions, ExpiresIn):
+        return {'url': f'https://{Bucket}', 'fields': {'key': Key, **Fields}}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload, 's3', fake)
+    monkeypatch.setattr(upload, '_lazy_init_ms', 0.0)
+    monkeypatch.setenv('BUCKET_NAME', BUCKET)
+    monkeypatch.setenv('UPLOAD_TOKEN', 'secret-token')
+    return fake
+
+
+SESSION = {'x-upload-id': 'upload-1', 'x-upload-key': 'image.png'}
+
+
+def _complete(body):
+    return upload.handler({'headers': {'x-upload-action': 'complete', **SESSION}, 'body': body}, None)
+
+
+def test_initiate_rejects_content_types_that_are_not_images(s3):
+    response = upload.handler({'headers': {'x-upload-action': 'initiate', 'content-type': 'text/html'}}, None)
+
+    assert response['statusCode'] == 400
+    assert s3.created == []
+
+    response = upload.handler({'headers': {'x-upload-action': 'initiate', 'content-type': 'image/jpeg',
+                                           'filename': 'image'}}, None)
+    assert json.loads(response['body']) == {'uploadId': 'upload-1', 'key': 'image.jpeg'}
+
+
+def test_complete_sorts_parts_by_number(s3):
+    response = _complete(json.dumps({'parts': [{'partNumber': '2', 'etag': '"b"'},
+                                               {'partNumber': 1, 'etag': '"a"'}]}))
+
+    assert response['statusCode'] == 200
+    assert s3.completed == [[{'PartNumber': 1, 'ETag': '"a"'}, {'PartNumber': 2, 'ETag': '"b"'}]]
+
+
+@pytest.mark.parametrize('body', [
+    '{}',
+    'not json',
+    '[{"partNumber": 1, "etag": "a"}]',
+    '{"parts": {"partNumber": 1, "etag": "a"}}',
+    '{"parts": ["a"]}',
+    '{"parts": [{"partNumber": 1}]}',
+    '{"parts": [{"etag": "a"}]}',
+    '{"parts": [{"partNumber": "one", "etag": "a"}]}',
+    '{"parts": [{"partNumber": 10001, "etag": "a"}]}',
+])
+def test_malformed_parts_are_a_bad_request(s3, body):
+    response = _complete(body)
+
+    assert response['statusCode'] == 400
+    assert s3.completed == []
+
+
+def _created(event_name, key, size=upload.MAX_UPLOAD_BYTES + 1):
+    return {'eventSource': 'aws:s3', 'eventName': event_name,
+            's3': {'bucket': {'name': BUCKET}, 'object': {'key': key, 'size': size}}}
+
+
+def test_oversized_presigned_uploads_are_deleted(s3):
+    s3.metadata = {'post.png': dict(upload.PRESIGNED_METADATA), 'put.png': dict(upload.PRESIGNED_METADATA),
+                   'small.png': dict(upload.PRESIGNED_METADATA)}
+
+    response = upload.handler({'Records': [_created('ObjectCreated:Post', 'post.png'),
+                                           _created('ObjectCreated:Put', 'put.png'),
+                                           _created('ObjectCreated:Put', 'small.png', size=1024)]}, None)
+
+    assert response == {'statusCode': 200, 'recorded': 3}
+    assert s3.deleted == ['post.png', 'put.png']
+
+
+def test_oversized_objects_the_function_wrote_itself_are_kept(s3):
+    s3.metadata = {'chunked.png': {}, 'direct.png': {}}
+
+    response = upload.handler({'Records': [_created('ObjectCreated:CompleteMultipartUpload', 'chunked.png'),
+                                           _created('ObjectCreated:Put', 'direct.png'),
+                                           _created('ObjectCreated:Put', 'gone.png')]}, None)
+
+    assert response == {'statusCode': 200, 'recorded': 3}
+    assert s3.deleted == []
+
+
+def test_records_of_other_buckets_are_ignored(s3):
+    record = _created('ObjectCreated:Post', 'post.png')
+    record['s3']['bucket']['name'] = 'someone-elses-bucket'
+    s3.metadata = {'post.png': dict(upload.PRESIGNED_METADATA)}
+
+    response = upload.handler({'Records': [record]}, None)
+
+    assert response == {'statusCode': 200, 'recorded': 0}
+    assert s3.deleted == []
+
+
+def _presign(headers, request_context=None):
+    event = {'headers': {'x-upload-action': 'presign', 'content-type': 'image/png', 'filename': 'image',
+                         **headers}}
+    if request_context is not None:
+        event['requestContext'] = request_context
+    return upload.handler(event, None)
+
+
+@pytest.mark.parametrize('headers', [{}, {'authorization': 'Bearer wrong-token'}])
+def test_function_url_presign_needs_the_upload_token(s3, headers):
+    assert _presign(headers, {'http': {'method': 'POST'}})['statusCode'] == 401
+
+
+def test_function_url_presign_fails_closed_without_a_token(s3, monkeypatch):
+    monkeypatch.setattr(upload, 'get_upload_token', lambda: None)
+
+    assert _presign({'authorization': 'Bearer '}, {'http': {'method': 'POST'}})['statusCode'] == 401
+
+
+@pytest.mark.parametrize('headers, request_context', [
+    ({'authorization': 'Bearer secret-token'}, {'http': {'method': 'POST'}}),
+    ({}, {'authorizer': {'iam': {'userArn': 'arn:aws:iam::000000000000:user/uploader'}}}),
+    ({}, None),
+])
+def test_authorized_presign_signs_a_generated_key(s3, headers, request_context):
+    response = _presign(headers, request_context)
+
+    assert response['statusCode'] == 200
+    first = json.loads(response['body'])
+    second = json.loads(_presign(headers, request_context)['body'])
+    folder, file_name = first['key'].split('/')
+    assert len(folder) == 32 and file_name == 'image.png'
+    assert first['fields']['key'] == first['key']
+    assert second['key'] != first['key']
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from firehose_emulator import FirehoseEmulator, LocalS3
+from pipeline_benchmark import DeliveryTracker, run_benchmark
+
+
+def test_benchmark_reports_every_record_delivered_through_the_emulator():
+    s3 = LocalS3()
+    emulator = FirehoseEmulator(s3_client=s3, buffer_interval_seconds=0.05, s3_buffer_interval_seconds=0.05)
+
+    def put_records(payloads):
+        emulator.put_record_batch(Records=[{'Data': payload} for payload in payloads])
+
+    result = run_benchmark(put_records, lambda: None, s3, 'local-firehose', 250,
+                           batch_size=100, timeout=5, poll_interval=0.02)
+    emulator.close()
+
+    assert result['records_delivered'] == 250
+    assert result['records_lost'] == 0
+    assert result['records_duplicated'] == 0
+    assert result['bytes_written'] > 0
+    assert 0 < result['latency_ms_p50'] <= result['latency_ms_p99']
+
+
+def test_tracker_counts_duplicates_and_ignores_other_runs_and_old_objects():
+    s3 = LocalS3()
+    s3.put_object(Bucket='b', Key='old', Body='Jane,X,1,run-0,0,1.0\n')
+    tracker = DeliveryTracker(s3, 'b', 'run')
+    s3.put_object(Bucket='b', Key='new-1', Body='Jane,X,1,run-0,0,1.0\nJane,X,1,other-1,1,1.0\n')
+    s3.put_object(Bucket='b', Key='new-2', Body='Jane,X,1,run-0,0,1.0\n')
+
+    assert tracker.poll() == 1
+    assert sorted(tracker.latencies) == [0]
+    assert tracker.duplicates == 1
+    assert tracker.objects == 2
@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from provisioner import Provisioner, ProvisioningError
+
+
+def test_independent_nodes_run_concurrently_and_dependents_get_results():
+    provisioner = Provisioner()
+    barrier = threading.Barrier(3, timeout=2)
+
+    def independent(value):
+        def create(results):
+            barrier.wait()
+            return value
+        return create
+
+    provisioner.add('bucket', independent('bucket-arn'))
+    provisioner.add('stream', independent('stream-arn'))
+    provisioner.add('role', independent('role-arn'))
+    provisioner.add('firehose', lambda results: dict(results), depends_on=['bucket', 'stream', 'role'])
+
+    results = provisioner.run()
+
+    assert results['firehose'] == {'bucket': 'bucket-arn', 'stream': 'stream-arn', 'role': 'role-arn'}
+
+
+def test_failure_skips_dependents_but_runs_independent_nodes():
+    provisioner = Provisioner()
+    provisioner.add('role', lambda results: 1 / 0)
+    provisioner.add('function', lambda results: 'fn', depends_on=['role'])
+    provisioner.add('bucket', lambda results: 'bucket')
+
+    with pytest.raises(ProvisioningError) as error:
+        provisioner.run()
+
+    assert error.value.failed == {'role'}
+    assert error.value.skipped == {'function'}
+    assert provisioner.results == {'bucket': 'bucket'}
+
+
+def test_cycles_are_rejected():
+    provisioner = Provisioner()
+    provisioner.add('a', lambda results: None, depends_on=['b'])
+    provisioner.add('b', lambda results: None, depends_on=['a'])
+
+    with pytest.raises(ValueError):
+        provisioner.run()
+
+
+def test_critical_path_follows_the_slowest_chain():
+    provisioner = Provisioner()
+    provisioner.add('fast', lambda results: None)
+    provisioner.add('slow', lambda results: time.sleep(0.05))
+    provisioner.add('last', lambda results: None, depends_on=['fast', 'slow'])
+
+    provisioner.run()
+
+    assert provisioner.critical_path() == ['slow', 'last']
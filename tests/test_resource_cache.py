@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from resource_cache import ResourceStateCache
+
+
+def test_fields_merge_and_lookups_are_counted():
+    cache = ResourceStateCache()
+    cache.put('kinesis', 'stream', arn='arn:stream')
+    cache.put('kinesis', 'stream', status='ACTIVE')
+
+    assert cache.get('kinesis', 'stream') == {'arn': 'arn:stream', 'status': 'ACTIVE'}
+    assert cache.get('kinesis', 'stream', 'arn') == 'arn:stream'
+    assert cache.get('kinesis', 'other', 'arn') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_invalidate_by_resource_kind_or_everything():
+    cache = ResourceStateCache()
+    cache.put('kinesis', 'a', arn='1')
+    cache.put('kinesis', 'b', arn='2')
+    cache.put('iam_role', 'role', arn='3')
+
+    cache.invalidate('kinesis', 'a')
+    assert cache.get('kinesis', 'a') is None
+    cache.invalidate('kinesis')
+    assert cache.get('kinesis', 'b') is None
+    assert cache.get('iam_role', 'role', 'arn') == '3'
+    cache.invalidate()
+    assert cache.get('iam_role', 'role') is None
@@ -0,0 +1,71 @@
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("boto3")
+from botocore.exceptions import ClientError
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import s3_basic
+from resource_cache import resource_cache
+from waiters import WaiterError
+
+
+class FakeS3Resource:
+    def __init__(self):
+        self.buckets = types.SimpleNamespace(all=lambda: [])
+
+    def Bucket(self, name):
+        return types.SimpleNamespace(name=name, delete=lambda: None)
+
+    def create_bucket(self, Bucket):
+        return self.Bucket(Bucket)
+
+
+@pytest.fixture(autouse=True)
+def fake_s3(monkeypatch):
+    monkeypatch.setattr(s3_basic, 's3', FakeS3Resource())
+    resource_cache.invalidate('s3')
+    yield
+    resource_cache.invalidate('s3')
+
+
+def test_bucket_is_cached_once_the_wait_succeeds(monkeypatch):
+    monkeypatch.setattr(s3_basic, 'wait_for_bucket', lambda name, exists=True: True)
+
+    s3_basic.create_and_delete_my_bucket('images', keep_bucket=True)
+
+    assert resource_cache.get('s3', 'images', 'exists') is True
+    assert resource_cache.get('s3', '*', 'buckets') == ['images']
+
+
+def test_failed_create_wait_raises_and_is_not_cached(monkeypatch):
+    monkeypatch.setattr(s3_basic, 'wait_for_bucket', lambda name, exists=True: False)
+
+    with pytest.raises(WaiterError):
+        s3_basic.create_and_delete_my_bucket('images', keep_bucket=True)
+
+    assert resource_cache.get('s3', 'images') is None
+
+
+def test_failed_create_raises(monkeypatch):
+    def create_bucket(Bucket):
+        raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'CreateBucket')
+    monkeypatch.setattr(s3_basic.s3, 'create_bucket', create_bucket)
+    monkeypatch.setattr(s3_basic, 'wait_for_bucket', lambda name, exists=True: pytest.fail("must not wait"))
+
+    with pytest.raises(ClientError):
+        s3_basic.create_and_delete_my_bucket('images', keep_bucket=True)
+
+
+def test_failed_delete_wait_raises_and_keeps_no_stale_state(monkeypatch):
+    resource_cache.put('s3', 'images', exists=True)
+    resource_cache.put('s3', '*', buckets=['images'])
+    monkeypatch.setattr(s3_basic, 'wait_for_bucket', lambda name, exists=True: False)
+
+    with pytest.raises(WaiterError):
+        s3_basic.delete_bucket(s3_basic.s3.Bucket('images'))
+
+    assert resource_cache.get('s3', 'images') is None
+    assert resource_cache.get('s3', '*') is None
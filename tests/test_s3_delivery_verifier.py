@@ -0,0 +1,43 @@
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from firehose_emulator import LocalS3
+from s3_delivery_verifier import S3DeliveryVerifier
+
+
+def _csv(*ids):
+    return ''.join(f'Jane Doe,"Port, Jennifer",555-0100,{record_id}\n' for record_id in ids).encode('utf-8')
+
+
+def test_missing_duplicate_and_unexpected_ids_are_reported():
+    s3 = LocalS3()
+    s3.put_object(Bucket='b', Key='2026/01/01/00/a', Body=_csv('1', '2'))
+    s3.put_object(Bucket='b', Key='2026/01/01/00/b.gz', Body=gzip.compress(_csv('2', '3', '9')))
+    s3.put_object(Bucket='b', Key='processing-failed/2026/x', Body=b'{"rawData": "..."}\n')
+
+    result = S3DeliveryVerifier(s3, 'b', max_workers=2).verify({'1', '2', '3', '4'})
+
+    summary = result.summary()
+    assert summary['objects'] == 2
+    assert summary['rows'] == 5
+    assert summary['missing_sample'] == ['4']
+    assert summary['duplicates'] == 1
+    assert summary['unexpected_ids'] == 1
+    assert not result.ok
+
+
+def test_many_objects_are_verified_with_a_bounded_pool():
+    s3 = LocalS3()
+    for n in range(2500):
+        s3.put_object(Bucket='b', Key=f'objects/{n:05d}', Body=_csv(str(2 * n), str(2 * n + 1)))
+    s3.put_object(Bucket='b', Key='objects/bad', Body=b'only,three,columns\n')
+
+    result = S3DeliveryVerifier(s3, 'b', prefix='objects/', max_workers=4).verify(
+        {str(n) for n in range(5000)})
+
+    assert result.ok
+    assert result.objects == 2501
+    assert result.malformed_rows == 1
+    assert result.summary()['rows_per_sec'] > 0
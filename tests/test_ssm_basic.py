@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import ssm_basic
+
+
+@pytest.fixture
+def stubbed_ssm(monkeypatch):
+    client = boto3.client('ssm', region_name='us-east-1',
+                          aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(ssm_basic, 'ssm_client', client)
+    ssm_basic.invalidate_cache()
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+    ssm_basic.invalidate_cache()
+
+
+def _parameters(names, suffix=''):
+    return [{'Name': name, 'Value': f'value-of-{name}{suffix}', 'Type': 'String'} for name in names]
+
+
+def test_get_parameters_batches_ten_names_per_call(stubbed_ssm):
+    names = [f'/app/p{n}' for n in range(23)]
+    for start in (0, 10, 20):
+        batch = names[start:start + 10]
+        stubbed_ssm.add_response('get_parameters', {'Parameters': _parameters(batch)},
+                                 {'Names': batch, 'WithDecryption': True})
+
+    values = ssm_basic.get_parameters(names)
+
+    assert values == {name: f'value-of-{name}' for name in names}
+
+
+def test_get_parameters_only_fetches_cache_misses_and_skips_invalid_names(stubbed_ssm):
+    stubbed_ssm.add_response('get_parameters', {'Parameters': _parameters(['/app/a'])},
+                             {'Names': ['/app/a'], 'WithDecryption': True})
+    stubbed_ssm.add_response('get_parameters',
+                             {'Parameters': _parameters(['/app/b']), 'InvalidParameters': ['/app/missing']},
+                             {'Names': ['/app/b', '/app/missing'], 'WithDecryption': True})
+
+    assert ssm_basic.get_parameter('/app/a') == 'value-of-/app/a'
+    values = ssm_basic.get_parameters(['/app/a', '/app/b', '/app/missing'])
+
+    assert values == {'/app/a': 'value-of-/app/a', '/app/b': 'value-of-/app/b'}
+
+
+def test_cache_is_keyed_by_with_decryption(stubbed_ssm):
+    stubbed_ssm.add_response('get_parameters', {'Parameters': _parameters(['/app/secret'], '-ciphertext')},
+                             {'Names': ['/app/secret'], 'WithDecryption': False})
+    stubbed_ssm.add_response('get_parameters', {'Parameters': _parameters(['/app/secret'])},
+                             {'Names': ['/app/secret'], 'WithDecryption': True})
+
+    assert ssm_basic.get_parameter('/app/secret', with_decryption=False) == 'value-of-/app/secret-ciphertext'
+    assert ssm_basic.get_parameter('/app/secret', with_decryption=True) == 'value-of-/app/secret'
+    # Both are now served from the cache
+    assert ssm_basic.get_parameter('/app/secret', with_decryption=False) == 'value-of-/app/secret-ciphertext'
+    assert ssm_basic.get_parameter('/app/secret') == 'value-of-/app/secret'
+
+
+def test_get_parameters_by_path_follows_pagination_and_caches(stubbed_ssm):
+    expected = {'Path': '/app/', 'Recursive': True, 'WithDecryption': True}
+    stubbed_ssm.add_response('get_parameters_by_path',
+                             {'Parameters': _parameters(['/app/a', '/app/b']), 'NextToken': 'page-2'}, expected)
+    stubbed_ssm.add_response('get_parameters_by_path', {'Parameters': _parameters(['/app/c'])},
+                             {**expected, 'NextToken': 'page-2'})
+
+    values = ssm_basic.get_parameters_by_path('/app/')
+
+    assert values == {name: f'value-of-{name}' for name in ('/app/a', '/app/b', '/app/c')}
+    # The path and its parameters are served from the cache without more calls
+    assert ssm_basic.get_parameters_by_path('/app/') == values
+    assert ssm_basic.get_parameter('/app/c') == 'value-of-/app/c'
+
+
+def test_put_parameter_invalidates_the_cached_value(stubbed_ssm):
+    stubbed_ssm.add_response('get_parameters', {'Parameters': _parameters(['/app/a'])},
+                             {'Names': ['/app/a'], 'WithDecryption': True})
+    stubbed_ssm.add_response('put_parameter', {'Version': 2},
+                             {'Name': '/app/a', 'Value': 'new', 'Type': 'String', 'Overwrite': True})
+    stubbed_ssm.add_response('get_parameters',
+                             {'Parameters': [{'Name': '/app/a', 'Value': 'new', 'Type': 'String'}]},
+                             {'Names': ['/app/a'], 'WithDecryption': True})
+
+    assert ssm_basic.get_parameter('/app/a') == 'value-of-/app/a'
+    assert ssm_basic.put_parameter('/app/a', 'new', 'String', overwrite=True) == 2
+    assert ssm_basic.get_parameter('/app/a') == 'new'
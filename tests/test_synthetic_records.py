@@ -0,0 +1,55 @@
+import base64
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+import lambda_transform_json_to_csv as transform
+from record_schema import Schema
+from synthetic_records import SyntheticRecordGenerator
+
+
+def test_same_seed_gives_the_same_records():
+    first = SyntheticRecordGenerator(seed=7, use_faker=False).batch(500)
+    second = SyntheticRecordGenerator(seed=7, use_faker=False).batch(500)
+    other = SyntheticRecordGenerator(seed=8, use_faker=False).batch(500)
+
+    assert first == second
+    assert first != other
+
+
+def test_records_are_json_with_unique_ids_across_batches():
+    generator = SyntheticRecordGenerator(use_faker=False)
+    records = [json.loads(r) for r in generator.records(2500, batch_size=1000)]
+
+    assert len(records) == 2500
+    assert len({r['id'] for r in records}) == 2500
+    assert set(records[0]) == {'schema', 'schema_version', 'name', 'city', 'phone', 'id'}
+
+
+def test_records_are_padded_to_the_requested_size():
+    records = SyntheticRecordGenerator(record_bytes=512, use_faker=False).batch(100)
+
+    assert {len(r) for r in records} == {512}
+    assert all(json.loads(r)['pad'] for r in records)
+
+
+def test_custom_schema_types_are_generated():
+    schema = Schema('reading', 3, [('sensor', 'string'), ('value', 'float'), ('count', 'int'), ('ok', 'bool')])
+    record = json.loads(SyntheticRecordGenerator(schema, use_faker=False).batch(1)[0])
+
+    assert record['schema'] == 'reading' and record['schema_version'] == 3
+    assert isinstance(record['value'], float)
+    assert isinstance(record['count'], int)
+    assert isinstance(record['ok'], bool)
+
+
+def test_generated_records_pass_through_the_transform():
+    records = SyntheticRecordGenerator(record_bytes=300, use_faker=False).batch(50)
+    event = {'records': [{'recordId': str(i), 'data': base64.b64encode(r).decode('ascii')}
+                         for i, r in enumerate(records)]}
+
+    response = transform.handler(event, None)
+
+    assert {r['result'] for r in response['records']} == {'Ok'}
+    assert base64.b64decode(response['records'][0]['data']).decode('utf-8').count(',') >= 3
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_value_is_loaded_once_until_it_expires():
+    clock = FakeClock()
+    cache = TTLCache(10, clock=clock)
+    loads = []
+
+    def loader():
+        loads.append(clock.now)
+        return f"value-{len(loads)}"
+
+    assert cache.get('bucket', loader) == 'value-1'
+    clock.now = 9
+    assert cache.get('bucket', loader) == 'value-1'
+    clock.now = 10
+    assert cache.get('bucket', loader) == 'value-2'
+    assert loads == [0, 10]
+
+
+def test_failed_refresh_serves_stale_value_and_first_load_raises():
+    clock = FakeClock()
+    cache = TTLCache(10, clock=clock)
+    cache.set('bucket', 'cached')
+    clock.now = 11
+
+    def failing_loader():
+        raise RuntimeError("SSM timed out")
+
+    assert cache.get('bucket', failing_loader) == 'cached'
+    with pytest.raises(RuntimeError):
+        cache.get('other', failing_loader)
+
+
+def test_invalidate_forces_reload():
+    cache = TTLCache(60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    cache.invalidate('a')
+    assert cache.peek('a') is None
+    assert cache.peek('b') == 2
+    cache.invalidate()
+    assert cache.peek('b') is None
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambdas"))
+from waiters import WaiterError, WaiterTimeout, status_check, wait_all, wait_until
+
+
+def _statuses(*statuses):
+    remaining = list(statuses)
+    return lambda: remaining.pop(0) if len(remaining) > 1 else remaining[0]
+
+
+def test_resource_ready_in_milliseconds_is_picked_up_quickly():
+    check = status_check(_statuses('CREATING', 'CREATING', 'ACTIVE'))
+
+    started = time.monotonic()
+    wait_until(check, timeout=5)
+
+    assert time.monotonic() - started < 1
+
+
+def test_stuck_resource_fails_at_the_deadline():
+    with pytest.raises(WaiterTimeout):
+        wait_until(lambda: False, timeout=0.2, max_delay=0.05)
+
+
+def test_terminal_status_fails_immediately():
+    with pytest.raises(WaiterError):
+        wait_until(status_check(_statuses('DELETING')), timeout=5)
+
+
+def test_wait_all_shares_one_deadline():
+    results = wait_all({
+        'stream': status_check(_statuses('CREATING', 'ACTIVE')),
+        'stuck': lambda: False,
+    }, timeout=0.3, max_delay=0.05)
+
+    assert results['stream'] is True
+    assert isinstance(results['stuck'], WaiterTimeout)